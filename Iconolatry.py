@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from struct import unpack_from, pack, calcsize
-from PIL import Image, ImageCms
-from tempfile import mkstemp
-from os.path import isfile, splitext, abspath, isdir, join, basename
-from os import listdir
-from io import BytesIO
+from struct import Struct, unpack_from, error as struct_error
+from PIL import Image
+from os.path import isfile, splitext, abspath, isdir, join, basename, dirname
+from os import listdir, scandir, stat, replace, cpu_count, remove
+from fnmatch import fnmatch
+from io import BytesIO, StringIO
 import sys
-import argparse
-from functools import partial
+from functools import partial, lru_cache
 from itertools import chain
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
+from math import floor, ceil
+from time import time, perf_counter
+from threading import Lock
+from hashlib import sha1
+import json
+## Note: heavy modules (`PIL.ImageCms`, `argparse`, `concurrent.futures`, `http.server`, ...)
+## are imported on first use, to keep startup fast.
 
 __version__     = "2.0"
 __license__     = "MIT License"
@@ -24,8 +33,20 @@ __summary__     = "Advanced Icon Converter"
 ##|_________|
 ##
 
-is_cli = False
-working_path = abspath('.')
+palettes_path = join(dirname(abspath(__file__)), 'palettes')
+
+## Headers are little-endian, whatever the host byte order.
+## (2bytes)idReserved - (2bytes)idType - (2bytes)idCount.
+ICONDIR = Struct('<3H')
+## (1byte)bWidth - (1byte)bHeight - (1byte)bColorCount - (1byte)bReserved -
+## - (2bytes)wPlanes (wXHotSpot) - (2bytes)wBitCount (wYHotSpot) - (4bytes)dwBytesInRes - (4bytes)dwImageOffset.
+ICONDIRENTRY = Struct('<4B2H2L')
+## (4bytes)biSize - (4bytes)biWidth - (4bytes)biHeight - (2bytes)biPlanes - (2bytes)biBitCount -
+## - (4bytes)biCompression - (4bytes)biSizeImage -
+## - (4bytes)biXPelsPerMeter - (4bytes)biYPelsPerMeter - (4bytes)biClrUsed - (4bytes)biClrImportant.
+BITMAPINFOHEADER = Struct('<3L2H2L2l2L')
+## (4bytes)width - (4bytes)height of PNG IHDR chunk, after signature and chunk header.
+IHDR_SIZE = Struct('>2L')
 
 def calc_rowsize(bits, width):
         """ Computes number of bytes per row in a image (stride). """
@@ -36,13 +57,72 @@ def calc_masksize(width):
         """ Computes number of bytes for AND mask. """
         return int((width + 32 - width % 32 if (width % 32) > 0 else width) / 8)
 
-def print_err(msg, view = True, toexit = True):
+@lru_cache(maxsize = None)
+def palette_gpl(file):
+        """ Gets values from `.gpl` file. """
+        palette = []
+        with open(file, 'r') as fd:
+                for line in fd.readlines():
+                        if not line.lower().startswith(("gimp", "name", "columns", "#")):
+                                for pal in line.strip().split()[0:3]:
+                                        palette.append(int(pal))
+        return palette
+
+def palette_path(value):
+        """ Resolves a `.gpl` file path or the name of a shipped palette (e.g. 'P4'). """
+        if isinstance(value, str):
+                if isfile(value) and value.endswith('.gpl'):
+                        return value
+                shipped = join(palettes_path, value + '.gpl')
+                if isfile(shipped):
+                        return shipped
+
+def parse_force_to(force_to, auto = False):
+        """ Normalizes option `force_to` to 'original' (or 'auto', if allowed) or (bits, method, dither), None if invalid. """
+        if force_to == 'original' or (auto and force_to == 'auto'):
+                return force_to
+        if isinstance(force_to, int):
+                force_to = (force_to,)
+        if not isinstance(force_to, tuple) or not (1 <= len(force_to) <= 3):
+                return
+        bits, method, dither = force_to + ('mediancut', False)[len(force_to) - 1:]
+        if bits not in [1, 4, 8, 24, 32] or not isinstance(dither, bool):
+                return
+        if method not in Quantizer.methods:
+                path = palette_path(method)
+                if not path or len(palette_gpl(path)) > 3 * (1 << min(bits, 8)):
+                        return
+                method = path
+        return bits, method, dither
+
+@lru_cache(maxsize = None)
+def numpy_module():
+        """ Gets NumPy (optional, needed by array outputs), None if not installed. """
+        try:
+                import numpy
+        except ImportError:
+                return
+        return numpy
+
+def check_decode_output(output):
+        """ Checks option `output` of decoding, gets an error message (None if acceptable). """
+        if output not in ['image', 'array', 'buffer']:
+                return "Input error: option `output` unknown '%s' form." %output
+        if output == 'array' and numpy_module() is None:
+                return "Input error: option `output` 'array' needs NumPy."
+
+def save_format(name):
+        """ Checks whether PIL can save a format, loading every plugin only for unusual ones. """
+        Image.preinit()
+        if name not in Image.SAVE:
+                Image.init()
+        return name in Image.SAVE
+
+def print_err(msg, view = True):
         """ Handles stderr. """
         if view:
                 sys.stderr.write(msg + '\n')
                 sys.stderr.flush()
-                if toexit:
-                        sys.exit(1)
 
 def print_std(msg, view = False):
         """ Handles stdout. """
@@ -70,15 +150,17 @@ def tupledict(value):
                 pass
         return value
 
-class ExtendAction(argparse.Action):
-        # https://stackoverflow.com/questions/41152799/argparse-flatten-the-result-of-action-append
-        def __call__(self, parser, namespace, values, option_string = None):
-                items = getattr(namespace, self.dest) or []
-                items.extend(values)
-                setattr(namespace, self.dest, items)
-
 def iconolatry_parser():
         """ CLI parser. """
+        import argparse
+
+        class ExtendAction(argparse.Action):
+                # https://stackoverflow.com/questions/41152799/argparse-flatten-the-result-of-action-append
+                def __call__(self, parser, namespace, values, option_string = None):
+                        items = getattr(namespace, self.dest) or []
+                        items.extend(values)
+                        setattr(namespace, self.dest, items)
+
         options = {}
         icon_parser = argparse.ArgumentParser(description = __summary__, epilog = 'version: ' + __version__)
         icon_subparsers = icon_parser.add_subparsers(dest = 'mode', help = "Select if you want to read or to write an `.ico` / `.cur`.")
@@ -87,9 +169,13 @@ def iconolatry_parser():
         dec_parser = icon_subparsers.add_parser('decode', add_help = False, allow_abbrev = False)
         dec_parser.register('action', 'extend', ExtendAction)
         dec_required = dec_parser.add_argument_group('required arguments')
-        dec_required.add_argument('-i', '--icocurs-paths', required = True, nargs = "+", action = "extend", default = [], type = str,
-                                  dest = "paths_icocurs",
-                                  help = "Path(s) of `.ico` / `.cur` file(s) or folder(s) to be decoded.")
+        dec_input = dec_required.add_mutually_exclusive_group(required = True)
+        dec_input.add_argument('-i', '--icocurs-paths', nargs = "+", action = "extend", default = [], type = str,
+                               dest = "paths_icocurs",
+                               help = "Path(s) of `.ico` / `.cur` file(s) or folder(s) to be decoded.")
+        dec_input.add_argument('-j', '--jobs-file', action = "store", default = None, type = str,
+                               dest = "jobs_file",
+                               help = "JSON lines file, one decoding job per line (run by a worker pool, resumable).")
 
         dec_optional = dec_parser.add_argument_group('optional arguments')
         dec_optional.add_argument('-h', '--help', action = "help", default = argparse.SUPPRESS,
@@ -106,14 +192,66 @@ def iconolatry_parser():
         dec_optional.add_argument('-u', '--rebuild', action = 'store_true', default = False,
                                   dest = "rebuild",
                                   help = "Enable recompute AND mask.")
+        dec_optional.add_argument('-c', '--force', action = "store", default = 'original', type = tupledict,
+                                  dest = "force_to",
+                                  help = "Bit depth conversion method to apply during decoding.")
+        dec_optional.add_argument('-m', '--manifest', action = "store", default = None, type = str,
+                                  dest = "manifest",
+                                  help = "Manifest file path enabling incremental mode.")
+        dec_optional.add_argument('-a', '--archive', action = "store", default = None, type = str,
+                                  dest = "archive",
+                                  help = "Zip / tar archive where decoded images are written (output paths are folders inside it).")
+        dec_optional.add_argument('--atlas', action = "store", default = None, type = str,
+                                  dest = "atlas", metavar = "PREFIX",
+                                  help = "Pack decoded images into sprite sheets `PREFIX_N.png` indexed by `PREFIX.json`.")
+        dec_optional.add_argument('--atlas-size', action = "store", default = (1024, 1024), type = tupledict,
+                                  dest = "atlas_size",
+                                  help = "Size (width, height) of sprite sheets.")
+        dec_optional.add_argument('--atlas-only', action = "store", default = None, type = tupledict,
+                                  dest = "atlas_only",
+                                  help = "Pack only images of this size (side or (width, height)).")
+        dec_optional.add_argument('--phash-index', action = "store", default = None, type = str,
+                                  dest = "phash_index", metavar = "INDEX_FILE",
+                                  help = "Perceptual hashes index file: decoded images are added and their near-duplicates shown.")
+        dec_optional.add_argument('--phash-distance', action = "store", default = 6, type = int,
+                                  dest = "phash_distance",
+                                  help = "Maximum Hamming distance (of 64 bits) of near-duplicates.")
+        dec_optional.add_argument('--phash-search', action = 'store_false', default = True,
+                                  dest = "phash_insert",
+                                  help = "Only search the perceptual hashes index, without adding decoded images.")
+        dec_optional.add_argument('-R', '--recursive', action = 'store_true', default = False,
+                                  dest = "recursive",
+                                  help = "Scan subfolders of folder paths too.")
+        dec_optional.add_argument('--include', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "include",
+                                  help = "Glob(s) of files decoded from folders (relative paths).")
+        dec_optional.add_argument('--exclude', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "exclude",
+                                  help = "Glob(s) of files / subfolders skipped in folders (relative paths).")
+        dec_optional.add_argument('-w', '--workers', action = "store", default = None, type = int,
+                                  dest = "workers",
+                                  help = "Number of worker processes for `--jobs-file`.")
+        dec_optional.add_argument('--profile', nargs = "?", action = "store", default = False, const = True, type = str,
+                                  dest = "profile", metavar = "PSTATS_FILE",
+                                  help = "Print time spent per decoding stage (and dump cProfile stats to file, if given).")
+        dec_optional.add_argument('--max-bytes', action = "store", default = 16 << 20, type = int,
+                                  dest = "max_bytes",
+                                  help = "Maximum size of a `.ico` / `.cur` file.")
+        dec_optional.add_argument('--max-pixels', action = "store", default = 1 << 24, type = int,
+                                  dest = "max_pixels",
+                                  help = "Maximum number of pixels of all images of a `.ico` / `.cur` file.")
 
         # Encode parser.
         enc_parser = icon_subparsers.add_parser('encode', add_help = False, allow_abbrev = False)
         enc_parser.register('action', 'extend', ExtendAction)
         enc_required = enc_parser.add_argument_group('required arguments')
-        enc_required.add_argument('-i', '--images-paths', required = True, nargs = "+", action = "append", default = [], type = str,
-                                  dest = "paths_images",
-                                  help = "Path(s) of image file(s) or folder(s) to be encoded.")
+        enc_input = enc_required.add_mutually_exclusive_group(required = True)
+        enc_input.add_argument('-i', '--images-paths', nargs = "+", action = "append", default = [], type = str,
+                               dest = "paths_images",
+                               help = "Path(s) of image file(s) or folder(s) to be encoded.")
+        enc_input.add_argument('-j', '--jobs-file', action = "store", default = None, type = str,
+                               dest = "jobs_file",
+                               help = "JSON lines file, one encoding job per line (run by a worker pool, resumable).")
 
         enc_optional = enc_parser.add_argument_group('optional arguments')
         enc_optional.add_argument('-h', '--help', action = "help", default = argparse.SUPPRESS,
@@ -130,12 +268,101 @@ def iconolatry_parser():
         enc_optional.add_argument('-r', '--resize', action = "store", default = 'up256_prop', type = tupledict,
                                   dest = "type_resize",
                                   help = "Resize method (values) to apply during encoding.")
-        enc_optional.add_argument('-c', '--force', action = "store", default = 'raw', type = str,
+        enc_optional.add_argument('--resample', action = "store", default = 'lanczos', type = str,
+                                  dest = "resample", choices = ['nearest', 'box', 'bilinear', 'hamming', 'bicubic', 'lanczos'],
+                                  help = "Resize filter.")
+        enc_optional.add_argument('--reducing-gap', action = "store", default = 2., type = float,
+                                  dest = "reducing_gap",
+                                  help = "Shrink large images (JPEG DCT scaling, integer reduction) down to this times the resized size before filtering.")
+        enc_optional.add_argument('-c', '--force', action = "store", default = 'original', type = tupledict,
                                   dest = "force_to",
-                                  help = "Bit depth conversion method to apply during encoding.")
+                                  help = "Bit depth conversion method to apply during encoding ('auto' for the smallest lossless one).")
         enc_optional.add_argument('-p', '--custom-palettes', action = "store", default = {}, type = tupledict,
                                   dest = "custom_palettes",
                                   help = "Palettes to apply during encoding.")
+        enc_optional.add_argument('-m', '--manifest', action = "store", default = None, type = str,
+                                  dest = "manifest",
+                                  help = "Manifest file path enabling incremental mode.")
+        enc_optional.add_argument('-a', '--archive', action = "store", default = None, type = str,
+                                  dest = "archive",
+                                  help = "Zip / tar archive where `.ico` / `.cur` are written (output paths are folders inside it).")
+        enc_optional.add_argument('-R', '--recursive', action = 'store_true', default = False,
+                                  dest = "recursive",
+                                  help = "Scan subfolders of folder paths too.")
+        enc_optional.add_argument('--include', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "include",
+                                  help = "Glob(s) of files converted from folders (relative paths).")
+        enc_optional.add_argument('--exclude', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "exclude",
+                                  help = "Glob(s) of files / subfolders skipped in folders (relative paths).")
+        enc_optional.add_argument('-w', '--workers', action = "store", default = None, type = int,
+                                  dest = "workers",
+                                  help = "Number of worker processes for `--jobs-file`.")
+        enc_optional.add_argument('--profile', nargs = "?", action = "store", default = False, const = True, type = str,
+                                  dest = "profile", metavar = "PSTATS_FILE",
+                                  help = "Print time spent per encoding stage (and dump cProfile stats to file, if given).")
+
+        # Favicon parser.
+        fav_parser = icon_subparsers.add_parser('favicon', add_help = False, allow_abbrev = False)
+        fav_required = fav_parser.add_argument_group('required arguments')
+        fav_required.add_argument('-i', '--master-path', required = True, action = "store", type = str,
+                                  dest = "path_master",
+                                  help = "Path of the master image.")
+
+        fav_optional = fav_parser.add_argument_group('optional arguments')
+        fav_optional.add_argument('-h', '--help', action = "help", default = argparse.SUPPRESS,
+                                  help = "show this help message and exit")
+        fav_optional.add_argument('-o', '--bundle-path', action = "store", default = "", type = str,
+                                  dest = "path_bundle",
+                                  help = "Path of the bundle created.")
+        fav_optional.add_argument('-n', '--icon-name', action = "store", default = 'favicon', type = str,
+                                  dest = "name_icon",
+                                  help = "Name of the `.ico` created.")
+        fav_optional.add_argument('-s', '--site-name', action = "store", default = "", type = str,
+                                  dest = "name_site",
+                                  help = "Site name written into `site.webmanifest`.")
+
+        # Extract parser.
+        ext_parser = icon_subparsers.add_parser('extract', add_help = False, allow_abbrev = False)
+        ext_parser.register('action', 'extend', ExtendAction)
+        ext_required = ext_parser.add_argument_group('required arguments')
+        ext_required.add_argument('-i', '--binaries-paths', required = True, nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "paths_pe",
+                                  help = "Path(s) of PE binaries (`.exe`, `.dll`, ...) whose icon / cursor resources are extracted.")
+
+        ext_optional = ext_parser.add_argument_group('optional arguments')
+        ext_optional.add_argument('-h', '--help', action = "help", default = argparse.SUPPRESS,
+                                  help = "show this help message and exit")
+        ext_optional.add_argument('-o', '--output-path', action = "store", default = "", type = str,
+                                  dest = "path_out",
+                                  help = "Path of `.ico` / `.cur` files written.")
+        ext_optional.add_argument('--include', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "include",
+                                  help = "Glob(s) of groups extracted (e.g. '*.cur').")
+        ext_optional.add_argument('--exclude', nargs = "+", action = "extend", default = [], type = str,
+                                  dest = "exclude",
+                                  help = "Glob(s) of groups skipped.")
+
+        # Server parser.
+        srv_parser = icon_subparsers.add_parser('serve', add_help = False, allow_abbrev = False)
+        srv_optional = srv_parser.add_argument_group('optional arguments')
+        srv_optional.add_argument('-h', '--help', action = "help", default = argparse.SUPPRESS,
+                                  help = "show this help message and exit")
+        srv_optional.add_argument('-s', '--socket', action = "store", default = None, type = str,
+                                  dest = "path_socket",
+                                  help = "Unix domain socket path (otherwise localhost HTTP is used).")
+        srv_optional.add_argument('-a', '--host', action = "store", default = '127.0.0.1', type = str,
+                                  dest = "host",
+                                  help = "HTTP host.")
+        srv_optional.add_argument('-p', '--port', action = "store", default = 8765, type = int,
+                                  dest = "port",
+                                  help = "HTTP port.")
+        srv_optional.add_argument('-c', '--concurrency', action = "store", default = 4, type = int,
+                                  dest = "concurrency",
+                                  help = "Maximum number of concurrent conversions.")
+        srv_optional.add_argument('-b', '--max-bytes', action = "store", default = 16 << 20, type = int,
+                                  dest = "max_bytes",
+                                  help = "Maximum request body size.")
 
         try:
                 options.update(vars(icon_parser.parse_args()))
@@ -144,6 +371,403 @@ def iconolatry_parser():
 
         return options
 
+## _________
+##| Scanner |-----------------------------------------------------------------------------------------------------------------------------------------------
+##|_________|
+##
+
+def scan(folder, recursive = False, include = [], exclude = [], extensions = None):
+        """ Yields files of a folder (and subfolders, if `recursive`) lazily, sorted by name.
+            `include` / `exclude` are globs matched against paths relative to `folder` (excluded subfolders are pruned),
+            `extensions` is a tuple of lowercase extensions kept (None for all).
+        """
+        def walk(path, relative):
+                with scandir(path) as entries:
+                        entries = sorted(entries, key = lambda entry : entry.name)
+                for entry in entries:
+                        name = (relative + '/' + entry.name if relative else entry.name)
+                        if any(fnmatch(name, pattern) for pattern in exclude):
+                                continue
+                        # file types come from the directory listing, no stat call.
+                        if entry.is_dir(follow_symlinks = False):
+                                if recursive:
+                                        yield from walk(entry.path, name)
+                        elif extensions and not entry.name.lower().endswith(extensions):
+                                continue
+                        elif include and not any(fnmatch(name, pattern) for pattern in include):
+                                continue
+                        elif entry.is_file():
+                                yield entry.path
+
+        return walk(folder, "")
+
+@lru_cache(maxsize = None)
+def image_extensions():
+        """ Gets extensions of images PIL can open. """
+        return tuple(ext for ext, name in Image.registered_extensions().items() if name in Image.OPEN)
+
+def excluded(name, exclude):
+        """ Checks whether a relative path, or one of its folders, matches an exclude glob. """
+        parts = name.split('/')
+        return any(fnmatch('/'.join(parts[: end]), pattern) for end in range(1, len(parts) + 1) for pattern in exclude)
+
+def check_scan(recursive, include, exclude):
+        """ Verifies folder scanning options. """
+        if not isinstance(recursive, bool):
+                raise ValueError("Input error: option `recursive` not a boolean.")
+        for option, globs in [('include', include), ('exclude', exclude)]:
+                if not isinstance(globs, list) or not all(isinstance(pattern, str) for pattern in globs):
+                        raise ValueError("Input error: option `%s` not a list of strings." %option)
+
+
+## __________
+##| Archives |----------------------------------------------------------------------------------------------------------------------------------------------
+##|__________|
+##
+
+archive_extensions = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+def is_archive(path):
+        """ Determines whether a path names a zip / tar archive. """
+        return isinstance(path, str) and path.lower().endswith(archive_extensions)
+
+class Archive(object):
+        """ Reads members of a zip / tar archive without extracting them. """
+
+        def __init__(self, path):
+                self.path = path
+                try:
+                        if path.lower().endswith('.zip'):
+                                from zipfile import ZipFile
+                                self.handle = ZipFile(path, 'r')
+                        else:
+                                import tarfile
+                                self.handle = tarfile.open(path, 'r:*')
+                except Exception:
+                        raise ValueError("Input error: '%s' not a zip / tar archive." %path)
+
+        def members(self, recursive = False, include = [], exclude = [], extensions = None):
+                """ Yields (path, size, read) of files lazily, in archive order, filtered as `scan`;
+                    path is the member name joined to the archive path, `read()` gets its bytes.
+                """
+                is_zip = (not hasattr(self.handle, 'extractfile'))
+                for info in (self.handle.infolist() if is_zip else self.handle):
+                        if is_zip:
+                                name, size, is_file = info.filename, info.file_size, (not info.is_dir())
+                        else:
+                                name, size, is_file = info.name, info.size, info.isfile()
+                        name = (name[2 :] if name.startswith('./') else name)
+                        if not is_file or (not recursive and '/' in name) or excluded(name, exclude):
+                                continue
+                        if extensions and not name.lower().endswith(extensions):
+                                continue
+                        if include and not any(fnmatch(name, pattern) for pattern in include):
+                                continue
+                        read = (partial(self.handle.read, info) if is_zip else partial(self.read_tar, info))
+                        yield join(self.path, name), size, read
+
+        def missing(self, recursive = False):
+                """ Gets error message of an archive without matching members. """
+                hint = ("" if recursive else " (members in folders need `recursive` / -R)")
+                return "Input error: no matching member in archive '%s'%s." %(self.path, hint)
+
+        def read_tar(self, info):
+                """ Gets bytes of a tar member. """
+                with self.handle.extractfile(info) as fd:
+                        return fd.read()
+
+        def close(self):
+                self.handle.close()
+
+        def __enter__(self):
+                return self
+
+        def __exit__(self, *exc):
+                self.close()
+
+class ArchiveWriter(object):
+        """ Writes members of a zip / tar archive from a single thread, while conversions go on. """
+
+        def __init__(self, path):
+                from queue import Queue
+                from threading import Thread
+
+                self.path, self.error = path, None
+                self.queue = Queue(maxsize = 64)
+                self.thread = Thread(target = self.run, name = 'archive-writer', daemon = True)
+                self.thread.start()
+
+        def member(self, path):
+                """ Gets member name of an output path (under the archive path). """
+                return path[len(self.path) :].lstrip('/')
+
+        def put(self, path, data):
+                """ Queues bytes of an output path. """
+                if self.error:
+                        raise self.error
+                self.queue.put((self.member(path), data))
+
+        def run(self):
+                """ Writes queued members until closed. """
+                try:
+                        if self.path.lower().endswith('.zip'):
+                                from zipfile import ZipFile, ZIP_DEFLATED
+                                with ZipFile(self.path, 'w', ZIP_DEFLATED) as handle:
+                                        for name, data in iter(self.queue.get, None):
+                                                handle.writestr(name, data)
+                        else:
+                                import tarfile
+                                compress = {'gz' : 'gz', 'tgz' : 'gz', 'bz2' : 'bz2', 'tbz2' : 'bz2', 'xz' : 'xz', 'txz' : 'xz'}
+                                mode = 'w:' + compress.get(self.path.lower().rsplit('.', 1)[-1], "")
+                                with tarfile.open(self.path, mode.rstrip(':')) as handle:
+                                        for name, data in iter(self.queue.get, None):
+                                                info = tarfile.TarInfo(name)
+                                                info.size, info.mtime = len(data), int(time())
+                                                handle.addfile(info, BytesIO(data))
+                except Exception as e:
+                        self.error = e
+                        # unblock producers.
+                        while self.queue.get() is not None:
+                                pass
+
+        def close(self):
+                """ Flushes queued members and closes the archive. """
+                self.queue.put(None)
+                self.thread.join()
+                if self.error:
+                        raise self.error
+
+def open_writer(archive):
+        """ Gets an `ArchiveWriter` for an output archive path (None if not defined). """
+        return (ArchiveWriter(archive) if archive else None)
+
+
+## ________________
+##| PE Resources   |----------------------------------------------------------------------------------------------------------------------------------------
+##|________________|
+##
+
+pe_extensions = ('.exe', '.dll', '.ocx', '.cpl', '.scr', '.mui')
+
+## (2bytes)Machine - (2bytes)NumberOfSections - (4bytes)TimeDateStamp - (4bytes)PointerToSymbolTable -
+## - (4bytes)NumberOfSymbols - (2bytes)SizeOfOptionalHeader - (2bytes)Characteristics.
+COFF_HEADER = Struct('<2H3L2H')
+## (8bytes)Name - (4bytes)VirtualSize - (4bytes)VirtualAddress - (4bytes)SizeOfRawData - (4bytes)PointerToRawData - (16bytes)unused.
+SECTION_HEADER = Struct('<8s4L16x')
+## (4bytes)Characteristics - (4bytes)TimeDateStamp - (2bytes)MajorVersion - (2bytes)MinorVersion -
+## - (2bytes)NumberOfNamedEntries - (2bytes)NumberOfIdEntries.
+RESOURCE_DIRECTORY = Struct('<2L4H')
+## (4bytes)Name (or string offset) - (4bytes)OffsetToData (or subdirectory offset).
+RESOURCE_DIRECTORY_ENTRY = Struct('<2L')
+## (4bytes)OffsetToData (RVA) - (4bytes)Size - (4bytes)CodePage - (4bytes)Reserved.
+RESOURCE_DATA_ENTRY = Struct('<4L')
+## As ICONDIRENTRY, but (2bytes)nID of the RT_ICON resource replaces dwImageOffset.
+GRPICONDIRENTRY = Struct('<4B2HLH')
+## (2bytes)wWidth - (2bytes)wHeight (doubled) - (2bytes)wPlanes - (2bytes)wBitCount - (4bytes)dwBytesInRes - (2bytes)nID.
+GRPCURSORDIRENTRY = Struct('<4HLH')
+
+def is_pe(path):
+        """ Determines whether a path names a PE binary (by extension). """
+        return isinstance(path, str) and path.lower().endswith(pe_extensions)
+
+class PEResources(object):
+        """ Reads icon / cursor groups of a PE (`.exe` / `.dll`) binary mapped in memory:
+            only headers and the resource section are touched.
+        """
+        # RT_GROUP_ICON (RT_ICON), RT_GROUP_CURSOR (RT_CURSOR).
+        types = [(14, 3, '.ico'),
+                 (12, 1, '.cur')]
+
+        def __init__(self, path):
+                import mmap
+
+                self.path = path
+                with open(path, 'rb') as fd:
+                        try:
+                                self.data = mmap.mmap(fd.fileno(), 0, access = mmap.ACCESS_READ)
+                        except ValueError:
+                                raise ValueError("Input error: '%s' not a PE binary." %path)
+                try:
+                        self.locate()
+                except (ValueError, struct_error):
+                        self.close()
+                        raise ValueError("Input error: '%s' not a PE binary." %path)
+
+        def locate(self):
+                """ Finds the resource section through DOS, COFF and optional headers. """
+                data, self.base = self.data, None
+                if data[0 : 2] != b'MZ':
+                        raise ValueError
+                pe = unpack_from('<L', data, 0x3C)[0]
+                if data[pe : pe + 4] != b'PE\0\0':
+                        raise ValueError
+                _, sections, _, _, _, size_optional, _ = COFF_HEADER.unpack_from(data, pe + 4)
+                optional = pe + 4 + COFF_HEADER.size
+                ## Data directories follow NumberOfRvaAndSizes, in PE32 / PE32+ optional header.
+                directories = {0x10b : 96, 0x20b : 112}.get(unpack_from('<H', data, optional)[0])
+                if directories is None:
+                        raise ValueError
+                if unpack_from('<L', data, optional + directories - 4)[0] < 3:
+                        return
+                rva, size = unpack_from('<2L', data, optional + directories + 8 * 2)
+                if not rva or not size:
+                        return
+
+                table = optional + size_optional
+                for indx in range(sections):
+                        _, vsize, vaddr, rawsize, rawptr = SECTION_HEADER.unpack_from(data, table + SECTION_HEADER.size * indx)
+                        if vaddr <= rva < vaddr + max(vsize, rawsize):
+                                self.vaddr, self.start, self.end = vaddr, rawptr, min(rawptr + rawsize, len(data))
+                                self.base = rawptr + rva - vaddr
+                                return
+
+        def view(self, offset, size):
+                """ Gets bytes of the resource section, None if out of it. """
+                if offset < self.start or offset + size > self.end:
+                        return
+                return self.data[offset : offset + size]
+
+        def entries(self, offset):
+                """ Gets (name or id, offset, is subdirectory) of a resource directory (offsets from resource root). """
+                header = self.view(self.base + offset, RESOURCE_DIRECTORY.size)
+                if header is None:
+                        return []
+                named, ids = RESOURCE_DIRECTORY.unpack(header)[4 :]
+                table = self.view(self.base + offset + RESOURCE_DIRECTORY.size, RESOURCE_DIRECTORY_ENTRY.size * (named + ids))
+                if table is None:
+                        return []
+                return [((self.string(name & 0x7fffffff) if name & 0x80000000 else name), target & 0x7fffffff, bool(target & 0x80000000))
+                        for name, target in RESOURCE_DIRECTORY_ENTRY.iter_unpack(table)]
+
+        def string(self, offset):
+                """ Gets a resource name (UTF-16 counted string). """
+                length = self.view(self.base + offset, 2)
+                text = (self.view(self.base + offset + 2, 2 * unpack_from('<H', length)[0]) if length else None)
+                return (text.decode('utf-16-le', 'replace') if text is not None else str(offset))
+
+        def resource(self, offset):
+                """ Gets bytes of a resource data entry, None if out of the resource section. """
+                entry = self.view(self.base + offset, RESOURCE_DATA_ENTRY.size)
+                if entry is None:
+                        return
+                rva, size = RESOURCE_DATA_ENTRY.unpack(entry)[0 : 2]
+                return self.view(self.start + rva - self.vaddr, size)
+
+        def table(self, typ):
+                """ Gets {(name, language) : data entry offset} of a resource type. """
+                table = {}
+                for rtype, offset, is_dir in self.entries(0):
+                        if rtype != typ or not is_dir:
+                                continue
+                        for name, offset_name, is_dir_name in self.entries(offset):
+                                if is_dir_name:
+                                        for lang, offset_lang, is_dir_lang in self.entries(offset_name):
+                                                if not is_dir_lang:
+                                                        table[(name, lang)] = offset_lang
+                return table
+
+        def assemble(self, offset, lang, images, is_cursor):
+                """ Reassembles a group as ICONDIR, ICONDIRENTRYs and images data (None if malformed). """
+                group = self.resource(offset)
+                if group is None or len(group) < ICONDIR.size:
+                        return
+                layout = (GRPCURSORDIRENTRY if is_cursor else GRPICONDIRENTRY)
+                count = min(ICONDIR.unpack_from(group)[2], (len(group) - ICONDIR.size) // layout.size)
+
+                entries = []
+                for indx in range(count):
+                        fields = layout.unpack_from(group, ICONDIR.size + layout.size * indx)
+                        ## An image in group language, else in any.
+                        languages = images.get(fields[-1], {})
+                        data_offset = languages.get(lang, next(iter(languages.values()), None))
+                        image = (self.resource(data_offset) if data_offset is not None else None)
+                        if not image:
+                                continue
+                        if is_cursor:
+                                ## RT_CURSOR starts with hotspot, sizes come from the image header.
+                                if len(image) < 4 + BITMAPINFOHEADER.size:
+                                        continue
+                                (hotspot_x, hotspot_y), image = unpack_from('<2H', image), image[4 :]
+                                if image.startswith(b'\x89PNG\r\n\x1a\n'):
+                                        width, height = IHDR_SIZE.unpack_from(image, 16)
+                                else:
+                                        width, height = BITMAPINFOHEADER.unpack_from(image)[1 : 3]
+                                        height //= 2
+                                entry = [min(width, 256) % 256, min(height, 256) % 256, 0, 0, hotspot_x, hotspot_y]
+                        else:
+                                entry = list(fields[0 : 6])
+                        entries.append((entry, image))
+
+                if not entries:
+                        return
+                header = bytearray(ICONDIR.size + ICONDIRENTRY.size * len(entries))
+                ICONDIR.pack_into(header, 0, 0, (2 if is_cursor else 1), len(entries))
+                dataoffset = len(header)
+                for indx, (entry, image) in enumerate(entries):
+                        ICONDIRENTRY.pack_into(header, ICONDIR.size + ICONDIRENTRY.size * indx, *entry, len(image), dataoffset)
+                        dataoffset += len(image)
+                return bytes(header) + b"".join(image for _, image in entries)
+
+        def members(self, recursive = False, include = [], exclude = [], extensions = None):
+                """ Yields (path, size, read) of groups as `.ico` / `.cur`, like `Archive.members`;
+                    path is the binary path joined to group name (with language, if more).
+                """
+                if self.base is None:
+                        return
+                for group_type, image_type, extension in self.types:
+                        images = {}
+                        for (name, lang), offset in self.table(image_type).items():
+                                images.setdefault(name, {})[lang] = offset
+                        groups = self.table(group_type)
+                        names = [name for name, _ in groups]
+                        for (name, lang), offset in groups.items():
+                                member = '%s%s%s' %(name, ('_%s' %lang if names.count(name) > 1 else ""), extension)
+                                if excluded(member, exclude) or (extensions and not member.lower().endswith(extensions)):
+                                        continue
+                                if include and not any(fnmatch(member, pattern) for pattern in include):
+                                        continue
+                                data = self.assemble(offset, lang, images, extension == '.cur')
+                                if data is not None:
+                                        yield join(self.path, member), len(data), partial(bytes, data)
+
+        def extract(self, path_out, include = [], exclude = []):
+                """ Writes groups as `.ico` / `.cur` files, returns their paths. """
+                saved = []
+                for path, _, read in self.members(include = include, exclude = exclude):
+                        save_path = join(path_out, basename(path))
+                        with open(save_path, 'wb') as fd:
+                                fd.write(read())
+                        saved.append(save_path)
+                return saved
+
+        def close(self):
+                self.data.close()
+
+        def __enter__(self):
+                return self
+
+        def __exit__(self, *exc):
+                self.close()
+
+def extract_pe(paths_pe, path_out = "", include = [], exclude = [], is_cli = False):
+        """ Writes icon / cursor groups of PE binaries as `.ico` / `.cur` files (reported on console if `is_cli`). """
+        path_out = path_out or abspath('.')
+        if not isdir(path_out):
+                raise ValueError("Input error: output directory path '%s' not found." %path_out)
+        saved = {}
+        for path in paths_pe:
+                try:
+                        with PEResources(path) as binary:
+                                saved[path] = binary.extract(path_out, include, exclude)
+                except (ValueError, OSError) as e:
+                        saved[path] = str(e)
+                        print_err(str(e), view = is_cli)
+                        continue
+                for save_path in saved[path]:
+                        print_std('saved = %s' %save_path, view = is_cli)
+        return saved
+
+
 ## _____________________
 ##| Parameters Checker  |-----------------------------------------------------------------------------------------------------------------------------------
 ##|_____________________|
@@ -157,29 +781,41 @@ class Check(object):
         def setup(self):
                 """ Checks output length list. """
                 if not isinstance(self.list_out, list):
-                        print_err("Input error: %s not a list." %self.msg)
+                        raise ValueError("Input error: %s not a list." %self.msg)
 
                 if len(self.list_in) > len(self.list_out):
                         # used default for missing fields.
                         self.list_out.extend([self.default] * (len(self.list_in) - len(self.list_out)))
                 elif len(self.list_in) < len(self.list_out):
-                        print_err("Input error: too much %s." %self.msg)
+                        raise ValueError("Input error: too much %s." %self.msg)
 
         def paths(self, msg):
                 """ Checks output paths list. """
                 self.msg = msg + " directory path/s"
-                self.default = working_path
+                self.default = abspath('.')
                 self.setup()
 
                 for indx, path in enumerate(self.list_out):
                         if not isinstance(path, str):
-                                print_err("Input error: %s directory path '%s' not a string." %(msg, path))
+                                raise ValueError("Input error: %s directory path '%s' not a string." %(msg, path))
                         else:
-                                if path is "":
+                                if path == "":
                                         # used default for specified empty field.
                                         self.list_out[indx] = self.default
                                 elif not isdir(path):
-                                        print_err("Input error: %s directory path '%s' not found." %(msg, path))
+                                        raise ValueError("Input error: %s directory path '%s' not found." %(msg, path))
+
+        def members(self, msg, archive):
+                """ Checks output paths list, as folders inside an output archive. """
+                self.msg = msg + " directory path/s"
+                self.default = ""
+                self.setup()
+
+                for indx, path in enumerate(self.list_out):
+                        if not isinstance(path, str):
+                                raise ValueError("Input error: %s directory path '%s' not a string." %(msg, path))
+                        else:
+                                self.list_out[indx] = join(archive, path.strip('/'))
 
         def names(self, msg):
                 """ Checks output names list. """
@@ -189,32 +825,31 @@ class Check(object):
 
                 for indx, (path, name) in enumerate(zip(self.list_in, self.list_out)):
                         if not isinstance(name, str):
-                                print_err("Input error: %s name '%s' not a string." %(msg, name))
+                                raise ValueError("Input error: %s name '%s' not a string." %(msg, name))
                         else:
-                                if name is "":
+                                if name == "":
                                         try:
                                                 if isinstance(path, list) and len(path) == 1:
                                                         path = path[0]
                                                         # single image --> get image name.
                                                         # directory images --> put "".
-                                                        self.list_out[indx] = (splitext(basename(path))[0] if isfile(path) else self.default)
+                                                        self.list_out[indx] = (splitext(basename(path))[0] if isfile(path) and not is_archive(path) else self.default)
                                         except:
                                                 # get errors after.
                                                 pass
 
         def formats_checker(self, msg):
                 """ Formats checking function. """
-                Image.init()
                 for indx, frmt in enumerate(self.list_out):
                         if not isinstance(frmt, str):
-                                print_err("Input error: %s format '%s' not a string." %(msg, frmt))
+                                raise ValueError("Input error: %s format '%s' not a string." %(msg, frmt))
                         else:
-                                if frmt is "":
+                                if frmt == "":
                                         self.list_out[indx] = self.default
                                 else:
-                                        if (self.default == ".png" and frmt[1:].upper() not in Image.SAVE.keys()) or \
+                                        if (self.default == ".png" and not save_format(frmt[1:].upper())) or \
                                            (self.default == ".ico" and frmt not in [".ico", ".cur"]):
-                                                print_err("Input error: %s format '%s' not recognized." %(msg, frmt))
+                                                raise ValueError("Input error: %s format '%s' not recognized." %(msg, frmt))
 
         def formats(self, msg, default, check = True):
                 """ Checks output formats list. """
@@ -225,98 +860,324 @@ class Check(object):
                 if check:
                         self.formats_checker(msg)
 
+## ________________
+##| Stage Timings  |----------------------------------------------------------------------------------------------------------------------------------------
+##|________________|
+##
+
+class Stage(object):
+        """ Times a conversion stage, excluding time of stages nested into it. """
+        def __init__(self, timings, name):
+                self.timings, self.name = timings, name
+
+        def __enter__(self):
+                self.timings.stack.append(0.)
+                self.start = perf_counter()
+
+        def __exit__(self, *exc):
+                elapsed = perf_counter() - self.start
+                nested = self.timings.stack.pop()
+                if self.timings.stack:
+                        self.timings.stack[-1] += elapsed
+                self.timings.add(self.name, elapsed - nested)
+
+class NoStage(object):
+        """ Times nothing, used when timings are disabled. """
+        def __enter__(self):
+                pass
 
-## _______________________
-##| Read `.ico` / `.cur`  |----------------------------------------------------------------------------------------------------------------------------------
-##|_______________________|
+        def __exit__(self, *exc):
+                pass
+
+no_stage = NoStage()
+
+class Timings(object):
+        """ Collects time spent per conversion stage, for current file and for the whole run. """
+        def __init__(self, profile = False):
+                # a callable receives (file, {stage : seconds}) of every converted file.
+                self.enabled = bool(profile)
+                self.hook = (profile if callable(profile) else None)
+                self.run, self.file, self.stack = {}, {}, []
+
+        def stage(self, name):
+                """ Gets a context manager timing a stage. """
+                return (Stage(self, name) if self.enabled else no_stage)
+
+        def add(self, name, seconds):
+                """ Accumulates time of a stage. """
+                self.file[name] = self.file.get(name, 0.) + seconds
+                self.run[name] = self.run.get(name, 0.) + seconds
+
+        def begin(self):
+                """ Starts timing a new file. """
+                self.file = {}
+
+        def end(self, path):
+                """ Ends timing current file, gets its timings and forwards them to the hook. """
+                timings = {stage : round(seconds, 6) for stage, seconds in self.file.items()}
+                if self.hook:
+                        self.hook(path, timings)
+                return timings
+
+        def report(self):
+                """ Gets a printable breakdown of the run timings. """
+                return stages_report(self.run)
+
+def stages_report(timings):
+        """ Gets a printable breakdown of {stage : seconds} timings. """
+        total = sum(timings.values())
+        lines = ['{:<10} {:>12} {:>8}'.format('stage', 'seconds', 'share')]
+        for stage, seconds in sorted(timings.items(), key = lambda item : -item[1]):
+                lines.append('{:<10} {:>12.6f} {:>7.1f}%'.format(stage, seconds, 100. * seconds / (total or 1)))
+        lines.append('{:<10} {:>12.6f}'.format('total', total))
+        return '\n'.join(lines)
+
+
+## __________
+##| Results  |------------------------------------------------------------------------------------------------------------------------------------------------
+##|__________|
 ##
 
-class Decode(object):
+class Record(object):
+        """ Compact result record: unset fields are None and omitted from its dict shape. """
+        __slots__ = ()
+
+        def __init__(self, **fields):
+                for name in self.__slots__:
+                        setattr(self, name, fields.get(name))
+
+        def as_dict(self):
+                """ Gets fields set, in the dict shape of the original results. """
+                return {name : getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+        def __repr__(self):
+                return '%s(%s)' %(self.__class__.__name__, ', '.join('%s=%r' %(name, getattr(self, name))
+                                                                     for name in self.__slots__ if getattr(self, name) is not None))
+
+class BmpParameters(Record):
+        """ BITMAPINFOHEADER values, palette and masks of a `bmp` entry. """
+        __slots__ = ('head', 'width', 'height', 'planes', 'bpp', 'compress', 'size_img', 'colors',
+                     'size_pal', 'num_pal', 'palette', 'size_xor', 'xor', 'size_and', 'and_')
+
+class IconEntry(Record):
+        """ Decoded image of an `.ico` / `.cur` entry, or the `error` which prevented it. """
+        __slots__ = ('warning', 'info', 'im_obj', 'pixels', 'depth', 'num_pal', 'new_depth', 'hotspot_x', 'hotspot_y', 'phash', 'similar', 'saved', 'error')
+
+        def warn(self, msg):
+                self.warning = (self.warning or []) + [msg]
+
+        def as_dict(self):
+                if self.error is not None:
+                        return self.error
+                return {name : getattr(self, name) for name in self.__slots__[:-1] if getattr(self, name) is not None}
+
+class IconFileResult(Record):
+        """ Decoded `.ico` / `.cur` file: its entries, or the `error` which prevented them. """
+        __slots__ = ('path', 'warning', 'entries', 'timings', 'error')
+
+        def as_dict(self):
+                if self.error is not None:
+                        return self.error
+                result = ({'warning' : self.warning} if self.warning else {})
+                result.update(('image_%s' %cnt, entry.as_dict()) for cnt, entry in enumerate(self.entries or []))
+                if self.timings is not None:
+                        result['timings'] = self.timings
+                return result
+
+class EncodedImage(Record):
+        """ Source image of an `.ico` / `.cur` written. """
+        __slots__ = ('file', 'mode', 'depth', 'size', 'resize', 'new_mode', 'new_depth', 'hotspot_x', 'hotspot_y', 'duplicate', 'timings')
+
+        def copy(self, **fields):
+                """ Gets a copy with some fields replaced. """
+                record = EncodedImage(**{name : getattr(self, name) for name in self.__slots__})
+                for name, value in fields.items():
+                        setattr(record, name, value)
+                return record
+
+class EncodeJobResult(Record):
+        """ `.ico` / `.cur` written: its source images, or the `error` which prevented it. """
+        __slots__ = ('path', 'sources', 'error')
+
+        def as_dict(self):
+                if self.error is not None:
+                        return self.error
+                return [source.as_dict() for source in self.sources]
+
+class ResultsView(Mapping):
+        """ Read-only view of result records in the dict shape of the original API
+            (`all_icocur_readed` / `all_icocur_written`); dicts are built on access.
+        """
+        def __init__(self, records):
+                self.records = records
 
-        def __init__(self, paths_icocurs, paths_image = [], names_image = [], formats_image = [],
-                     rebuild = False, force_to = 'original'):
+        def __getitem__(self, key):
+                return self.records[key].as_dict()
 
-                """
-                    `paths_icocurs`   : a list   : can contain one/more icon/cursor(s) path(s)
-                                                   and/or one/more folder icon/cursor(s) path(s) to convert.
-                    `paths_image`     : a list   : contains output path(s) for every resulting conversion.
-                                                   If `paths_image` isn't defined, working directory is used.
-                    `names_image`     : a list   : contains output name(s) for every resulting conversion.
-                    `formats_image`   : a list   : contains format(s) for every resulting conversion (all saving PIL formats).
-                    `rebuild`         : a bool   : if 'True', recompute mask from the alpha channel data.
-                    `force_to`        : a string : if 'original', original bit depth is kept. (TODO)
-                """
+        def __iter__(self):
+                return iter(self.records)
 
-                self.paths_icocurs = paths_icocurs
-                self.paths_image = paths_image
-                self.formats_image = formats_image
-                self.names_image = names_image
-                self.rebuild = rebuild
-                self.force_to = force_to
-                self.is_cli = is_cli
-                self.want_save = (False if all(x == [] for x in [self.paths_image, self.names_image, self.formats_image]) else True)
-                self.build()
+        def __len__(self):
+                return len(self.records)
 
-        def is_png(self, dataimage):
-                """ Determines whether a sequence of bytes is a PNG. """
-                return dataimage.startswith(b'\x89PNG\r\n\x1a\n')
+        def __repr__(self):
+                return repr(dict(self))
 
-        def is_gray(self):
-                """ Determines whether an image is grayscale (from palette). """
-                paletteblocks = [self.parameters['palette'][i : i + 3] for i in range(0, self.parameters['size_pal'], 4)]
-                if all(elem == block[0] for block in paletteblocks for elem in block):
-                        return True
+## ______________
+##| Sprite Atlas |------------------------------------------------------------------------------------------------------------------------------------------
+##|______________|
+##
+
+def write_file(path, data):
+        """ Writes bytes to a file. """
+        with open(path, 'wb') as fd:
+                fd.write(data)
+
+class Atlas(object):
+        """ Packs images into fixed-size `.png` sheets with a shelf packer; a sheet is saved as soon as
+            an image doesn't fit, so only one sheet is kept in memory.
+            The index (`<prefix>.json`) lists (file, entry, sheet, x, y, w, h, hotspot) of every image.
+        """
+
+        def __init__(self, prefix, size = (1024, 1024), save = write_file):
+                self.prefix, self.size, self.save = prefix, size, save
+                self.sheets, self.images = [], []
+                self.sheet = None
+
+        def place(self, w, h):
+                """ Gets (x, y) of a free w x h area of the open sheet (tightest shelf first), None if full. """
+                width, height = self.size
+                fits = [shelf for shelf in self.shelves if shelf[1] >= h and shelf[2] + w <= width]
+                if fits:
+                        shelf = min(fits, key = lambda shelf : shelf[1])
                 else:
-                        return False
+                        top = sum(shelf[1] for shelf in self.shelves)
+                        if top + h > height or w > width:
+                                return
+                        # [y, height, x of free space].
+                        shelf = [top, h, 0]
+                        self.shelves.append(shelf)
+                x, shelf[2] = shelf[2], shelf[2] + w
+                return x, shelf[0]
+
+        def add(self, image, file, entry, hotspot = None):
+                """ Packs an image, returns path of its sheet (None if larger than a sheet). """
+                w, h = image.size
+                if w > self.size[0] or h > self.size[1]:
+                        return
+                place = (self.place(w, h) if self.sheet else None)
+                if place is None:
+                        self.flush()
+                        self.sheet, self.shelves = Image.new('RGBA', self.size, (0, 0, 0, 0)), []
+                        place = self.place(w, h)
+                self.sheet.paste(image.convert('RGBA'), place)
+
+                path = '%s_%s.png' %(self.prefix, len(self.sheets))
+                self.images.append({'file'    : file,
+                                    'entry'   : entry,
+                                    'sheet'   : basename(path),
+                                    'x'       : place[0],
+                                    'y'       : place[1],
+                                    'w'       : w,
+                                    'h'       : h,
+                                    'hotspot' : hotspot})
+                return path
+
+        def flush(self):
+                """ Saves the open sheet. """
+                if self.sheet:
+                        path = '%s_%s.png' %(self.prefix, len(self.sheets))
+                        buffer = BytesIO()
+                        self.sheet.save(buffer, format = 'PNG')
+                        self.save(path, buffer.getvalue())
+                        self.sheets.append(path)
+                        self.sheet = None
+
+        def close(self):
+                """ Saves the last sheet and the index. """
+                self.flush()
+                index = {'size'   : list(self.size),
+                         'sheets' : [basename(path) for path in self.sheets],
+                         'images' : self.images}
+                self.save(self.prefix + '.json', json.dumps(index, indent = 1).encode('utf-8'))
 
-        def check_output(self):
-                """ Verifies if output paths, names, formats are ok. """
-                ## Check rebuild option.
-                if not isinstance(self.rebuild, bool):
-                        print_err("Input error: option 'rebuild' not a boolean.")
 
-                ## Checks paths.
-                Check(self.paths_icocurs, self.paths_image).paths("image")
-                ## Check names.
-                Check(self.paths_icocurs, self.names_image).names("image")
-                ## Check formats.
-                Check(self.paths_icocurs, self.formats_image).formats("image", ".png")
+## _______________________
+##| Read `.ico` / `.cur`  |----------------------------------------------------------------------------------------------------------------------------------
+##|_______________________|
+##
 
-        def build(self):
-                """ Verifies if input paths are ok and starts conversion job. """
-                self.print_std = partial(print_std, view = self.is_cli)
-                self.print_err = partial(print_err, view = self.is_cli)
+class IconReader(object):
+        """ Reads an `.ico` / `.cur` from bytes: all state of the decoding is its own, so readers
+            of different threads share nothing but thread-safe caches (see `decode_bytes`).
+        """
+        def __init__(self, data, path = 'stream', rebuild = False, force_to = 'original',
+                     max_bytes = 16 << 20, max_pixels = 1 << 24, timings = None, output = 'image'):
+                self.data_icocur, self.path_icocur = data, path
+                self.rebuild, self.force_to = rebuild, force_to
+                self.max_bytes, self.max_pixels = max_bytes, max_pixels
+                self.timings = (Timings(False) if timings is None else timings)
+                self.output = output
+                # `bmp` pixels are unpacked by NumPy, if available and the depth is kept.
+                self.unpack = (output != 'image' and force_to == 'original' and numpy_module() is not None)
+                self.parameters = None
 
-                ## Checks paths `.ico` / `.cur` files (Input).
-                if not self.paths_icocurs:
-                        print_err("Input error: `.ico` / `.cur` file path/s missing.")
+        def is_png(self, dataimage):
+                """ Determines whether a sequence of bytes is a PNG. """
+                return dataimage.startswith(b'\x89PNG\r\n\x1a\n')
 
-                if isinstance(self.paths_icocurs, list):
-                        self.check_output()
-                        self.remind = {}
-                        self.all_icocur_readed = {}
+        def validate(self):
+                """ Checks ICONDIR table, images ranges and claimed sizes, before any pixel work.
+                    Returns an error message, None if acceptable.
+                """
+                datasize = len(self.data_icocur)
+                if self.max_bytes and datasize > self.max_bytes:
+                        return "Icon/Cursor error: file larger than %s bytes." %self.max_bytes
+                if datasize < ICONDIR.size:
+                        return "Icon/Cursor error: invalid `.ico` / `.cur`."
+                _, identf, count = ICONDIR.unpack_from(self.data_icocur)
+                if identf not in [1, 2]:
+                        return "Icon/Cursor error: invalid `.ico` / `.cur`."
 
-                        for self.index, self.path_icocur in enumerate(self.paths_icocurs):
-                                if isinstance(self.path_icocur, str):
-                                        if isfile(self.path_icocur):
-                                                self.work()
-                                        else:
-                                                if isdir(self.path_icocur):
-                                                        temp = self.path_icocur
-                                                        for file in sorted(listdir(self.path_icocur)):
-                                                                self.path_icocur = join(self.path_icocur, file)
-                                                                self.work()
-                                                                self.path_icocur = temp
-                                                else:
-                                                        self.all_icocur_readed.update({self.path_icocur : "Input error: file/directory not found."})
-                                elif isinstance(self.path_icocur, bytes):
-                                        self.data_icocur = self.path_icocur
-                                        self.path_icocur = "stream_%s" %self.index
-                                        self.work(is_byte = True)
-                                else:
-                                        self.all_icocur_readed.update({self.path_icocur : "Input error: neither a file/directory nor bytes."})
-                else:
-                        print_err("Input error: `.ico` / `.cur` file path/s not a list.")
+                typ = {1 : 'ICO',
+                       2 : 'CUR'}[identf]
+                tablesize = ICONDIR.size + ICONDIRENTRY.size * count
+                if count == 0:
+                        return "Icon/Cursor error: invalid %s, no images." %typ
+                if tablesize > datasize:
+                        return "Icon/Cursor error: invalid %s, unexpected EOF." %typ
+
+                totalsize, pixels = 0, 0
+                for cnt, (_, _, _, _, _, _, dWBytesInRes, dWImageOffset) in \
+                                enumerate(ICONDIRENTRY.iter_unpack(memoryview(self.data_icocur)[ICONDIR.size : tablesize])):
+                        if dWImageOffset < tablesize or dWImageOffset + dWBytesInRes > datasize:
+                                return "Icon/Cursor error: invalid %s, image_%s out of file." %(typ, cnt)
+                        totalsize += (dWImageOffset + dWBytesInRes if cnt == 0 else dWBytesInRes)
+
+                        if self.is_png(self.data_icocur[dWImageOffset : dWImageOffset + 8]):
+                                if dWBytesInRes < 16 + IHDR_SIZE.size:
+                                        return "Icon/Cursor error: invalid %s, image_%s truncated." %(typ, cnt)
+                                width, height = IHDR_SIZE.unpack_from(self.data_icocur, dWImageOffset + 16)
+                        else:
+                                if dWBytesInRes < BITMAPINFOHEADER.size:
+                                        return "Icon/Cursor error: invalid %s, image_%s truncated." %(typ, cnt)
+                                header = BITMAPINFOHEADER.unpack_from(self.data_icocur, dWImageOffset)
+                                biSize, width, height, _, biBitCount, biClrUsed = header[0 : 5] + header[9 : 10]
+                                height = int(height / 2.)
+                                ## Claimed dimensions must fit in the image data: header, palette (RGBQUAD entries),
+                                ## XOR and AND masks (the AND mask is absent only for PNGs).
+                                size = biSize + calc_rowsize(biBitCount, width) * height
+                                if biBitCount in [1, 2, 4, 8, 16, 24, 32]:
+                                        # other depths are rejected as malformed when read.
+                                        size += (4 * (biClrUsed or 2 ** biBitCount) if biBitCount <= 8 else 0) + calc_masksize(width) * height
+                                if size > dWBytesInRes:
+                                        return "Icon/Cursor error: invalid %s, image_%s truncated." %(typ, cnt)
+                        pixels += width * height
+
+                if self.max_pixels and pixels > self.max_pixels:
+                        return "Icon/Cursor error: images larger than %s pixels." %self.max_pixels
+                if datasize != totalsize:
+                        return "Icon/Cursor error: invalid %s, unexpected EOF." %typ
 
         def extract(self, dataimage, offset):
                 """ Gets bitmap parameters. """
@@ -333,7 +1194,7 @@ class Decode(object):
 
                 ## Get BITMAPINFO header data.
                 (biSize, biWidth, biHeight, biPlanes, biBitCount,
-                biCompression, biSizeImage, biXPelsPerMeter, biYPelsPerMeter, biClrUsed, biClrImportant) = unpack_from('<3L2H6L', dataimage[0 : 40])
+                biCompression, biSizeImage, biXPelsPerMeter, biYPelsPerMeter, biClrUsed, biClrImportant) = BITMAPINFOHEADER.unpack_from(dataimage)
 
                 biHeight = int(biHeight / 2.)
                 ## Get palette, xor & and mask.
@@ -347,47 +1208,48 @@ class Decode(object):
                 xordata = dataimage[biSize + palettesize : biSize + palettesize + xorsize]
                 anddata = dataimage[biSize + palettesize + xorsize : len(dataimage)]
 
-                self.parameters = {"head"      : biSize,
-                                   "width"     : biWidth,
-                                   "height"    : biHeight,
-                                   "planes"    : biPlanes,
-                                   "bpp"       : biBitCount,
-                                   "compress"  : biCompression,
-                                   "size_img"  : biSizeImage,
-                                   "colors"    : biClrUsed,
-                                   "size_pal"  : palettesize,
-                                   "num_pal"   : 0,
-                                   "palette"   : palette,
-                                   "size_xor"  : xorsize,
-                                   "xor"       : xordata,
-                                   "size_and"  : andsize,
-                                   "and"       : anddata
-                                   }
+                self.parameters = BmpParameters(head     = biSize,
+                                                width    = biWidth,
+                                                height   = biHeight,
+                                                planes   = biPlanes,
+                                                bpp      = biBitCount,
+                                                compress = biCompression,
+                                                size_img = biSizeImage,
+                                                colors   = biClrUsed,
+                                                size_pal = palettesize,
+                                                num_pal  = 0,
+                                                palette  = palette,
+                                                size_xor = xorsize,
+                                                xor      = xordata,
+                                                size_and = andsize,
+                                                and_     = anddata)
 
         def load(self):
-                """ Gets image from bytes. """
+                """ Gets image from bytes: every depth is unpacked once (true-color straight to RGBA), then AND mask is put as alpha. """
                 modes = {32 : ("RGBA", "BGRA"),
-                         24 : ("RGB",  "BGR"),
-                         16 : ("RGB",  "BGR"),
+                         24 : ("RGBA", "BGR"),
+                         16 : ("RGBA", "BGR"),
                          8  : ("P",    "P"),
                          4  : ("P",    "P;4"),
                          2  : ("P",    "P;2"),
                          1  : ("P",    "P;1")}
 
-                if self.is_gray():
+                # without palette, indices are gray levels.
+                if not self.parameters.palette:
                         modes.update({8 : ("L", "L"),
                                       4 : ("L", "L;4"),
                                       2 : ("L", "L;2"),
                                       1 : ("1", "1")})
 
-                pad_msk = calc_masksize(self.parameters['width'])
+                pad_msk = calc_masksize(self.parameters.width)
 
-                if self.parameters['bpp'] == 16:
+                if self.parameters.bpp == 16:
                         # PIL I;16 converted to RGB555 format.
-                        pad_ima = calc_rowsize(24, self.parameters['width'])
+                        # every 16 bits word (row padding too) becomes 3 bytes.
+                        pad_ima = calc_rowsize(16, self.parameters.width) // 2 * 3
                         dataimage = []
-                        for i in range(0, len(self.parameters['xor']), 2):
-                                data = int.from_bytes(self.parameters['xor'][i : i + 2], byteorder = 'little')
+                        for i in range(0, len(self.parameters.xor), 2):
+                                data = int.from_bytes(self.parameters.xor[i : i + 2], byteorder = 'little')
                                 a = (data & 0x8000) >> 15
                                 b = (data & 0x7C00) >> 10
                                 g = (data & 0x3E0) >> 5
@@ -399,86 +1261,151 @@ class Decode(object):
                                 dataimage.append((value).to_bytes(3, byteorder = 'little'))
 
                         dataimage = b"".join(dataimage)
-                        image = Image.frombytes(modes[self.parameters['bpp']][0], (self.parameters['width'], self.parameters['height']),
-                                                dataimage, 'raw', modes[self.parameters['bpp']][1], pad_ima, -1)
+                        image = Image.frombytes(modes[self.parameters.bpp][0], (self.parameters.width, self.parameters.height),
+                                                dataimage, 'raw', modes[self.parameters.bpp][1], pad_ima, -1)
                 else:
-                        pad_ima = calc_rowsize(self.parameters['bpp'], self.parameters['width'])
-                        image = Image.frombytes(modes[self.parameters['bpp']][0], (self.parameters['width'], self.parameters['height']),
-                                                self.parameters['xor'], 'raw', modes[self.parameters['bpp']][1], pad_ima, -1)
+                        pad_ima = calc_rowsize(self.parameters.bpp, self.parameters.width)
+                        image = Image.frombytes(modes[self.parameters.bpp][0], (self.parameters.width, self.parameters.height),
+                                                self.parameters.xor, 'raw', modes[self.parameters.bpp][1], pad_ima, -1)
 
-                if self.parameters['bpp'] == 32:
-                        mask = Image.frombuffer("L", (self.parameters['width'], self.parameters['height']),
-                                                self.parameters['xor'][3::4], 'raw', 'L', 0, -1)
-                else:
-                        mask = Image.frombuffer("1", (self.parameters['width'], self.parameters['height']),
-                                                self.parameters['and'], 'raw', '1;I', pad_msk, -1)
+                if self.parameters.bpp == 32:
+                        # alpha channel is in BGRA data.
+                        return image
 
-                if self.parameters['palette'] and self.parameters['bpp'] <= 8:
-                        image = image.convert('P')
-                        palette_int = [self.parameters['palette'][i : i + 3] for i in range(0, self.parameters['size_pal'], 4)]
-                        rsv = [self.parameters['palette'][i + 3 : i + 4] for i in range(0, self.parameters['size_pal'], 4)]
+                if self.parameters.palette and self.parameters.bpp <= 8:
+                        palette_int = [self.parameters.palette[i : i + 3] for i in range(0, self.parameters.size_pal, 4)]
+                        rsv = [self.parameters.palette[i + 3 : i + 4] for i in range(0, self.parameters.size_pal, 4)]
 
-                        if (self.parameters['size_pal'] % 3 == 0) and (self.parameters['size_pal'] % 4 == 0):
+                        if (self.parameters.size_pal % 3 == 0) and (self.parameters.size_pal % 4 == 0):
                                 if len(set(rsv)) <= 1:
                                         # palette RGBA.
                                         palette_int = [pal[i] for pal in palette_int for i in reversed(range(3))]
-                                        self.parameters['num_pal'] = self.parameters['size_pal'] // 4
+                                        self.parameters.num_pal = self.parameters.size_pal // 4
                                 else:
                                         # palette RGB.
-                                        palette_int = [pal for pal in self.parameters['palette'][::-1]]
-                                        self.parameters['num_pal'] = self.parameters['size_pal'] // 3
+                                        palette_int = [pal for pal in self.parameters.palette[::-1]]
+                                        self.parameters.num_pal = self.parameters.size_pal // 3
                         else:
-                                if self.parameters['size_pal'] % 3 == 0:
+                                if self.parameters.size_pal % 3 == 0:
                                         # palette RGB.
-                                        palette_int = [pal for pal in self.parameters['palette'][::-1]]
-                                        self.parameters['num_pal'] = self.parameters['size_pal'] // 3
-                                elif self.parameters['size_pal'] % 4 == 0:
+                                        palette_int = [pal for pal in self.parameters.palette[::-1]]
+                                        self.parameters.num_pal = self.parameters.size_pal // 3
+                                elif self.parameters.size_pal % 4 == 0:
                                         # palette RGBA.
                                         palette_int = [pal[i] for pal in palette_int for i in reversed(range(3))]
-                                        self.parameters['num_pal'] = self.parameters['size_pal'] // 4
+                                        self.parameters.num_pal = self.parameters.size_pal // 4
 
                         ## PIL is wonky with next RGBA conversion,
                         ## if the palette isn't complete (768 values) for bilevel.
-                        if self.parameters['bpp'] == 1:
-                                pal = list(image.palette.getdata()[1])
-                                pal[:3], pal[-3:] = palette_int[:3], palette_int[-3:]
-                                palette_int = pal
+                        if self.parameters.bpp == 1:
+                                palette_int = palette_int[: 6] + [0] * 762
                         # Assign palette.
                         image.putpalette(palette_int)
 
-                image = image.convert('RGBA')
-                image.putalpha(mask)
+                if image.mode != 'RGBA':
+                        image = image.convert('RGBA')
+                image.putalpha(Image.frombuffer("1", (self.parameters.width, self.parameters.height),
+                                                self.parameters.and_, 'raw', '1;I', pad_msk, -1))
 
                 return image
 
-        def from_icocur(self):
-                """ Reads an `.ico` / `.cur` file and checks whether it's acceptable. """
-                def add_warning(dict_icocur, num, msg):
-                        if 'warning' in dict_icocur['image_%s' %num]:
-                                dict_icocur['image_%s' %num]['warning'].append(msg)
+        def load_array(self):
+                """ Gets image from bytes as a (height, width, 4) RGBA array, unpacked straight from palette, XOR and AND masks. """
+                np = numpy_module()
+                width, height, bpp = self.parameters.width, self.parameters.height, self.parameters.bpp
+                # bottom-up rows.
+                rows = np.frombuffer(self.parameters.xor, np.uint8, calc_rowsize(bpp, width) * height).reshape(height, -1)[::-1]
+                pixels = np.empty((height, width, 4), np.uint8)
+
+                if bpp == 32:
+                        pixels[...] = rows[:, : 4 * width].reshape(height, width, 4)[..., [2, 1, 0, 3]]
+                        return pixels
+                elif bpp == 24:
+                        pixels[..., : 3] = rows[:, : 3 * width].reshape(height, width, 3)[..., ::-1]
+                elif bpp == 16:
+                        # RGB555 (as `load`).
+                        data = np.ascontiguousarray(rows[:, : 2 * width]).view('<u2')
+                        for channel, shift in enumerate([0, 5, 10]):
+                                value = ((data >> shift) & 0x1F).astype(np.uint8)
+                                pixels[..., channel] = (value << 3) | (value >> 2)
+                else:
+                        if bpp == 8:
+                                indices = rows[:, : width]
                         else:
-                                dict_icocur['image_%s' %num].update({'warning' : [msg]})
-
-                icocur_readed = {}
-                typ = {1 : 'ICO',
-                       2 : 'CUR'}
-                datasize = len(self.data_icocur)
-                identf, count = unpack_from('<2H', self.data_icocur[2 : 6])
+                                bits = np.unpackbits(rows, axis = 1)[:, : width * bpp].reshape(height, width, bpp)
+                                indices = (bits << np.arange(bpp - 1, -1, -1, dtype = np.uint8)).sum(axis = 2, dtype = np.uint8)
+                        lut = np.zeros((256, 3), np.uint8)
+                        palette = self.parameters.palette
+                        if palette:
+                                # palette BGRA (or BGR), as `load`.
+                                rsv = {palette[i + 3 : i + 4] for i in range(0, self.parameters.size_pal, 4)}
+                                if self.parameters.size_pal % 4 == 0 and (len(rsv) <= 1 or self.parameters.size_pal % 3 != 0):
+                                        step = 4
+                                else:
+                                        step = 3
+                                self.parameters.num_pal = min(self.parameters.size_pal // step, 256)
+                                colors = np.frombuffer(palette, np.uint8, self.parameters.num_pal * step).reshape(-1, step)
+                                lut[: self.parameters.num_pal] = colors[:, 2::-1]
+                        else:
+                                # grayscale levels.
+                                lut[: 1 << bpp] = (np.arange(1 << bpp) * 255 // ((1 << bpp) - 1))[:, None]
+                        pixels[..., : 3] = lut[indices]
+
+                masksize = calc_masksize(width)
+                mask = np.frombuffer(self.parameters.and_, np.uint8, masksize * height).reshape(height, masksize)[::-1]
+                pixels[..., 3] = np.unpackbits(mask, axis = 1)[:, : width] * np.uint8(255) ^ np.uint8(255)
+                return pixels
+
+        def load_forced(self, entry):
+                """ Converts image of an entry to the depth of option `force_to`.
+                    Below 32 bits transparency is kept binary (as AND mask, see `flatten_alpha`):
+                    indexed images get `transparency` (their black entry), 24 bits images get back a binary alpha.
+                """
+                image, alpha = entry.im_obj, None
+                if self.force_to[0] < 32:
+                        image, alpha = flatten_alpha(image)
+                        if alpha is not None:
+                                levels = entry.im_obj.convert('RGBA').getchannel('A').getcolors(2)
+                                if levels is None or not {level for _, level in levels} <= {0, 255}:
+                                        entry.warn("Partial transparency turned binary by `force_to` ! Use 32 bits to keep it.")
+
+                image = force_depth(image, self.force_to, alpha)
+                if alpha is not None:
+                        if image.mode == 'P':
+                                image.info['transparency'] = len(image.getpalette()) // 3 - 1
+                        else:
+                                image = image.convert('RGBA')
+                                image.putalpha(alpha)
+                return image
 
-                ## Control if it's a `.ico` / `.cur` type and extract values.
-                if identf not in [1, 2]:
-                        self.all_icocur_readed.update({self.path_icocur : "Icon/Cursor error: invalid `.ico` / `.cur`."})
-                        return
-                else:
-                        if identf == 1 and self.path_icocur.endswith('.cur'):
-                                msg = "Not a real `.cur` ! It's an icon with extension `.cur`."
-                                icocur_readed.update({'warning' : [msg]})
-                        elif identf == 2 and self.path_icocur.endswith('.ico'):
-                                msg = "Not a real `.ico` ! It's a cursor with extension `.ico`."
-                                icocur_readed.update({'warning' : [msg]})
+        def to_output(self, entry):
+                """ Gets pixels of an entry as option `output` wants (array or buffer), its image is dropped. """
+                if entry.pixels is None:
+                        image = entry.im_obj.convert('RGBA')
+                        if self.output == 'array':
+                                entry.pixels = numpy_module().array(image)
+                        else:
+                                entry.pixels = memoryview(image.tobytes()).cast('B', (image.height, image.width, 4))
+                elif self.output == 'buffer':
+                        entry.pixels = memoryview(entry.pixels)
+                entry.im_obj = None
+
+        def read(self):
+                """ Reads the `.ico` / `.cur` and checks whether it's acceptable. """
+                icocur_readed = IconFileResult(path = self.path_icocur, entries = [])
+                ## Control if it's an acceptable `.ico` / `.cur` type and extract values.
+                error = self.validate()
+                if error:
+                        return IconFileResult(path = self.path_icocur, error = error)
+
+                _, identf, count = ICONDIR.unpack_from(self.data_icocur)
+                if identf == 1 and self.path_icocur.endswith('.cur'):
+                        icocur_readed.warning = ["Not a real `.cur` ! It's an icon with extension `.cur`."]
+                elif identf == 2 and self.path_icocur.endswith('.ico'):
+                        icocur_readed.warning = ["Not a real `.ico` ! It's a cursor with extension `.ico`."]
 
                 ## Note: always one frame for `.cur`.
-                icondirentries = [unpack_from('<4B2H2L', self.data_icocur[6 + 16 * i : 22 + 16 * i]) for i in range(count)]
+                icondirentries = list(ICONDIRENTRY.iter_unpack(memoryview(self.data_icocur)[ICONDIR.size : ICONDIR.size + ICONDIRENTRY.size * count]))
 
                 for cnt in range(count):
                         # Should be:
@@ -486,72 +1413,75 @@ class Decode(object):
                         # wBitCount = 0 (if not used)
                         # dwBytesInRes is the total number of bytes in the image data, including palette data
                         # dwImageOffset is offset from the beginning of the file to the image data
-                        icocur_readed.update({'image_%s' %cnt: {}})
+                        entry = IconEntry()
+                        icocur_readed.entries.append(entry)
 
                         bWidth, bHeight, bColorCount, bReserved, \
                                 wPlanes_or_wXHotSpot, wBitCount_or_wYHotSpot, dWBytesInRes, dWImageOffset = icondirentries[cnt]
                         bWidth = bWidth or 256
                         bHeight = bHeight or 256
 
-                        if cnt == 0:
-                                totalsize = dWImageOffset + dWBytesInRes
-                        else:
-                                totalsize += dWBytesInRes
-
                         icocurdata_with_header = self.data_icocur[dWImageOffset : dWImageOffset + dWBytesInRes]
                         png_flag = self.is_png(icocurdata_with_header)
 
                         if not png_flag:
                                 if bWidth >= 256 or bHeight >= 256:
-                                        add_warning(icocur_readed, cnt, "Is a large uncompressed `bmp` ! Should be `png` format.")
+                                        entry.warn("Is a large uncompressed `bmp` ! Should be `png` format.")
 
                                 ## Get bmp parameters.
                                 self.extract(icocurdata_with_header, dWBytesInRes)
                                 ## Get mask and check it.
-                                self.parameters, chk = Mask().rebuild_AND_mask(icocurdata_with_header, self.parameters, self.rebuild)
+                                with self.timings.stage('mask'):
+                                        ## Pixels are checked at once when NumPy is loaded anyway (array / buffer output).
+                                        np = (numpy_module() if self.output != 'image' else None)
+                                        self.parameters, chk = Mask().rebuild_AND_mask(icocurdata_with_header, self.parameters, self.rebuild, np)
                                 if not chk:
-                                        add_warning(icocur_readed, cnt, "Bad mask found ! Will display incorrectly in some places (Windows).")
+                                        entry.warn("Bad mask found ! Will display incorrectly in some places (Windows).")
 
                                 ## Other checks.
                                 try:
-                                        assert bWidth == self.parameters['width'], ('width')
-                                        assert bHeight == self.parameters['height'], ('height')
+                                        assert bWidth == self.parameters.width, ('width')
+                                        assert bHeight == self.parameters.height, ('height')
                                         if identf == 1:
-                                                assert (wPlanes_or_wXHotSpot in [0, 1]) and (self.parameters['planes'] == 1), ('planes')
-                                                assert (wBitCount_or_wYHotSpot == 0) or (wBitCount_or_wYHotSpot == self.parameters['bpp']), ('bits')
-                                        assert self.parameters['compress'] == 0, ('compression')
-                                        if (self.parameters['size_img'] != 0) and \
-                                           (self.parameters['size_img'] != self.parameters['size_xor'] + self.parameters['size_and']):
+                                                assert (wPlanes_or_wXHotSpot in [0, 1]) and (self.parameters.planes == 1), ('planes')
+                                                assert (wBitCount_or_wYHotSpot == 0) or (wBitCount_or_wYHotSpot == self.parameters.bpp), ('bits')
+                                        assert self.parameters.compress == 0, ('compression')
+                                        if (self.parameters.size_img != 0) and \
+                                           (self.parameters.size_img != self.parameters.size_xor + self.parameters.size_and):
                                                 # it seems legal to put a wrong 'size_img' !
-                                                add_warning(icocur_readed, cnt, "Size image malformed value !")
+                                                entry.warn("Size image malformed value !")
 
-                                        assert (bColorCount == self.parameters['colors']) or \
-                                               (bColorCount == 0 and self.parameters['colors'] == 1 << wBitCount_or_wYHotSpot) or \
-                                               (bColorCount == 0 and self.parameters['colors'] == 1 << self.parameters['bpp']) or \
-                                               (bColorCount == 1 << wBitCount_or_wYHotSpot and self.parameters['colors'] == 0) or \
-                                               (bColorCount == 1 << self.parameters['bpp'] and self.parameters['colors'] == 0), ('color count')
+                                        assert (bColorCount == self.parameters.colors) or \
+                                               (bColorCount == 0 and self.parameters.colors == 1 << wBitCount_or_wYHotSpot) or \
+                                               (bColorCount == 0 and self.parameters.colors == 1 << self.parameters.bpp) or \
+                                               (bColorCount == 1 << wBitCount_or_wYHotSpot and self.parameters.colors == 0) or \
+                                               (bColorCount == 1 << self.parameters.bpp and self.parameters.colors == 0), ('color count')
                                 except AssertionError as e:
-                                        icocur_readed.update({'image_%s' %cnt : "Image error: malformed %s." %e.args[0]})
+                                        entry.error = "Image error: malformed %s." %e.args[0]
                                         continue
 
                                 try:
-                                        image = self.load()
-                                        icocur_readed['image_%s' %cnt].update({'im_obj' : image,
-                                                                               'depth'  : self.parameters['bpp']})
-                                        if self.parameters['num_pal'] > 0:
-                                                icocur_readed['image_%s' %cnt].update({'num_pal' : self.parameters['num_pal']})
+                                        with self.timings.stage('load'):
+                                                if self.unpack:
+                                                        entry.pixels = self.load_array()
+                                                else:
+                                                        entry.im_obj = self.load()
+                                        entry.depth = self.parameters.bpp
+                                        if self.parameters.num_pal > 0:
+                                                entry.num_pal = self.parameters.num_pal
                                 except:
-                                        icocur_readed.update({'image_%s' %cnt : "Image error: image not supported."})
+                                        entry.error = "Image error: image not supported."
                                         continue
 
                         elif png_flag:
                                 icocurdata = BytesIO(icocurdata_with_header)
-                                image = Image.open(icocurdata)
+                                with self.timings.stage('load'):
+                                        image = Image.open(icocurdata)
 
                                 if image:
                                         w, h = image.size
                                         icocurdata = icocurdata.getvalue()
-                                        bitdepth, colortype = unpack_from('<2B', icocurdata[24 : 26])
+                                        bitdepth, colortype = unpack_from('<2B', icocurdata, 24)
                                         bpp = len(image.getbands()) * bitdepth
 
                                         ## Other checks.
@@ -565,15 +1495,14 @@ class Decode(object):
                                                 elif identf == 2:
                                                         assert bColorCount == 0, ('color count')
                                         except AssertionError as e:
-                                                icocur_readed.update({'image_%s' %cnt : "Image error: malformed %s." %e.args[0]})
+                                                entry.error = "Image error: malformed %s." %e.args[0]
                                                 continue
 
-                                        icocur_readed['image_%s' %cnt].update({'info' : {'format' : "`png` compressed"}})
+                                        entry.info = {'format' : "`png` compressed"}
                                         if image.info:
-                                                icocur_readed['image_%s' %cnt]['info'].update(image.info)
+                                                entry.info.update(image.info)
 
-                                        icocur_readed['image_%s' %cnt].update({'im_obj' : image,
-                                                                               'depth'  : bpp})
+                                        entry.im_obj, entry.depth = image, bpp
 
                                         if image.palette:
                                                 modepal, palette = image.palette.getdata()
@@ -582,61 +1511,363 @@ class Decode(object):
                                                 elif modepal in ['RGBA', 'RGBA;L']:
                                                         palettenum = int(len(palette) / 4)
 
-                                                icocur_readed['image_%s' %cnt].update({'num_pal' : palettenum})
+                                                entry.num_pal = palettenum
                         else:
-                                icocur_readed.update({'image_%s' %cnt : "Image error: neither `bmp` nor `png`."})
+                                entry.error = "Image error: neither `bmp` nor `png`."
                                 continue
 
-                        if identf == 2:
-                                icocur_readed['image_%s' %cnt].update({'hotspot_x' : wPlanes_or_wXHotSpot,
-                                                                       'hotspot_y' : wBitCount_or_wYHotSpot})
+                        if self.force_to != 'original':
+                                with self.timings.stage('quantize'):
+                                        entry.im_obj = self.load_forced(entry)
+                                entry.new_depth = self.force_to[0]
 
-                if datasize != totalsize:
-                        self.all_icocur_readed.update({self.path_icocur : "Icon/Cursor error: invalid %s, unexpected EOF." %typ[identf]})
-                        return
+                        if self.output != 'image':
+                                with self.timings.stage('load'):
+                                        self.to_output(entry)
+
+                        if identf == 2:
+                                entry.hotspot_x, entry.hotspot_y = wPlanes_or_wXHotSpot, wBitCount_or_wYHotSpot
 
                 return icocur_readed
 
+def decode_bytes(data, path = 'stream', rebuild = False, force_to = 'original', max_bytes = 16 << 20, max_pixels = 1 << 24, timings = None,
+                 output = 'image'):
+        """ Decodes `.ico` / `.cur` bytes to an `IconFileResult` (`error` set if not acceptable).
+            Entries get `im_obj` (PIL image), or `pixels` as (height, width, 4) RGBA NumPy array (`output` = 'array')
+            or memoryview (`output` = 'buffer').
+            Reentrant: can be called concurrently (e.g. from a thread pool); invalid options raise `ValueError`.
+        """
+        error = check_decode_output(output)
+        if error:
+                raise ValueError(error)
+        if not isinstance(data, (bytes, bytearray)):
+                raise ValueError("Input error: `.ico` / `.cur` data not bytes.")
+        if not isinstance(rebuild, bool):
+                raise ValueError("Input error: option 'rebuild' not a boolean.")
+        force = parse_force_to(force_to)
+        if force is None:
+                raise ValueError("Input error: option `force_to` not proper defined.")
+        for limit, value in [('max_bytes', max_bytes), ('max_pixels', max_pixels)]:
+                if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+                        raise ValueError("Input error: option `%s` not a positive integer." %limit)
+        return IconReader(bytes(data), path, rebuild, force, max_bytes, max_pixels, timings, output).read()
+
+def decode_batch(datas, size = 32, out = None, rebuild = False, resample = 'lanczos', max_bytes = 16 << 20, max_pixels = 1 << 24):
+        """ Decodes many `.ico` / `.cur` (bytes) into one (N, size, size, 4) RGBA NumPy array (allocated if `out` is None).
+            Row i gets the entry of icon i of that size (the deepest one), else its largest entry resized.
+            Gets the array and, for every icon, the index of the entry used (None if nothing decoded, row is zeroed).
+        """
+        error = check_decode_output('array')
+        if error:
+                raise ValueError(error)
+        np = numpy_module()
+        if out is None:
+                out = np.zeros((len(datas), size, size, 4), np.uint8)
+        elif not isinstance(out, np.ndarray) or out.shape != (len(datas), size, size, 4) or out.dtype != np.uint8:
+                raise ValueError("Input error: option `out` not a (N, size, size, 4) uint8 array.")
+        if resample not in resize_filters:
+                raise ValueError("Input error: option `resample` unknown '%s' filter." %resample)
+
+        picked = []
+        for indx, data in enumerate(datas):
+                result = decode_bytes(data, 'stream_%s' %indx, rebuild, 'original', max_bytes, max_pixels, output = 'array')
+                entries = [(cnt, entry) for cnt, entry in enumerate(result.entries or []) if entry.error is None]
+                if not entries:
+                        out[indx] = 0
+                        picked.append(None)
+                        continue
+                exact = [(cnt, entry) for cnt, entry in entries if entry.pixels.shape[:2] == (size, size)]
+                if exact:
+                        cnt, entry = max(exact, key = lambda item: item[1].depth)
+                        out[indx] = entry.pixels
+                else:
+                        cnt, entry = max(entries, key = lambda item: (item[1].pixels.shape[0] * item[1].pixels.shape[1], item[1].depth))
+                        out[indx] = np.asarray(Image.fromarray(entry.pixels).resize((size, size), resize_filters[resample]))
+                picked.append(cnt)
+        return out, picked
+
+class Decode(object):
+
+        def __init__(self, paths_icocurs, paths_image = [], names_image = [], formats_image = [],
+                     rebuild = False, force_to = 'original', manifest = None, profile = False,
+                     max_bytes = 16 << 20, max_pixels = 1 << 24, recursive = False, include = [], exclude = [], archive = None,
+                     atlas = None, atlas_size = (1024, 1024), atlas_only = None,
+                     phash_index = None, phash_distance = 6, phash_insert = True, output = 'image', is_cli = False):
+
+                """
+                    `paths_icocurs`   : a list   : can contain one/more icon/cursor(s) path(s)
+                                                   and/or one/more folder icon/cursor(s) path(s)
+                                                   and/or one/more zip / tar archive(s) path(s) (members are read without extraction)
+                                                   and/or one/more PE binary(ies) path(s) (icon / cursor groups of resources) to convert.
+                    `paths_image`     : a list   : contains output path(s) for every resulting conversion.
+                                                   If `paths_image` isn't defined, working directory is used.
+                    `names_image`     : a list   : contains output name(s) for every resulting conversion.
+                    `formats_image`   : a list   : contains format(s) for every resulting conversion (all saving PIL formats).
+                    `rebuild`         : a bool   : if 'True', recompute mask from the alpha channel data.
+                    `force_to`        : a string, int or tuple : if 'original', original bit depth is kept,
+                                                                 if 1, 4, 8, 24, 32 decoded images are converted to that bit depth
+                                                                 (for tuple format see `Encode`); below 32 bits transparency
+                                                                 is kept binary (partial alpha is warned).
+                    `manifest`        : a string : path of a manifest file enabling incremental mode (see `Encode`).
+                    `profile`         : a bool or callable : if 'True', time spent per stage is collected (see `Encode`).
+                    `max_bytes`       : an int   : maximum size of an icon/cursor file (None for no limit).
+                    `max_pixels`      : an int   : maximum number of pixels of all images of an icon/cursor (None for no limit).
+                    `recursive`       : a bool   : if 'True', subfolders of folder paths are decoded too.
+                    `include`         : a list   : globs of files decoded from folders (relative paths), all if empty.
+                    `exclude`         : a list   : globs of files / subfolders skipped in folders (relative paths).
+                    `archive`         : a string : path of a zip / tar archive where decoded images are written
+                                                   (`paths_image` are folders inside it).
+                    `atlas`           : a string : path prefix of `.png` sprite sheets (`<atlas>_N.png`) and their index (`<atlas>.json`)
+                                                   where decoded images are packed, instead of being saved one per file.
+                    `atlas_size`      : a tuple  : (width, height) of sprite sheets.
+                    `atlas_only`      : an int or tuple : only images of that size (side or (width, height)) are packed.
+                    `phash_index`     : a string or PerceptualIndex : index (or its file path) of perceptual hashes;
+                                                   decoded images get their hash and the indexed near-duplicates.
+                    `phash_distance`  : an int   : maximum Hamming distance (of 64 bits) of near-duplicates.
+                    `phash_insert`    : a bool   : if 'True', decoded images are added to the index (else only searched).
+                    `output`          : a string : 'image' (entries get a PIL image `im_obj`), 'array' (entries get `pixels`,
+                                                   a (height, width, 4) RGBA NumPy array) or 'buffer' (`pixels` as a memoryview);
+                                                   arrays / buffers are kept in results only (not saved).
+                    `is_cli`          : a bool   : if 'True', messages are printed on console (command line).
+                """
+
+                # lists are copied, checks fill them in place.
+                self.paths_icocurs = paths_icocurs
+                self.paths_image = (list(paths_image) if isinstance(paths_image, list) else paths_image)
+                self.formats_image = (list(formats_image) if isinstance(formats_image, list) else formats_image)
+                self.names_image = (list(names_image) if isinstance(names_image, list) else names_image)
+                self.rebuild = rebuild
+                self.force_to = force_to
+                self.manifest = open_manifest(manifest)
+                self.timings = Timings(profile)
+                self.max_bytes = max_bytes
+                self.max_pixels = max_pixels
+                self.recursive, self.include, self.exclude = recursive, include, exclude
+                self.archive = archive
+                self.atlas, self.atlas_size, self.atlas_only = atlas, atlas_size, atlas_only
+                self.phash_index = open_phash_index(phash_index)
+                self.phash_distance, self.phash_insert = phash_distance, phash_insert
+                self.output = output
+                self.is_cli = is_cli
+                self.want_save = (False if all(x == [] for x in [self.paths_image, self.names_image, self.formats_image]) \
+                                  and not (archive or atlas) else True)
+                self.build()
+
+        def check_output(self):
+                """ Verifies if output paths, names, formats are ok. """
+                ## Check rebuild option.
+                if not isinstance(self.rebuild, bool):
+                        raise ValueError("Input error: option 'rebuild' not a boolean.")
+                ## Check force_to option.
+                force_to = parse_force_to(self.force_to)
+                if force_to is None:
+                        raise ValueError("Input error: option `force_to` not proper defined.")
+                self.force_to = force_to
+                ## Check limits.
+                for limit in ['max_bytes', 'max_pixels']:
+                        value = getattr(self, limit)
+                        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+                                raise ValueError("Input error: option `%s` not a positive integer." %limit)
+                ## Check folder scanning options.
+                check_scan(self.recursive, self.include, self.exclude)
+                if self.archive is not None and not is_archive(self.archive):
+                        raise ValueError("Input error: option `archive` not a zip / tar path.")
+                ## Check atlas options.
+                if isinstance(self.atlas_only, int):
+                        self.atlas_only = (self.atlas_only, self.atlas_only)
+                if self.atlas is not None:
+                        if not isinstance(self.atlas, str) or not self.atlas:
+                                raise ValueError("Input error: option `atlas` not a path prefix.")
+                        if not self.archive and not isdir(dirname(abspath(self.atlas))):
+                                raise ValueError("Input error: atlas directory path '%s' not found." %dirname(abspath(self.atlas)))
+                        if not (isinstance(self.atlas_size, tuple) and len(self.atlas_size) == 2 and \
+                                all(isinstance(side, int) and side > 0 for side in self.atlas_size)):
+                                raise ValueError("Input error: option `atlas_size` not proper defined.")
+                        if self.atlas_only is not None and not (isinstance(self.atlas_only, tuple) and len(self.atlas_only) == 2):
+                                raise ValueError("Input error: option `atlas_only` not proper defined.")
+                ## Check output option.
+                error = check_decode_output(self.output)
+                if error:
+                        raise ValueError(error)
+                if self.output != 'image' and (self.want_save or self.atlas or self.phash_index is not None):
+                        raise ValueError("Input error: option `output` '%s' keeps pixels in results, not saved / packed / indexed." %self.output)
+                ## Check perceptual index options.
+                if self.phash_index is not None:
+                        if not isinstance(self.phash_index, PerceptualIndex):
+                                raise ValueError("Input error: option `phash_index` not a path or a PerceptualIndex.")
+                        if not isinstance(self.phash_distance, int) or isinstance(self.phash_distance, bool) or \
+                           not 0 <= self.phash_distance <= 64:
+                                raise ValueError("Input error: option `phash_distance` not an integer in [0, 64].")
+                        if not isinstance(self.phash_insert, bool):
+                                raise ValueError("Input error: option 'phash_insert' not a boolean.")
+
+                ## Checks paths.
+                if self.archive:
+                        Check(self.paths_icocurs, self.paths_image).members("image", self.archive)
+                else:
+                        Check(self.paths_icocurs, self.paths_image).paths("image")
+                ## Check names.
+                Check(self.paths_icocurs, self.names_image).names("image")
+                ## Check formats.
+                Check(self.paths_icocurs, self.formats_image).formats("image", ".png")
+
+        def build(self):
+                """ Verifies if input paths are ok and starts conversion job. """
+                self.print_std = partial(print_std, view = self.is_cli)
+                self.print_err = partial(print_err, view = self.is_cli)
+
+                ## Checks paths `.ico` / `.cur` files (Input).
+                if not self.paths_icocurs:
+                        raise ValueError("Input error: `.ico` / `.cur` file path/s missing.")
+
+                if isinstance(self.paths_icocurs, list):
+                        self.check_output()
+                        self.remind = {}
+                        # records (see `results`) and their view in the original dict shape.
+                        self.results = {}
+                        self.all_icocur_readed = ResultsView(self.results)
+                        self.skipped, self.orphans = [], []
+                        self.writer = open_writer(self.archive)
+                        self.sheets = (Atlas((join(self.archive, self.atlas) if self.archive else self.atlas), self.atlas_size,
+                                             save = (self.writer.put if self.writer else write_file)) if self.atlas else None)
+                        try:
+                                self.convert()
+                        finally:
+                                if self.phash_index:
+                                        self.phash_index.close()
+                                if self.sheets:
+                                        self.sheets.close()
+                                if self.writer:
+                                        self.writer.close()
+
+                        if self.manifest:
+                                self.orphans = self.manifest.orphans()
+                                for orphan in self.orphans:
+                                        self.print_std('orphan = %s (sources disappeared)' %orphan)
+                                self.manifest.save()
+                else:
+                        raise ValueError("Input error: `.ico` / `.cur` file path/s not a list.")
+
+        def convert(self):
+                """ Converts files, folders, archives and bytes inputs. """
+                for self.index, self.path_icocur in enumerate(self.paths_icocurs):
+                        if isinstance(self.path_icocur, str):
+                                if (is_archive(self.path_icocur) or is_pe(self.path_icocur)) and isfile(self.path_icocur):
+                                        ## Archive members / binary resources.
+                                        try:
+                                                container = (Archive if is_archive(self.path_icocur) else PEResources)(self.path_icocur)
+                                        except ValueError as e:
+                                                self.results[self.path_icocur] = IconFileResult(path = self.path_icocur, error = str(e))
+                                                continue
+                                        path, found = self.path_icocur, False
+                                        with container:
+                                                for self.path_icocur, size, read in container.members(self.recursive, self.include, self.exclude,
+                                                                                                      extensions = ('.ico', '.cur')):
+                                                        found = True
+                                                        if not self.oversized(size):
+                                                                self.data_icocur = read()
+                                                                self.work(is_byte = True)
+                                        if not found and isinstance(container, Archive):
+                                                self.results[path] = IconFileResult(path = path, error = container.missing(self.recursive))
+                                                self.print_err(container.missing(self.recursive))
+                                elif isfile(self.path_icocur):
+                                        self.work()
+                                else:
+                                        if isdir(self.path_icocur):
+                                                for self.path_icocur in scan(self.path_icocur, self.recursive, self.include, self.exclude,
+                                                                             extensions = ('.ico', '.cur')):
+                                                        self.work()
+                                        else:
+                                                self.results[self.path_icocur] = IconFileResult(path = self.path_icocur,
+                                                                                                error = "Input error: file/directory not found.")
+                        elif isinstance(self.path_icocur, bytes):
+                                self.data_icocur = self.path_icocur
+                                self.path_icocur = "stream_%s" %self.index
+                                self.work(is_byte = True)
+                        else:
+                                self.results[self.path_icocur] = IconFileResult(path = self.path_icocur,
+                                                                                error = "Input error: neither a file/directory nor bytes.")
+
+        def oversized(self, size):
+                """ Checks (before reading) whether current file exceeds `max_bytes`. """
+                if self.max_bytes and size > self.max_bytes:
+                        self.results[self.path_icocur] = IconFileResult(path = self.path_icocur,
+                                                                        error = "Icon/Cursor error: file larger than %s bytes." %self.max_bytes)
+                        return True
+                return False
+
         def printsave(self):
                 """ Saves conversion file and print results. """
                 current = self.paths_icocurs[self.index]
-                result = self.all_icocur_readed[self.path_icocur]
+                result = self.results[self.path_icocur]
 
-                if isinstance(result, dict):
+                if result.error is None:
                         self.print_std('\n' + '#' * 80 + '\n')
                         if isinstance(current, bytes):
                                 self.print_std('bytes = %s\n' %self.path_icocur)
                         else:
                                 if isdir(current):
                                         self.print_std('folder = %s\n' %current)
+                                elif is_archive(current):
+                                        self.print_std('archive = %s\n' %current)
+                                elif is_pe(current):
+                                        self.print_std('binary = %s\n' %current)
                                 self.print_std('file = %s\n' %self.path_icocur)
 
-                        for indx, key in enumerate(result):
+                        items = ([('warning', result.warning)] if result.warning else []) + \
+                                [('image_%s' %cnt, entry) for cnt, entry in enumerate(result.entries)]
+                        for indx, (key, subresult) in enumerate(items):
 
                                 self.print_std('** ' + key + ' **')
 
-                                subresult = result[key]
-                                if isinstance(subresult, dict):
-                                        if 'warning' in subresult:
+                                if isinstance(subresult, IconEntry) and subresult.error is None:
+                                        if subresult.warning:
                                                 # print image warnings.
-                                                for warn in subresult['warning']:
-                                                        self.print_err(warn, toexit = False)
-                                        if 'info' in subresult:
+                                                for warn in subresult.warning:
+                                                        self.print_err(warn)
+                                        if subresult.info is not None:
                                                 # print image info png.
-                                                inf = ', '.join('{} = {}'.format(k, v) for k, v in subresult['info'].items())
+                                                inf = ', '.join('{} = {}'.format(k, v) for k, v in subresult.info.items())
                                                 self.print_std('info --> %s' %inf)
 
-                                        self.print_std('(width, height) = %s' %str(subresult['im_obj'].size))
-                                        self.print_std('depth = %s' %subresult['depth'])
+                                        size = (subresult.im_obj.size if subresult.im_obj is not None else tuple(subresult.pixels.shape[1::-1]))
+                                        self.print_std('(width, height) = %s' %str(size))
+                                        self.print_std('depth = %s' %subresult.depth)
+                                        if subresult.new_depth is not None:
+                                                self.print_std('new depth = %s' %subresult.new_depth)
 
-                                        if 'num_pal' in subresult:
+                                        if subresult.num_pal is not None:
                                                 # print image palette size.
-                                                self.print_std('palette length = %s' %subresult['num_pal'])
-                                        if 'hotspot_x' in subresult:
+                                                self.print_std('palette length = %s' %subresult.num_pal)
+                                        if subresult.hotspot_x is not None:
                                                 # print `.cur` hotspots.
-                                                self.print_std('(hotspot_x, hotspot_y) = %s' %str((subresult['hotspot_x'], subresult['hotspot_y'])))
+                                                self.print_std('(hotspot_x, hotspot_y) = %s' %str((subresult.hotspot_x, subresult.hotspot_y)))
+                                        # index.
+                                        if self.phash_index is not None:
+                                                with self.timings.stage('phash'):
+                                                        subresult.phash = dhash(subresult.im_obj)
+                                                        itself = (self.path_icocur, result.entries.index(subresult))
+                                                        found = self.phash_index.query(subresult.phash, self.phash_distance)
+                                                        subresult.similar = [match for match in found if match[1:] != itself]
+                                                        # unchanged images of a new run are already indexed.
+                                                        if self.phash_insert and (0,) + itself not in found:
+                                                                self.phash_index.add(subresult.phash, *itself)
+                                                self.print_std('phash = %016x' %subresult.phash)
+                                                for dist, file, entry in subresult.similar:
+                                                        self.print_std('similar = %s (image_%s, distance %s)' %(file, entry, dist))
+                                        # pack.
+                                        if self.sheets:
+                                                if self.atlas_only is None or subresult.im_obj.size == self.atlas_only:
+                                                        hotspot = ([subresult.hotspot_x, subresult.hotspot_y] if subresult.hotspot_x is not None else None)
+                                                        with self.timings.stage('save'):
+                                                                subresult.saved = self.sheets.add(subresult.im_obj, self.path_icocur,
+                                                                                                   result.entries.index(subresult), hotspot)
+                                                        if subresult.saved:
+                                                                self.print_std('packed in = %s' %subresult.saved)
+                                                        else:
+                                                                self.print_err("Image larger than atlas sheet, not packed.")
                                         # save.
-                                        if self.want_save or self.is_cli:
+                                        elif self.want_save or self.is_cli:
                                                 # define current path, name and format.
                                                 path, name, frmt = self.paths_image[self.index], \
                                                                    self.names_image[self.index], \
@@ -649,39 +1880,73 @@ class Decode(object):
                                                 couple = (path, name)
                                                 current_indx = (indx + self.remind[couple] + 1 if couple in self.remind.keys() else indx)
                                                 # define current name with index.
-                                                current_name = (name + '_' + str(current_indx) if len(result) > 1 or couple in self.remind.keys() else name)
+                                                current_name = (name + '_' + str(current_indx) if len(items) > 1 or couple in self.remind.keys() else name)
 
                                                 save_path = join(path, current_name + frmt)
-                                                subresult['im_obj'].save(save_path, format = frmt[1:].upper())
-                                                subresult.update({'saved' : save_path})
+                                                with self.timings.stage('save'):
+                                                        if self.writer:
+                                                                buffer = BytesIO()
+                                                                subresult.im_obj.save(buffer, format = frmt[1:].upper())
+                                                                self.writer.put(save_path, buffer.getvalue())
+                                                        else:
+                                                                subresult.im_obj.save(save_path, format = frmt[1:].upper())
+                                                subresult.saved = save_path
                                                 self.print_std('saved as = %s' %save_path)
                                 else:
                                         if isinstance(subresult, list):
                                                 for warn in subresult:
-                                                        self.print_err(warn, toexit = False)
+                                                        self.print_err(warn)
                                         else:
-                                                self.print_err(subresult, toexit = False)
+                                                self.print_err(subresult.error)
 
                         # remind last index bound to a specific path and name.
-                        if isinstance(subresult, dict):
+                        if isinstance(subresult, IconEntry) and subresult.error is None and (self.want_save or self.is_cli) and not self.sheets:
                                 self.remind.update({couple : current_indx})
                 else:
-                        self.print_err(result, toexit = False)
+                        self.print_err(result.error)
 
         def work(self, is_byte = False):
                 """ Executes conversion job."""
+                self.timings.begin()
                 if not is_byte:
                         if self.path_icocur.lower().endswith('.ico') or self.path_icocur.lower().endswith('.cur'):
-                                with open(self.path_icocur, 'rb') as file:
+                                ## Oversized files are rejected unread.
+                                if self.oversized(stat(self.path_icocur).st_size):
+                                        return
+                                with self.timings.stage('read'), open(self.path_icocur, 'rb') as file:
                                         self.data_icocur = file.read()
                         else:
-                                print_err("Input error: not an `.ico` / `.cur` file.")
+                                self.results[self.path_icocur] = IconFileResult(path = self.path_icocur,
+                                                                                error = "Input error: not an `.ico` / `.cur` file.")
+                                return
+
+                        incremental = self.manifest and (self.want_save or self.is_cli) and not (self.writer or self.sheets)
+                        if incremental:
+                                path, name, frmt = self.paths_image[self.index], self.names_image[self.index], self.formats_image[self.index]
+                                couple = (path, (name or splitext(basename(self.path_icocur))[0]))
+                                options = (path, name, frmt, self.rebuild, self.force_to, self.remind.get(couple))
+                                if self.manifest.is_current(self.path_icocur, [self.path_icocur], options):
+                                        # keep names numbering as if converted.
+                                        remind = self.manifest.get(self.path_icocur)['extra']['remind']
+                                        if remind is not None:
+                                                self.remind[couple] = remind
+                                        self.skipped.append(self.path_icocur)
+                                        self.print_std('skipped = %s (up to date)' %self.path_icocur)
+                                        return
 
-                ico_r = self.from_icocur()
-                if ico_r:
-                        self.all_icocur_readed.update({self.path_icocur : ico_r})
+                with self.timings.stage('parse'):
+                        ico_r = IconReader(self.data_icocur, self.path_icocur, self.rebuild, self.force_to,
+                                           self.max_bytes, self.max_pixels, self.timings, self.output).read()
+                self.results[self.path_icocur] = ico_r
+                if ico_r.error is None:
                         ## Show / save results.
                         self.printsave()
+                        if self.timings.enabled:
+                                ico_r.timings = self.timings.end(self.path_icocur)
+                        if not is_byte and incremental:
+                                outputs = [entry.saved for entry in ico_r.entries if entry.saved is not None]
+                                self.manifest.record(self.path_icocur, [self.path_icocur], options, outputs,
+                                                     remind = self.remind.get(couple))
 
 ## __________________
 ##| Mask Operations  |--------------------------------------------------------------------------------------------------------------------------------------
@@ -715,15 +1980,22 @@ class Mask(object):
                         while len(andbytes) % 4 != 0:
                                 andbytes.append(0)
 
-                andbytes = b"".join(pack('B', andbyte) for andbyte in andbytes)
+                return bytes(andbytes)
 
-                return andbytes
+        def alpha_to_AND_mask(self, alpha):
+                """ Computes AND mask from an 'L' alpha channel image (bulk version). """
+                ## opaque --> 255 --> bit 0 (inverted), fully transparent --> 0 --> bit 1.
+                opaque = alpha.point(lambda a : 255 if a > 0 else 0, '1')
+                return opaque.tobytes('raw', '1;I', calc_masksize(alpha.size[0]), -1)
 
-        def check_AND_mask(self, width, height, xordata, anddata):
+        def check_AND_mask(self, width, height, xordata, anddata, np = None):
                 """ Verifies if AND mask is good for 32-bit BGRA image data.
                     1- Checks if AND mask is opaque wherever alpha channel is not fully transparent.
                     2- Checks inverse rule, AND mask is transparent wherever alpha channel is fully transparent.
+                    With NumPy module `np`, all pixels are checked at once.
                 """
+                if np is not None:
+                        return self.check_AND_mask_array(np, width, height, xordata, anddata)
                 xorbytes = width * 4
                 andbytes = calc_rowsize(1, width)
                 for y in range(height):
@@ -742,185 +2014,638 @@ class Mask(object):
                                                 return False
                 return True
 
-        def rebuild_AND_mask(self, dataimage, parameters, rebuild = False):
+        def check_AND_mask_array(self, np, width, height, xordata, anddata):
+                """ Verifies (as `check_AND_mask`) AND mask of 32-bit BGRA image data with NumPy. """
+                transparent = (np.frombuffer(xordata, np.uint8, width * height * 4)[3 :: 4].reshape(height, width) == 0)
+                andbytes = calc_rowsize(1, width)
+                rows = np.frombuffer(anddata, np.uint8, andbytes * height).reshape(height, andbytes)
+                return bool(np.array_equal(np.unpackbits(rows, axis = 1)[:, : width].astype(bool), transparent))
+
+        def rebuild_AND_mask(self, dataimage, parameters, rebuild = False, np = None):
                 """ Checks icon image AND mask for correctness, or rebuilds it.
                     With rebuild == False, checks whether the mask is bad.
                     With rebuild == True, throw the mask away and recompute it from the alpha channel data.
                 """
                 # Note: the monochrome AND mask does not have a palette table.
                 check = True
-                if parameters['bpp'] != 32:
+                if parameters.bpp != 32:
                         ## No alpha channel, so the mask cannot be wrong.
                         return parameters, check
                 else:
                         if rebuild:
-                                parameters['and'] = self.compute_AND_mask(parameters['width'], parameters['height'], parameters['xor'])
+                                parameters.and_ = self.compute_AND_mask(parameters.width, parameters.height, parameters.xor)
                                 return parameters, check
                         else:
-                                return parameters, self.check_AND_mask(parameters['width'], parameters['height'], parameters['xor'], parameters['and'])
+                                return parameters, self.check_AND_mask(parameters.width, parameters.height, parameters.xor, parameters.and_, np)
 
 
-## ________________________
-##| Write `.ico` / `.cur`  |---------------------------------------------------------------------------------------------------------------------------------
-##|________________________|
+## _______________
+##| ICC Profiles  |-------------------------------------------------------------------------------------------------------------------------------------------
+##|_______________|
 ##
 
-class Encode(object):
+class IccCache(object):
+        """ Bounded LRU cache of ICC --> sRGB transforms, keyed by (profile hash, mode, intent). """
+
+        def __init__(self, maxsize = 32):
+                self.maxsize = maxsize
+                self.lock = Lock()
+                self.transforms = OrderedDict()
+                self.srgb = None
+                self.hits, self.misses, self.evictions = (0 for _ in range(3))
+
+        def get(self, icc_profile, mode, intent = 0):
+                """ Gets (builds, if needs) the transform for an embedded profile. """
+                key = (sha1(icc_profile).hexdigest(), mode, intent)
+                with self.lock:
+                        if key in self.transforms:
+                                self.hits += 1
+                                self.transforms.move_to_end(key)
+                                return self.transforms[key]
+                        self.misses += 1
+
+                from PIL import ImageCms
+                if self.srgb is None:
+                        self.srgb = ImageCms.createProfile('sRGB')
+                ## Profile is read from bytes, no temporary files.
+                source = ImageCms.ImageCmsProfile(BytesIO(icc_profile))
+                transform = ImageCms.buildTransform(source, self.srgb, mode, mode, renderingIntent = intent)
+
+                with self.lock:
+                        self.transforms[key] = transform
+                        if len(self.transforms) > self.maxsize:
+                                self.transforms.popitem(last = False)
+                                self.evictions += 1
+                return transform
+
+        def apply(self, image, intent = 0):
+                """ Converts in place an image with embedded profile to sRGB. """
+                from PIL import ImageCms
+                transform = self.get(image.info['icc_profile'], image.mode, intent)
+                ImageCms.applyTransform(image, transform, inPlace = True)
+                return image
 
-        def __init__(self, paths_images, paths_icocur = [], names_icocur = [], formats_icocur = [],
-                     type_resize = 'up256_prop', force_to = 'original', custom_palettes = {}):
+        def info(self):
+                """ Gets cache statistics. """
+                return {'hits'      : self.hits,
+                        'misses'    : self.misses,
+                        'evictions' : self.evictions,
+                        'size'      : len(self.transforms),
+                        'maxsize'   : self.maxsize}
+
+        def clear(self):
+                """ Empties cache and resets statistics. """
+                self.transforms.clear()
+                self.hits, self.misses, self.evictions = (0 for _ in range(3))
+
+icc_cache = IccCache()
+
+## _______________
+##| Quantization  |-------------------------------------------------------------------------------------------------------------------------------------------
+##|_______________|
+##
 
+class Quantizer(object):
+        """ Reduces images to indexed bit depths, results are cached by source. """
+        methods = {'mediancut'   : 0,
+                   'maxcoverage' : 1,
+                   'octree'      : 2}
+
+        def __init__(self, maxsize = 64):
+                self.maxsize = maxsize
+                self.lock = Lock()
+                self.results = OrderedDict()
+                self.palettes = OrderedDict()
+                self.tables = OrderedDict()
+                self.hits, self.misses = (0 for _ in range(2))
+
+        def gray_table(self, values):
+                """ Gets (builds once, if needs) the nearest entry of palette `values` (flat RGB list) for every gray level. """
+                key = tuple(values)
+                with self.lock:
+                        if key in self.tables:
+                                self.tables.move_to_end(key)
+                                return self.tables[key]
+
+                ## Squared distance of (level, level, level) to an entry is 3 * level ** 2 - 2 * level * sum + squares:
+                ## the nearest entry (the first one, if more) minimizes squares - 2 * level * sum.
+                entries = [(sum(values[i : i + 3]), sum(value ** 2 for value in values[i : i + 3])) for i in range(0, len(values) - 2, 3)]
+                table = [min(range(len(entries)), key = lambda indx : entries[indx][1] - 2 * level * entries[indx][0]) for level in range(256)]
+                with self.lock:
+                        self.tables[key] = table
+                        if len(self.tables) > self.maxsize:
+                                self.tables.popitem(last = False)
+                return table
+
+        def palette_image(self, values):
+                """ Gets (builds once, if needs) the 'P' image carrying palette `values` (flat RGB list). """
+                key = tuple(values)
+                with self.lock:
+                        if key in self.palettes:
+                                self.palettes.move_to_end(key)
+                                return self.palettes[key]
+
+                        palimage = Image.new('P', (1, 1))
+                        palimage.putpalette(values)
+                        self.palettes[key] = palimage
+                        if len(self.palettes) > self.maxsize:
+                                self.palettes.popitem(last = False)
+                        return palimage
+
+        def map(self, image, values, dither = False, colors = 256):
+                """ Assigns every pixel its nearest entry of palette `values` (flat RGB list).
+                    '1' / 'L' images are mapped exactly (table of gray levels); palettes of more than `colors` entries
+                    keep only the entries used. Other modes go through Pillow palette cache cube (nearly nearest), can dither.
                 """
-                    `paths_images`   : a list of lists   : every list can contain one/more image(s) path(s)
-                                                           and/or one/more folder image(s) path(s) to convert.
-                    `paths_icocur`   : a list            : contains output path(s) for every resulting conversion.
-                                                           If `paths_icocur` isn't defined, working directory is used.
-                    `names_icocur`   : a list            : contains output name(s) for every resulting conversion.
-                                                           If `paths_images` contains a *folder path* and corresponding `names_icocur` is defined,
-                                                           a multi-`.ico` is created (note: multi-`.cur` creation is forbidden), otherwise
-                                                           every image in *folder path* is converted to a single `.ico` / `.cur`.
-                    `formats_icocur` : a list            : contains format(s) for every resulting conversion (that is ".ico" or ".cur").
-                                                           If ".cur", can be specified hotspot x (integer) and hotspot y (integer)
-                                                           using a tuple; example: (".cur", 2, 5).
-                    `type_resize`    : a string or tuple : If used 'up256_prop' / 'up256_no_prop' dimensions greater than 256 pixels are resized
-                                                           keeping / without keeping global image aspect ratio.
-                                                           If used 'square', dimensions are resized to nearest square standard size.
-                                                           Can be also provided a custom resize tuple (width, height).
-                    `force_to`       : a string          : If 'original', original bit depth is kept. (TODO)
-                    `custom_palettes`: a dict            : The key is a tuple (mode, bitdepth), the value can be
-                                                           a list of RGB tuples [(R1,G1,B1),...,(Rn,Bn,Gn)] (usual palette format) or
-                                                           a list flat [V1,V2,...,Vn] (compact format for grayscale palette) or
-                                                           a '.gpl' file path.
+                if image.mode not in ['1', 'L']:
+                        return image.convert('RGB').quantize(palette = self.palette_image(values), dither = (3 if dither else 0))
+
+                image, table = image.convert('L'), self.gray_table(values)
+                if len(values) > 3 * colors:
+                        used = sorted(set(table[level] for level, count in enumerate(image.histogram()) if count))
+                        values = list(chain(*[values[3 * indx : 3 * indx + 3] for indx in used]))
+                        position = {indx : pos for pos, indx in enumerate(used)}
+                        table = [position.get(indx, 0) for indx in table]
+                result = Image.frombytes('P', image.size, image.point(table).tobytes())
+                result.putpalette(values)
+                return result
+
+        def quantize(self, image, bits, method = 'mediancut', dither = False, reserve = 0):
+                """ Gets a 'P' image with at most 2 ** `bits` colors, less `reserve` entries left free.
+                    `method` is 'mediancut', 'maxcoverage', 'octree' or a `.gpl` file path to map onto.
+                    `dither` enables Floyd-Steinberg dithering.
                 """
+                image = image.convert('RGB')
+                key = (sha1(image.tobytes()).hexdigest(), image.size, bits, method, dither, reserve)
+                with self.lock:
+                        if key in self.results:
+                                self.hits += 1
+                                self.results.move_to_end(key)
+                                return self.results[key].copy()
+                        self.misses += 1
+
+                colors = (1 << bits) - reserve
+                if method in self.methods:
+                        result = image.quantize(colors = colors, method = self.methods[method])
+                        if dither:
+                                ## `quantize` dithers only against a given palette.
+                                result = image.quantize(palette = result, dither = 3)
+                else:
+                        result = image.quantize(palette = self.palette_image(palette_gpl(method)[: 3 * colors]), dither = (3 if dither else 0))
+
+                ## Keep only the palette entries addressable by depth.
+                result.putpalette(result.getpalette()[: 3 * colors])
+
+                with self.lock:
+                        self.results[key] = result
+                        if len(self.results) > self.maxsize:
+                                self.results.popitem(last = False)
+                return result.copy()
+
+        def info(self):
+                """ Gets cache statistics. """
+                return {'hits'    : self.hits,
+                        'misses'  : self.misses,
+                        'size'    : len(self.results),
+                        'maxsize' : self.maxsize}
+
+        def clear(self):
+                """ Empties cache and resets statistics. """
+                self.results.clear()
+                self.palettes.clear()
+                self.tables.clear()
+                self.hits, self.misses = (0 for _ in range(2))
+
+quantizer = Quantizer()
+
+def force_depth(image, force_to, alpha = None):
+        """ Converts an image to the bit depth of (normalized) option `force_to`.
+            With binary `alpha` (see `flatten_alpha`), indexed depths keep a black palette entry for transparent pixels.
+        """
+        bits, method, dither = force_to
+        if bits == 32:
+                return image.convert('RGBA')
+        elif bits == 24:
+                return image.convert('RGB')
+        elif alpha is None:
+                return quantizer.quantize(image, bits, method, dither)
+
+        ## Palette is made of opaque pixels only, transparent ones take the black entry left free.
+        rgb, level = image.tobytes(), alpha.tobytes()
+        opaque = b''.join(rgb[3 * indx : 3 * indx + 3] for indx, value in enumerate(level) if value)
+        palette = []
+        if opaque:
+                source = Image.frombytes('RGB', (len(opaque) // 3, 1), opaque)
+                palette = quantizer.quantize(source, bits, method, reserve = 1).getpalette()
+                image = quantizer.map(image, palette, dither)
+        else:
+                image = Image.new('P', image.size)
+        image.putpalette(palette + [0, 0, 0])
+        image.paste(len(palette) // 3, mask = alpha.point(lambda level : 255 - level))
+        return image
+
+def flatten_alpha(image):
+        """ Gets (RGB image, alpha) of an image going below 32 bits, whose transparency is kept into AND mask:
+            alpha is binary (only fully transparent pixels are transparent, as `Mask.alpha_to_AND_mask`) and
+            transparent pixels are turned black, so they leave screen unchanged.
+            Images without alpha are unchanged, `alpha` is None if opaque.
+        """
+        if image.mode not in ['RGBA', 'LA', 'PA'] and 'transparency' not in image.info:
+                return image, None
+        rgba = image.convert('RGBA')
+        alpha = rgba.getchannel('A').point(lambda level : (255 if level > 0 else 0))
+        rgb = Image.composite(rgba.convert('RGB'), Image.new('RGB', rgba.size), alpha)
+        return rgb, (None if alpha.getextrema()[0] == 255 else alpha)
+
+def binary_transparency(image):
+        """ Gets (image, alpha) of a 'P', 'L' or 'RGB' image with `transparency` info, if its alpha is binary (0 / 255),
+            else (image, None). Transparent pixels are turned black, so they leave screen unchanged under AND mask.
+        """
+        transparency = image.info['transparency']
+        if image.mode == 'P':
+                ## Alpha of palette indexes, applied to indexes as 'L'.
+                if isinstance(transparency, int):
+                        table = [(0 if indx == transparency else 255) for indx in range(256)]
+                else:
+                        table = list(transparency[: 256]) + [255] * (256 - len(transparency[: 256]))
+                alpha = Image.frombytes('L', image.size, image.tobytes()).point(table)
+        else:
+                alpha = image.convert('RGBA').getchannel('A')
+        levels = alpha.getcolors(2)
+        if levels is None or not {level for _, level in levels} <= {0, 255}:
+                return image, None
+
+        image = image.copy()
+        del image.info['transparency']
+        if image.mode == 'P':
+                palette = image.getpalette()
+                for indx, level in enumerate(table[: len(palette) // 3]):
+                        if level == 0:
+                                palette[3 * indx : 3 * indx + 3] = [0, 0, 0]
+                image.putpalette(palette)
+        else:
+                image.paste((0 if image.mode == 'L' else (0, 0, 0)), mask = alpha.point(lambda level : 255 - level))
+        return image, alpha
+
+def lossless_depth(image):
+        """ Gets the smallest bit depth keeping an image unchanged, as (converted image, bits, alpha).
+            Indexed (1, 4, 8) and 24 bits need a binary alpha, kept into AND mask (`alpha` is None if opaque);
+            partial alpha needs 32 bits.
+        """
+        image = image.convert('RGBA')
+        alpha = image.getchannel('A')
+        # bails out over 2 levels.
+        levels = alpha.getcolors(2)
+        if levels is None or not {level for _, level in levels} <= {0, 255}:
+                return image, 32, alpha
+
+        rgb = image.convert('RGB')
+        if levels == [(image.size[0] * image.size[1], 255)]:
+                alpha = None
+        else:
+                # transparent pixels are black, so their colors don't count.
+                rgb = Image.composite(rgb, Image.new('RGB', rgb.size), alpha)
+        # bails out over 256 colors.
+        colors = rgb.getcolors(256)
+        if colors is not None:
+                count = len(colors)
+                bits = (1 if count <= 2 else 4 if count <= 16 else 8)
+                indexed = rgb.quantize(colors = count, method = Quantizer.methods['mediancut'])
+                indexed.putpalette(indexed.getpalette()[: 3 * count])
+                ## Median cut keeps all colors when they aren't more than asked, but check it.
+                if indexed.convert('RGB').tobytes() == rgb.tobytes():
+                        return indexed, bits, alpha
+        return rgb, 24, alpha
 
-                self.paths_images = paths_images
-                self.paths_icocur = paths_icocur
-                self.names_icocur = names_icocur
-                self.formats_icocur = formats_icocur
-                self.type_resize = type_resize
-                self.force_to = force_to
-                self.custom_palettes = custom_palettes
-                self.is_cli = is_cli
-                self.build()
-
-        def add_name2path(self, name, frmt, indx):
-                """ Adds `.ico` / `.cur` name to output path. """
-                couple = (self.path_icocur, name)
-                current_indx = (self.remind[couple] + 1 if couple in self.remind.keys() else indx)
-                current_name = (name + '_' + str(current_indx) if couple in self.remind.keys() else name)
-                self.remind.update({(self.path_icocur, name) : current_indx})
-                self.path_icocur = join(self.path_icocur, current_name + frmt)
+## _________
+##| Resize  |-----------------------------------------------------------------------------------------------------------------------------------------------
+##|_________|
+##
 
-        def add_errors(self, msg):
-                """ Assigns / prints process errors."""
-                self.all_icocur_written.update({self.path_icocur : msg})
-                self.print_err(msg)
+resize_filters = {'nearest'  : Image.NEAREST,
+                  'box'      : Image.BOX,
+                  'bilinear' : Image.BILINEAR,
+                  'hamming'  : Image.HAMMING,
+                  'bicubic'  : Image.BICUBIC,
+                  'lanczos'  : Image.LANCZOS}
+
+def round_aspect(number, key):
+        """ Rounds a side to the integer (at least 1) closer to aspect ratio (as `Image.thumbnail`). """
+        return max(min(floor(number), ceil(number), key = key), 1)
+
+def resize_target(width, height, how):
+        """ Gets the size an image of (width, height) is resized to by option `type_resize`, None if kept. """
+        side = 256
+        if how in ['up256_prop', 'up256_no_prop']:
+                if width <= side and height <= side:
+                        return
+                if how == 'up256_no_prop':
+                        return (min(width, side), min(height, side))
+                aspect = width / height
+                if width >= height:
+                        return (side, round_aspect(side / aspect, key = lambda n : (0 if n == 0 else abs(aspect - side / n))))
+                return (round_aspect(side * aspect, key = lambda n : abs(aspect - n / side)), side)
+        elif how == 'square':
+                new_d = min([16, 24, 32, 48, 64, 128, 256], key = lambda x : abs(x - max(width, height)))
+                return (new_d, new_d)
+        elif isinstance(how, tuple):
+                return how
+
+def prescale(image, size, reducing_gap = 2.):
+        """ Shrinks a large (not loaded) image towards `size`, keeping at least `reducing_gap` times it for the final filter:
+            JPEGs are decoded DCT-scaled (`draft`), then integer factors are averaged out (`reduce`).
+        """
+        limit = (max(1, int(size[0] * reducing_gap)), max(1, int(size[1] * reducing_gap)))
+        image.draft(None, limit)
+        factor = min(image.size[0] // limit[0], image.size[1] // limit[1])
+        if factor > 1 and image.mode in ['L', 'LA', 'RGB', 'RGBA']:
+                image = image.reduce(factor)
+        return image
+
+## _____________
+##| Hash Index  |---------------------------------------------------------------------------------------------------------------------------------------------
+##|_____________|
+##
 
-        def check_output(self):
-                """ Verifies if output paths, names, formats are ok. """
-                ## Check other options.
-                if not isinstance(self.type_resize, (tuple, str)):
-                        print_err("Input error: option `type_resize` not a tuple or a string.")
-                else:
-                        if isinstance(self.type_resize, tuple) and not (len(self.type_resize) == 2 \
-                                                                        and all(isinstance(tyr, int) for tyr in [self.type_resize[0], self.type_resize[1]]) \
-                                                                        and self.type_resize[0] <= 256 and self.type_resize[1] <= 256):
-                                print_err("Input error: option `type_resize` tuple not proper defined.")
-                        elif isinstance(self.type_resize, str) and (self.type_resize not in ['up256_prop', 'up256_no_prop', 'square']):
-                                print_err("Input error: option `type_resize` unknown '%s' method." %self.type_resize)
+class HashIndex(object):
+        """ Content-addressed index of converted sources, reusable across a batch:
+            bounded LRU (`maxsize` results), so long batches don't keep every entry bytes.
+        """
 
-                if self.force_to not in ['original']:
-                        print_err("Input error: option `force_to` not proper defined.")
+        def __init__(self, maxsize = 256):
+                self.maxsize = maxsize
+                self.lock = Lock()
+                self.entries = OrderedDict()
+                self.hits, self.misses, self.evictions = (0 for _ in range(3))
+
+        def key(self, data, *options):
+                """ Gets the key of a source (content hash + conversion options). """
+                return (sha1(data).hexdigest(), repr(options))
+
+        def get(self, key):
+                """ Gets the stored result for a key, None if missing. """
+                with self.lock:
+                        value = self.entries.get(key)
+                        if value is None:
+                                self.misses += 1
+                        else:
+                                self.hits += 1
+                                self.entries.move_to_end(key)
+                        return value
+
+        def put(self, key, value):
+                """ Stores the result for a key, evicting the least recently used over `maxsize`. """
+                with self.lock:
+                        self.entries[key] = value
+                        self.entries.move_to_end(key)
+                        if len(self.entries) > self.maxsize:
+                                self.entries.popitem(last = False)
+                                self.evictions += 1
+
+        def info(self):
+                """ Gets index statistics. """
+                return {'hits'      : self.hits,
+                        'misses'    : self.misses,
+                        'evictions' : self.evictions,
+                        'size'      : len(self.entries),
+                        'maxsize'   : self.maxsize}
+
+## ___________________
+##| Perceptual Index  |----------------------------------------------------------------------------------------------------------------------------------------
+##|___________________|
+##
 
-                ## Check paths.
-                msg = "icon / cursor"
-                Check(self.paths_images, self.paths_icocur).paths(msg)
-                ## Check names.
-                Check(self.paths_images, self.names_icocur).names(msg)
-                ## Check formats.
-                # 1 - check length list.
-                frmtchk = Check(self.paths_images, self.formats_icocur)
-                frmtchk.formats(msg, ".ico", check = False)
-                # 2 - check hotspots (for `.cur`).
-                self.hotspots = []
-                for i, frmt in enumerate(self.formats_icocur):
-                        if isinstance(frmt, tuple):
-                                if frmt[0] == '.ico':
-                                        print_err("Input error: hotspot specification invalid for `.ico` conversion.")
-                                if all(not isinstance(hot, int) for hot in frmt[1::]) or (len(frmt[1::]) != 2):
-                                        print_err("Input error: hotspot specification not proper defined.")
+## (8bytes)hash - (2bytes)entry index - (2bytes)file length, followed by file (utf-8).
+PHASH_RECORD = Struct('<QHH')
 
-                                self.formats_icocur[i] = frmt[0]
-                                self.hotspots.append(frmt[1::])
-                        else:
-                                if frmt == '.ico':
-                                        self.hotspots.append("")
-                                elif frmt == '.cur':
-                                        self.hotspots.append((0, 0))
-                # 3 - check extensions.
-                frmtchk.formats_checker(msg)
+def dhash(image):
+        """ Gets the 64 bits difference hash of an image, composited over white
+            (so bit depth, format and colours under transparent pixels don't matter).
+        """
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        gray = Image.alpha_composite(background, image).convert('L').resize((9, 8), Image.BOX)
+        pixels = gray.tobytes()
+        value = 0
+        for row in range(0, 72, 9):
+                for col in range(row, row + 8):
+                        value = (value << 1) | (pixels[col] > pixels[col + 1])
+        return value
 
-        def build(self):
-                """ Verifies if input paths are ok and starts conversion job. """
-                self.print_std = partial(print_std, view = self.is_cli)
-                self.print_err = partial(print_err, view = self.is_cli)
+@lru_cache(maxsize = None)
+def flip_masks(bits, radius):
+        """ Gets all masks of `bits` bits with at most `radius` bits set. """
+        from itertools import combinations
+        return [sum(1 << bit for bit in flipped) for count in range(radius + 1) for flipped in combinations(range(bits), count)]
+
+class PerceptualIndex(object):
+        """ Persisted index of perceptual hashes of decoded images, searched by Hamming distance.
+            Hashes are split in `chunks` substrings, each one keying a table (multi-index hashing):
+            any hash within distance `d` has a substring within `d // chunks` of the query's one.
+            Hashes read from file are packed in sorted arrays (searched by bisection), added ones in dicts.
+        """
+        chunks, bits = 4, 16
+
+        def __init__(self, path = None):
+                from array import array
+                self.path = path
+                self.hashes, self.items = array('Q'), []
+                self.packed = [(array('H'), array('L')) for _ in range(self.chunks)]
+                self.tables = [{} for _ in range(self.chunks)]
+                self.fd = None
+                if path is not None and isfile(path):
+                        self.load(path)
+
+        def __len__(self):
+                return len(self.hashes)
+
+        def __enter__(self):
+                return self
+
+        def __exit__(self, *exc):
+                self.close()
+
+        def load(self, path):
+                """ Reads hashes of an index file and packs them. """
+                with open(path, 'rb') as fd:
+                        data = fd.read()
+                unpack, size, end = PHASH_RECORD.unpack_from, PHASH_RECORD.size, len(data)
+                hashes, items = self.hashes, self.items
+                # same file names are shared.
+                names = {}
+                offset = 0
+                while offset + size <= end:
+                        phash, entry, length = unpack(data, offset)
+                        offset += size
+                        if offset + length > end:
+                                # truncated by an interrupted write.
+                                break
+                        name = data[offset : offset + length]
+                        offset += length
+                        file = names.get(name)
+                        if file is None:
+                                file = names[name] = name.decode('utf-8')
+                        hashes.append(phash)
+                        items.append((file, entry))
+                self.pack()
+
+        def pack(self):
+                """ Moves all hashes into sorted arrays of (substring, record id) per table. """
+                from array import array
+                # 16 bits substrings are the hashes' native words, least significant first.
+                words = array('H', self.hashes.tobytes())
+                for indx in range(self.chunks):
+                        substrings = words[(indx if sys.byteorder == 'little' else self.chunks - 1 - indx) :: self.chunks]
+                        order = sorted(range(len(substrings)), key = substrings.__getitem__)
+                        substrings = array('H', sorted(substrings))
+                        self.packed[indx] = (substrings, array('L', order))
+                        self.tables[indx].clear()
+
+        def substrings(self, phash):
+                """ Gets the substrings of a hash, one per table. """
+                mask = (1 << self.bits) - 1
+                return [(phash >> (self.bits * indx)) & mask for indx in range(self.chunks)]
+
+        def add(self, phash, file, entry):
+                """ Adds the hash of image `entry` of `file` (appended to the index file). """
+                rid = len(self.hashes)
+                self.hashes.append(phash)
+                self.items.append((file, entry))
+                for table, substring in zip(self.tables, self.substrings(phash)):
+                        table.setdefault(substring, []).append(rid)
+                if self.path is not None:
+                        if self.fd is None:
+                                # unbuffered: every record is one append, also from concurrent workers.
+                                self.fd = open(self.path, 'ab', buffering = 0)
+                        name = file.encode('utf-8')
+                        self.fd.write(PHASH_RECORD.pack(phash, entry, len(name)) + name)
+
+        def candidates(self, indx, substring):
+                """ Gets record ids of a table with a substring. """
+                keys, rids = self.packed[indx]
+                low = bisect_left(keys, substring)
+                high = bisect_right(keys, substring, low)
+                return chain(rids[low : high], self.tables[indx].get(substring, ()))
+
+        def query(self, phash, distance = 6):
+                """ Gets (distance, file, entry) of hashes within a Hamming distance, nearest first. """
+                masks = flip_masks(self.bits, distance // self.chunks)
+                seen, found = set(), []
+                for indx, substring in enumerate(self.substrings(phash)):
+                        for mask in masks:
+                                for rid in self.candidates(indx, substring ^ mask):
+                                        if rid not in seen:
+                                                seen.add(rid)
+                                                dist = bin(self.hashes[rid] ^ phash).count('1')
+                                                if dist <= distance:
+                                                        found.append((dist,) + self.items[rid])
+                return sorted(found)
+
+        def close(self):
+                """ Closes the index file. """
+                if self.fd is not None:
+                        self.fd.close()
+                        self.fd = None
+
+def open_phash_index(phash_index):
+        """ Gets a `PerceptualIndex` from a path (or keeps a given one). """
+        return (PerceptualIndex(phash_index) if isinstance(phash_index, str) else phash_index)
 
-                ## Check paths images.
-                if self.paths_images and isinstance(self.paths_images, list):
-                        self.check_output()
-                        self.remind = {}
-                        self.all_icocur_written = {}
+## _____________________
+##| Incremental Builds  |-------------------------------------------------------------------------------------------------------------------------------------
+##|_____________________|
+##
 
-                        groups = zip(self.paths_images, self.paths_icocur, self.names_icocur, self.formats_icocur, self.hotspots)
-                        for indx, (path_image, self.path_icocur, name, frmt, hotspot) in enumerate(groups):
-                                self.print_std('#' * 80)
-                                no_err, paths = True, []
+class Manifest(object):
+        """ Persisted record of conversion jobs (sources, options, outputs) to skip unchanged ones. """
+        version = 1
+
+        def __init__(self, path):
+                self.path = path
+                self.jobs = {}
+                if isfile(path):
+                        with open(path, 'r') as fd:
+                                content = json.load(fd)
+                        if content.get('version') == self.version:
+                                self.jobs = content['jobs']
+
+        def fingerprint(self, path, previous = None):
+                """ Gets [size, mtime, content hash] of a file, hashing only if stat changed. """
+                st = stat(path)
+                if previous and previous[:2] == [st.st_size, st.st_mtime_ns]:
+                        return previous
+                with open(path, 'rb') as file:
+                        return [st.st_size, st.st_mtime_ns, sha1(file.read()).hexdigest()]
+
+        def unchanged(self, files):
+                """ Checks whether recorded files still exist with same content. """
+                for path, previous in files.items():
+                        if not isfile(path):
+                                return False
+                        current = self.fingerprint(path, previous)
+                        if current[2] != previous[2]:
+                                return False
+                        # same content, keep new stat for next runs.
+                        files[path] = current
+                return True
 
-                                if isinstance(path_image, list):
-                                        if not path_image:
-                                                no_err = False
-                                                message = "Input error: image file/directory path/s missing."
-                                        else:
-                                                for imapath in path_image:
-                                                        if not isinstance(imapath, str):
-                                                                no_err = False
-                                                                message = "Input error: image file/directory path '%s' not a string." %imapath
-                                                        else:
-                                                                if isfile(imapath):
-                                                                        paths.append(imapath)
-                                                                else:
-                                                                        if isdir(imapath):
-                                                                                paths.extend([join(imapath, file) for file in listdir(imapath)])
-                                                                        else:
-                                                                                no_err = False
-                                                                                message = "Input error: file/directory '%s' not found." %imapath
-
-                                                if len(paths) > 1:
-                                                        if frmt == '.cur':
-                                                                if name != "":
-                                                                        no_err = False
-                                                                        message = "Input error: can't create multi-size '.cur'."
-                                                                else:
-                                                                        # eventually remove duplicate jobs.
-                                                                        paths = list(set(paths))
-                                                        elif frmt == '.ico':
-                                                                if name == "":
-                                                                        name = 'multi'
-                                else:
-                                        no_err = False
-                                        message = "Input error: image file/directory path/s not a list of lists."
-
-                                ## Do job.
-                                if name != "":
-                                        self.add_name2path(name, frmt, indx)
-                                if not no_err:
-                                        if name == "":
-                                                self.add_name2path('noname', frmt, indx)
-                                        self.add_errors(message)
+        def is_current(self, job, sources, options):
+                """ Checks whether a job has unchanged sources, options and outputs. """
+                entry = self.jobs.get(job)
+                if not entry or entry['options'] != repr(options) or sorted(entry['sources']) != sorted(sources):
+                        return False
+                return self.unchanged(entry['sources']) and self.unchanged(entry['outputs'])
+
+        def get(self, job):
+                """ Gets the recorded entry of a job, None if missing. """
+                return self.jobs.get(job)
+
+        def record(self, job, sources, options, outputs, **extra):
+                """ Records a done job. """
+                self.jobs[job] = {'options' : repr(options),
+                                  'sources' : {path : self.fingerprint(path) for path in sources},
+                                  'outputs' : {path : self.fingerprint(path) for path in outputs},
+                                  'extra'   : extra}
+
+        def orphans(self):
+                """ Gets outputs whose sources disappeared (jobs without outputs left are forgotten). """
+                orphans = []
+                for job, entry in list(self.jobs.items()):
+                        if any(not isfile(path) for path in entry['sources']):
+                                outputs = [path for path in entry['outputs'] if isfile(path)]
+                                if outputs:
+                                        orphans.extend(outputs)
                                 else:
-                                        self.work(paths, name, frmt, hotspot)
-                else:
-                        print_err("Input error: image file/directory path/s not a list of lists.")
+                                        del self.jobs[job]
+                return orphans
+
+        def save(self):
+                """ Writes manifest (atomically). """
+                temp = self.path + '.tmp'
+                with open(temp, 'w') as fd:
+                        json.dump({'version' : self.version, 'jobs' : self.jobs}, fd)
+                replace(temp, self.path)
+
+def open_manifest(manifest):
+        """ Gets a `Manifest` from a path (or keeps a given one). """
+        return (Manifest(manifest) if isinstance(manifest, str) else manifest)
+
+## ________________________
+##| Write `.ico` / `.cur`  |---------------------------------------------------------------------------------------------------------------------------------
+##|________________________|
+##
+
+class IconWriter(object):
+        """ Converts an image to an `.ico` / `.cur` entry: all state of the conversion is its own, so writers
+            of different threads share nothing but thread-safe caches (see `encode_entries`).
+        """
+        def __init__(self, type_resize = 'up256_prop', force_to = 'original', custom_palettes = {},
+                     resample = 'lanczos', reducing_gap = 2., timings = None):
+                self.type_resize, self.force_to, self.custom_palettes = type_resize, force_to, custom_palettes
+                self.resample, self.reducing_gap = resample, reducing_gap
+                self.timings = (Timings(False) if timings is None else timings)
+                # parameters, mode and record (see `EncodedImage`) of the image.
+                self.parameters, self.mode, self.source = {}, None, None
 
         def convert_8bit_to_4bit(self, bits_8):
                 """ Converts 8-bit image data to 4-bit. """
@@ -957,15 +2682,22 @@ class Encode(object):
                         dataimage = image.tobytes('raw', 'BGRA', pad, -1)
                 return dataimage
 
-        def extract(self, path):
+        def extract(self, path, data):
                 """ Gets parameters input image. """
                 ## Open image in-memory as '.png'.
                 _, ext = splitext(path)
                 try:
-                        image = Image.open(path, 'r')
+                        image = Image.open(BytesIO(data), 'r')
                 except:
                         raise EncodeErr(code = 1, msg = "Image error: format '%s' not recognized or corrupted." %ext)
 
+                ## Large images are shrunk before being decoded whole (see `prescale`).
+                self.parameters['source_size'] = image.size
+                target = resize_target(*image.size, self.type_resize)
+                if target is not None and self.reducing_gap is not None:
+                        with self.timings.stage('resize'):
+                                image = prescale(image, target, self.reducing_gap)
+
                 imagebyte = BytesIO()
                 try:
                         image.save(imagebyte, format = 'PNG')
@@ -985,9 +2717,8 @@ class Encode(object):
                 ##  truecolor               3           8,16                24,48             2        each pixel is an R,G,B triple
                 ##  truecolor+alpha         4           8,16                32,64             6        each pixel is an R,G,B triple followed by an alpha sample
 
-                with open(path, 'rb') as file:
-                        data = file.read(30)
-                bitdepth, coltyp = unpack_from('<2B', data[24 : 26])
+                # other formats are known from their PNG copy.
+                bitdepth, coltyp = unpack_from('<2B', (data if data.startswith(b'\x89PNG\r\n\x1a\n') else dataimage), 24)
                 self.parameters['wBitCount'] = len(image.getbands()) * bitdepth
 
                 if coltyp == 4 and self.mode == 'RGBA':
@@ -1005,32 +2736,32 @@ class Encode(object):
                 except AssertionError:
                         raise EncodeErr(code = 2, msg = "Image error: malformed.")
 
-                dizio = {'file' : path,
-                         'mode' : dict_colortype[coltyp][1],
-                         'depth' : self.parameters['wBitCount']}
-
-                if self.path_icocur not in self.all_icocur_written:
-                        self.all_icocur_written[self.path_icocur] = [dizio]
-                else:
-                        self.all_icocur_written[self.path_icocur].extend([dizio])
+                self.source = EncodedImage(file  = path,
+                                           mode  = dict_colortype[coltyp][1],
+                                           depth = self.parameters['wBitCount'])
 
                 return image
 
-        def load(self, path_image):
+        def load(self, path_image, data):
                 """ Loads input image data. """
                 ## Get parameters.
-                image = self.extract(path_image)
+                with self.timings.stage('parse'):
+                        image = self.extract(path_image, data)
 
                 ## Manage resize.
-                image = self.ico_resize(image, how = self.type_resize, method = Image.ANTIALIAS)
+                with self.timings.stage('resize'):
+                        image = self.ico_resize(image, how = self.type_resize, method = resize_filters[self.resample])
 
                 ## Manage ICC profile.
-                if 'icc_profile' in image.info:
-                        icc = mkstemp(suffix = '.icc')[1]
-                        with open(icc, 'wb') as iccfile:
-                                iccfile.write(image.info.get('icc_profile'))
-                        srgb = ImageCms.createProfile('sRGB')
-                        image = ImageCms.profileToProfile(image, icc, srgb)
+                if image.info.get('icc_profile'):
+                        with self.timings.stage('icc'):
+                                image = icc_cache.apply(image)
+
+                self.parameters['and'] = None
+                if self.force_to == 'auto':
+                        return self.load_auto(image)
+                elif self.force_to != 'original':
+                        return self.load_forced(image)
 
                 ##                                    | force_to = 'original' | force_to |
                 ##--------------------------------------------------------------------
@@ -1049,8 +2780,16 @@ class Encode(object):
                 ## deep-color 48bpp ("RGB;48")        | "RGB;24"
                 ## true-color+alpha 32bpp ("RGBA;32") | "RGBA;32"
                 ## true-color+alpha 64bpp ("RGBA;64") | "RGBA;32"
+                ## binary indexed transparency        | original, AND mask
                 ## any mode with indexed transparency | "RGBA;32"
 
+                ## Binary transparency of indexed / grayscale / true-color images is kept into AND mask.
+                if 'transparency' in image.info and self.mode in ['P', 'L', 'RGB'] and self.parameters['wBitCount'] in [1, 2, 4, 8, 24]:
+                        with self.timings.stage('mask'):
+                                image, alpha = binary_transparency(image)
+                                if alpha is not None:
+                                        self.parameters['and'] = Mask().alpha_to_AND_mask(alpha)
+
                 # Modes that needs always forced conversion.
                 forced = True
                 if (self.mode == 'LA' and self.parameters['wBitCount'] in [16, 32]) \
@@ -1065,10 +2804,19 @@ class Encode(object):
                         forced = False
 
                 if forced:
-                        dizio = {'new_mode' : string_mode,
-                                 'new_depth' : self.parameters['wBitCount']
-                                 }
-                        self.all_icocur_written[self.path_icocur][self.index].update(dizio)
+                        current = self.source
+                        current.new_mode, current.new_depth = string_mode, self.parameters['wBitCount']
+
+                ## Map pixels onto custom palette.
+                if self.custom_palettes and self.mode in ['1', 'L'] and self.parameters['wBitCount'] <= 8:
+                        palvalues = self.ico_palette_custom()
+                        if palvalues:
+                                colors = 1 << self.parameters['wBitCount']
+                                with self.timings.stage('quantize'):
+                                        image, self.mode = quantizer.map(image, palvalues, colors = colors), 'P'
+                                ## Only entries used by pixels are kept from larger palettes.
+                                if len(image.getpalette()) > 3 * colors:
+                                        raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` has too much colors for %s bit depth." %self.parameters['wBitCount'])
 
                 ## Continue loading data.
                 if self.mode == 'I':
@@ -1119,15 +2867,64 @@ class Encode(object):
 
                 return image, dataimage
 
-        def ico_palette_gpl(self, file):
-                """ Gets values from `.gpl` file. """
-                palette = []
-                with open(file, 'r') as fd:
-                        for line in fd.readlines():
-                                if not line.lower().startswith(("gimp", "name", "columns", "#")):
-                                        for pal in line.strip().split()[0:3]:
-                                                palette.append(int(pal))
-                return palette
+        def load_forced(self, image):
+                """ Loads input image data converted to the depth of option `force_to`. """
+                bits, alpha = self.force_to[0], None
+                if bits < 32:
+                        ## Alpha channel is lost, keep it into AND mask (transparent pixels are black, as 'auto').
+                        with self.timings.stage('mask'):
+                                image, alpha = flatten_alpha(image)
+                                if alpha is not None:
+                                        self.parameters['and'] = Mask().alpha_to_AND_mask(alpha)
+
+                with self.timings.stage('quantize'):
+                        image = force_depth(image, self.force_to, alpha)
+                return self.load_depth(image, bits)
+
+        def load_auto(self, image):
+                """ Loads input image data converted to its smallest lossless bit depth (see `lossless_depth`). """
+                if self.mode == 'I':
+                        table = [i / (2 ** int(self.parameters['wBitCount'] / 2)) for i in range(2 ** self.parameters['wBitCount'])]
+                        image = image.point(table, 'L')
+                with self.timings.stage('quantize'):
+                        image, bits, alpha = lossless_depth(image)
+                if alpha is not None:
+                        with self.timings.stage('mask'):
+                                self.parameters['and'] = Mask().alpha_to_AND_mask(alpha)
+                return self.load_depth(image, bits)
+
+        def load_depth(self, image, bits):
+                """ Loads data of an image converted to 'P', 'RGB' or 'RGBA' of a given bit depth. """
+                string_modes = {'P' : 'indexed', 'RGB' : 'truecolor', 'RGBA' : 'truecolor+alpha'}
+                self.mode, self.parameters['wBitCount'] = image.mode, bits
+                current = self.source
+                current.new_mode, current.new_depth = string_modes[self.mode], bits
+
+                pad = calc_rowsize(bits, self.parameters['bWidth'])
+                if bits == 32:
+                        dataimage = self.get_bgra(image, pad)
+                else:
+                        rawmodes = {1 : 'P;1', 4 : 'P;4', 8 : 'P', 24 : 'BGR'}
+                        dataimage = image.tobytes('raw', rawmodes[bits], pad, -1)
+
+                return image, dataimage
+
+        def ico_palette_custom(self):
+                """ Gets custom palette (flat RGB values) for current mode and bit depth, if defined. """
+                if not isinstance(self.custom_palettes, dict):
+                        raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
+
+                palvalues = self.custom_palettes.get((self.mode, self.parameters['wBitCount']))
+                if palvalues is None:
+                        return
+                if isinstance(palvalues, list):
+                        if all(isinstance(pal, tuple) and len(pal) == 3 and all(isinstance(num, int) for num in pal) for pal in palvalues):
+                                return list(chain(*palvalues))
+                        elif all(isinstance(pal, int) for pal in palvalues):
+                                return list(chain(*[[pal] * 3 for pal in palvalues]))
+                elif isinstance(palvalues, str) and isfile(palvalues) and palvalues.endswith('.gpl'):
+                        return palette_gpl(palvalues)
+                raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
 
         def ico_palette_add(self, values):
                 """ Adds 4th element (b'\x00') to RGB palette entries. """
@@ -1148,21 +2945,12 @@ class Encode(object):
                                                 try:
                                                         palvalues = self.custom_palettes[(self.mode, self.parameters['wBitCount'])]
                                                 except:
-                                                        print_err("Input error: option `custom_palettes` not proper defined.")
+                                                        raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
                                         else:
-                                                print_err("Input error: option `custom_palettes` not proper defined.")
+                                                raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
                                 else:
                                         is_fallback = True
-                                        fallback_palettes = {('1', 1) : self.ico_palette_gpl(join(working_path, 'palettes/11.gpl')),
-                                                             ('L', 2) : self.ico_palette_gpl(join(working_path, 'palettes/L2.gpl')),
-                                                             ('L', 4) : self.ico_palette_gpl(join(working_path, 'palettes/L4.gpl')),
-                                                             ('L', 8) : self.ico_palette_gpl(join(working_path, 'palettes/L8.gpl')),
-                                                             ('P', 1) : self.ico_palette_gpl(join(working_path, 'palettes/P1.gpl')),
-                                                             ('P', 2) : self.ico_palette_gpl(join(working_path, 'palettes/P2.gpl')),
-                                                             ('P', 4) : self.ico_palette_gpl(join(working_path, 'palettes/P4.gpl')),
-                                                             ('P', 8) : self.ico_palette_gpl(join(working_path, 'palettes/P8.gpl')),
-                                                             }
-                                        palvalues = fallback_palettes[(self.mode, self.parameters['wBitCount'])]
+                                        palvalues = palette_gpl(join(palettes_path, '%s%s.gpl' %(self.mode, self.parameters['wBitCount'])))
 
                                 if isinstance(palvalues, list):
                                         if all(isinstance(pal, tuple) and len(pal) == 3 and all(isinstance(num, int) for num in pal) for pal in palvalues):
@@ -1176,12 +2964,12 @@ class Encode(object):
                                                 else:
                                                         self.parameters['palette'] = bytes([elem for quad in [[pal] * 3 + [0] for pal in palvalues] for elem in quad])
                                         else:
-                                                print_err("Input error: option `custom_palettes` not proper defined.")
+                                                raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
                                 elif isfile(palvalues) and palvalues.endswith('.gpl'):
                                         palvalues = palette_gpl(palvalues)
                                         self.ico_palette_add(palvalues)
                                 else:
-                                        print_err("Input error: option `custom_palettes` not proper defined.")
+                                        raise EncodeErr(code = 3, msg = "Input error: option `custom_palettes` not proper defined.")
                         else:
                                 adjust = True
                                 self.parameters['palette'] = image.palette.palette
@@ -1191,7 +2979,10 @@ class Encode(object):
 
                 ## Count palette entries.
                 if self.parameters['wBitCount'] <= 8:
-                        if (self.parameters['size_pal'] % 3 == 0) and (self.parameters['size_pal'] % 4 == 0):
+                        if image.palette:
+                                # palette RGB (PIL).
+                                self.parameters['bColorCount'] = self.parameters['size_pal'] // 3
+                        elif (self.parameters['size_pal'] % 3 == 0) and (self.parameters['size_pal'] % 4 == 0):
                                 rsv = [self.parameters['palette'][i + 3 : i + 4] for i in range(0, self.parameters['size_pal'], 4)]
                                 if len(set(rsv)) <= 1:
                                         # palette RGBA.
@@ -1220,56 +3011,21 @@ class Encode(object):
                                 temp.append(self.parameters['palette'][i : i + step][::-1] + b'\x00')
                         self.parameters['palette'] = b"".join(temp)
 
-        def ico_resize(self, image, how = 'up256_prop', method = Image.ANTIALIAS):
-                """ Resizes to `.ico` / `.cur` dimensions. """
-                old_w, old_h = image.size
-                sizes = [16, 24, 32, 48, 64, 128, 256]
-
-                self.all_icocur_written[self.path_icocur][self.index].update({'size' : '%s x %s' %(old_w, old_h)})
-
-                resized = True
-                if how in ['up256_prop', 'up256_no_prop']:
-                        if old_w > sizes[-1]:
-                                if how == 'up256_prop':
-                                        image.thumbnail((sizes[-1], old_h), method)
-                                elif how == 'up256_no_prop':
-                                        image = image.resize((sizes[-1], old_h), method)
-                        elif old_h > sizes[-1]:
-                                if how == 'up256_prop':
-                                        image.thumbnail((old_w, sizes[-1]), method)
-                                elif how == 'up256_no_prop':
-                                        image = image.resize((old_w, sizes[-1]), method)
-                        elif (old_h > 256) and (old_w > 256):
-                                if how == 'up256_prop':
-                                        image.thumbnail((sizes[-1], sizes[-1]), method)
-                                elif how == 'up256_no_prop':
-                                        image = image.resize((sizes[-1], sizes[-1]), method)
-                        else:
-                                resized = False
-                elif how == 'square':
-                        new_d = min(sizes, key = lambda x : abs(x - max(old_w, old_h)))
-                        image = image.resize((new_d, new_d), method)
-                elif isinstance(how, tuple):
-                        image = image.resize(how, method)
-
-                if resized:
+        def ico_resize(self, image, how = 'up256_prop', method = Image.LANCZOS):
+                """ Resizes to `.ico` / `.cur` dimensions (image can be already shrunk, see `prescale`). """
+                old_w, old_h = self.parameters['source_size']
+                self.source.size = '%s x %s' %(old_w, old_h)
+
+                target = resize_target(old_w, old_h, how)
+                if target is not None:
+                        image = image.resize(target, method)
                         self.parameters['bWidth'], self.parameters['bHeight'] = image.size
-                        self.all_icocur_written[self.path_icocur][self.index].update({'resize' : '%s x %s' %(self.parameters['bWidth'],
-                                                                                                             self.parameters['bHeight'])})
+                        self.source.resize = '%s x %s' %(self.parameters['bWidth'], self.parameters['bHeight'])
                 return image
 
-        def header_icondir(self):
-                """ Defines the ICONDIR header. """
-                ## (2bytes)idReserved (always 0) - (2bytes)idType (ico=1, cur=2) - (2bytes)idCount.
-                self.parameters['bReserved'] = 0
-                return pack('3H', self.parameters['bReserved'], self.parameters['idType'], self.parameters['idCount'])
-
         def header_bmpinfo(self):
                 """ Defines the BMPINFO header. """
-                ## (4bytes)biSize - (4bytes)biWidth - (4bytes)biHeight - (2bytes)biPlanes - (2bytes)biBitCount -
-                ## - (4bytes)biCompression - (4bytes)biSizeImage -
-                ## - (4bytes)biXPelsPerMeter - (4bytes)biYPelsPerMeter - (4bytes)biClrused - (4bytes)biClrImportant.
-                biSize = calcsize('3I2H2I2i2I')
+                biSize = BITMAPINFOHEADER.size
                 biWidth = self.parameters['bWidth']
                 # include the mask height
                 biHeight = self.parameters['bHeight'] * 2
@@ -1288,22 +3044,18 @@ class Encode(object):
                 biClrUsed = self.parameters['bColorCount']
                 biClrImportant = 0
 
-                return pack('3I2H2I2i2I', biSize, biWidth, biHeight, biPlanes, biBitCount, biCompression, biSizeImage,
-                                          biXPelsPerMeter, biYPelsPerMeter, biClrUsed, biClrImportant)
+                return BITMAPINFOHEADER.pack(biSize, biWidth, biHeight, biPlanes, biBitCount, biCompression, biSizeImage,
+                                             biXPelsPerMeter, biYPelsPerMeter, biClrUsed, biClrImportant)
 
-        def to_icocur(self, path_image, hotspot):
-                """ Creates result of conversion. """
-                image, xordata = self.load(path_image)
-                if hotspot != "":
-                        self.all_icocur_written[self.path_icocur][self.index].update({'hotspot_x' : hotspot[0],
-                                                                                      'hotspot_y' : hotspot[1]})
+        def to_entry(self, path_image, data):
+                """ Converts an image to icondirentry values and image data. """
+                with self.timings.stage('load'):
+                        image, xordata = self.load(path_image, data)
                 self.parameters['wPlanes'] = 0
 
                 ## Identify palette.
-                self.ico_palette(image)
-
-                ## Keep offset.
-                dataoffset = self.parameters['dwImageOffset']
+                with self.timings.stage('palette'):
+                        self.ico_palette(image)
 
                 ## Generate BITMAPINFO header.
                 icobytes = self.header_bmpinfo()
@@ -1316,134 +3068,1002 @@ class Encode(object):
                 icobytes += xordata
 
                 ## Write AND mask.
-                if self.mode == 'RGBA':
-                        icobytes += Mask().compute_AND_mask(self.parameters['bWidth'], self.parameters['bHeight'], xordata)
+                if self.parameters['and'] is not None:
+                        icobytes += self.parameters['and']
+                elif self.mode == 'RGBA':
+                        with self.timings.stage('mask'):
+                                icobytes += Mask().compute_AND_mask(self.parameters['bWidth'], self.parameters['bHeight'], xordata)
                 else:
-                        icobytes += pack('B', 0) * self.parameters['size_and']
+                        icobytes += bytes(self.parameters['size_and'])
 
-                ## Increment offset.
-                self.parameters['dwImageOffset'] += len(icobytes)
-                ## Calculate size of (icondirentry + image data).
-                self.parameters['dwBytesInRes'] = len(icobytes)
                 ## Define correct dimension, 0 means 256 (or more).
                 if self.parameters['bWidth'] >= 256: self.parameters['bWidth'] = 0
                 if self.parameters['bHeight'] >= 256: self.parameters['bHeight'] = 0
 
-                ## Pack icondirentry header.
-                icondirentry = pack('4B2H2I', self.parameters['bWidth'], self.parameters['bHeight'], self.parameters['bColorCount'],
-                                              self.parameters['bReserved'],
-                                             (self.parameters['wPlanes'] if hotspot == "" else hotspot[0]),
-                                             (self.parameters['wBitCount'] if hotspot == "" else hotspot[1]),
-                                              self.parameters['dwBytesInRes'], dataoffset)
+                entry = {'bWidth'      : self.parameters['bWidth'],
+                         'bHeight'     : self.parameters['bHeight'],
+                         'bColorCount' : self.parameters['bColorCount'],
+                         'wPlanes'     : self.parameters['wPlanes'],
+                         'wBitCount'   : self.parameters['wBitCount']}
+
+                return entry, icobytes
+
+def pack_icocur(entries, identf = 1):
+        """ Packs ICONDIR header (`.ico` identf = 1, `.cur` identf = 2), icondirentries and images data. """
+        ## idReserved always 0.
+        header = bytearray(ICONDIR.size + ICONDIRENTRY.size * len(entries))
+        ICONDIR.pack_into(header, 0, 0, identf, len(entries))
+        ## Size of all the headers (image headers + file header).
+        dataoffset = len(header)
+
+        for indx, (entry, icobytes) in enumerate(entries):
+                ICONDIRENTRY.pack_into(header, ICONDIR.size + ICONDIRENTRY.size * indx,
+                                       entry['bWidth'], entry['bHeight'], entry['bColorCount'], 0,
+                                       entry['wPlanes'], entry['wBitCount'], len(icobytes), dataoffset)
+                dataoffset += len(icobytes)
+
+        return bytes(header), b"".join(icobytes for _, icobytes in entries)
+
+def encode_image(image, path = 'stream', type_resize = 'up256_prop', force_to = 'original', custom_palettes = {},
+                 resample = 'lanczos', reducing_gap = 2., timings = None):
+        """ Converts an image (bytes or PIL image) to an `.ico` / `.cur` entry, as (entry, icobytes, record of the image).
+            Shared by `encode_entries` and `Encode`: options are expected already checked (`force_to` normalized).
+        """
+        if isinstance(image, Image.Image):
+                buffer = BytesIO()
+                image.save(buffer, format = 'PNG')
+                image = buffer.getvalue()
+        writer = IconWriter(type_resize, force_to, custom_palettes, resample, reducing_gap, timings)
+        entry, icobytes = writer.to_entry(path, image)
+        return entry, icobytes, writer.source
+
+def encode_entries(images, frmt = '.ico', hotspot = None, type_resize = 'up256_prop', force_to = 'original', custom_palettes = {},
+                   resample = 'lanczos', reducing_gap = 2., timings = None):
+        """ Encodes images (bytes or PIL images) to `.ico` / `.cur` bytes, an entry each (a `.cur` has one image).
+            Reentrant: can be called concurrently (e.g. from a thread pool); images not converted raise `EncodeErr`,
+            invalid options `ValueError`.
+        """
+        if frmt not in ['.ico', '.cur']:
+                raise ValueError("Input error: format '%s' not `.ico` / `.cur`." %frmt)
+        if frmt == '.ico' and hotspot is not None:
+                raise ValueError("Input error: hotspot specification invalid for `.ico` conversion.")
+        hotspot = (hotspot or (0, 0))
+        if not (isinstance(hotspot, tuple) and len(hotspot) == 2 and all(isinstance(hot, int) for hot in hotspot)):
+                raise ValueError("Input error: hotspot specification not proper defined.")
+        if frmt == '.cur' and len(images) != 1:
+                raise ValueError("Input error: can't create multi-size '.cur'.")
+        if resample not in resize_filters:
+                raise ValueError("Input error: option `resample` unknown '%s' filter." %resample)
+        force = parse_force_to(force_to, auto = True)
+        if force is None:
+                raise ValueError("Input error: option `force_to` not proper defined.")
+
+        entries = []
+        for indx, image in enumerate(images):
+                entry, icobytes, _ = encode_image(image, "stream_%s" %indx, type_resize, force, custom_palettes,
+                                                  resample, reducing_gap, timings)
+                if frmt == '.cur':
+                        entry = dict(entry, wPlanes = hotspot[0], wBitCount = hotspot[1])
+                entries.append((entry, icobytes))
+        header, data = pack_icocur(entries, (1 if frmt == '.ico' else 2))
+        return header + data
 
-                return icondirentry, icobytes
+class Encode(object):
+
+        def __init__(self, paths_images, paths_icocur = [], names_icocur = [], formats_icocur = [],
+                     type_resize = 'up256_prop', force_to = 'original', custom_palettes = {}, hash_index = None, manifest = None,
+                     in_memory = False, profile = False, recursive = False, include = [], exclude = [], archive = None,
+                     resample = 'lanczos', reducing_gap = 2., is_cli = False):
+
+                """
+                    `paths_images`   : a list of lists   : every list can contain one/more image(s) path(s)
+                                                           and/or one/more folder image(s) path(s) to convert
+                                                           and/or one/more zip / tar archive(s) path(s) (as folders, members are read
+                                                           without extraction)
+                                                           and/or one/more image(s) as bytes stream(s).
+                    `paths_icocur`   : a list            : contains output path(s) for every resulting conversion.
+                                                           If `paths_icocur` isn't defined, working directory is used.
+                    `names_icocur`   : a list            : contains output name(s) for every resulting conversion.
+                                                           If `paths_images` contains a *folder path* and corresponding `names_icocur` is defined,
+                                                           a multi-`.ico` is created (note: multi-`.cur` creation is forbidden), otherwise
+                                                           every image in *folder path* is converted to a single `.ico` / `.cur`.
+                    `formats_icocur` : a list            : contains format(s) for every resulting conversion (that is ".ico" or ".cur").
+                                                           If ".cur", can be specified hotspot x (integer) and hotspot y (integer)
+                                                           using a tuple; example: (".cur", 2, 5).
+                    `type_resize`    : a string or tuple : If used 'up256_prop' / 'up256_no_prop' dimensions greater than 256 pixels are resized
+                                                           keeping / without keeping global image aspect ratio.
+                                                           If used 'square', dimensions are resized to nearest square standard size.
+                                                           Can be also provided a custom resize tuple (width, height).
+                    `force_to`       : a string, int     : If 'original', original bit depth is kept.
+                                       or tuple            : If 1, 4, 8, 24, 32 the image is converted to that bit depth;
+                                                           for indexed depths a tuple (bits, method, dither) selects quantizer method
+                                                           ('mediancut', 'maxcoverage', 'octree' or a `.gpl` path / shipped palette name)
+                                                           and Floyd-Steinberg dithering; example: (4, 'octree', True).
+                    `custom_palettes`: a dict            : The key is a tuple (mode, bitdepth), the value can be
+                                                           a list of RGB tuples [(R1,G1,B1),...,(Rn,Bn,Gn)] (usual palette format) or
+                                                           a list flat [V1,V2,...,Vn] (compact format for grayscale palette) or
+                                                           a '.gpl' file path.
+                    `hash_index`     : a HashIndex       : content-addressed index of converted sources (bounded LRU); pass the same one
+                                                           to reuse it across batches (a new one is used if not defined).
+                    `manifest`       : a string          : path of a manifest file enabling incremental mode: jobs whose sources and options
+                                                           are unchanged are skipped (see `skipped`), outputs whose sources disappeared
+                                                           are reported (see `orphans`).
+                    `in_memory`      : a bool            : if 'True', `.ico` / `.cur` are not saved but kept as bytes (see `all_icocur_bytes`).
+                    `profile`        : a bool or callable : if 'True', time spent per stage (read, parse, resize, icc, load, quantize,
+                                                           palette, mask, pack, save) is collected into results of every file
+                                                           (key 'timings') and totalled per run (see `timings`).
+                                                           A callable is also called with (file, timings) of every converted file.
+                    `recursive`      : a bool            : if 'True', images of subfolders of folder paths are converted too.
+                    `include`        : a list            : globs of images converted from folders (relative paths), all if empty.
+                    `exclude`        : a list            : globs of images / subfolders skipped in folders (relative paths).
+                    `archive`        : a string          : path of a zip / tar archive where `.ico` / `.cur` are written
+                                                           (`paths_icocur` are folders inside it).
+                    `resample`       : a string          : filter of resizing ('nearest', 'box', 'bilinear', 'hamming', 'bicubic', 'lanczos').
+                    `reducing_gap`   : a float           : large images are shrunk before loading them whole (JPEG DCT scaling, integer
+                                                           factors reduction) down to `reducing_gap` times the resized size,
+                                                           then filtered. None disables (every pixel is filtered).
+                    `is_cli`         : a bool            : if 'True', messages are printed on console (command line).
+                """
+
+                # lists are copied, checks fill them in place.
+                self.paths_images = paths_images
+                self.paths_icocur = (list(paths_icocur) if isinstance(paths_icocur, list) else paths_icocur)
+                self.names_icocur = (list(names_icocur) if isinstance(names_icocur, list) else names_icocur)
+                self.formats_icocur = (list(formats_icocur) if isinstance(formats_icocur, list) else formats_icocur)
+                self.type_resize = type_resize
+                self.force_to = force_to
+                self.custom_palettes = custom_palettes
+                self.hash_index = (HashIndex() if hash_index is None else hash_index)
+                self.manifest = open_manifest(manifest)
+                self.in_memory = in_memory
+                self.timings = Timings(profile)
+                self.recursive, self.include, self.exclude = recursive, include, exclude
+                self.archive = archive
+                self.resample, self.reducing_gap = resample, reducing_gap
+                self.is_cli = is_cli
+                self.build()
+
+        def add_name2path(self, name, frmt, indx):
+                """ Adds `.ico` / `.cur` name to output path. """
+                couple = (self.path_icocur, name)
+                current_indx = (self.remind[couple] + 1 if couple in self.remind.keys() else indx)
+                current_name = (name + '_' + str(current_indx) if couple in self.remind.keys() else name)
+                self.remind.update({(self.path_icocur, name) : current_indx})
+                self.path_icocur = join(self.path_icocur, current_name + frmt)
+
+        def add_errors(self, msg):
+                """ Assigns / prints process errors."""
+                self.results[self.path_icocur] = EncodeJobResult(path = self.path_icocur, error = msg)
+                self.print_err(msg)
+
+        def current(self):
+                """ Gets the record of the image in conversion. """
+                return self.results[self.path_icocur].sources[self.index]
+
+        def add_source(self, source):
+                """ Adds the record of an image to the `.ico` / `.cur` in conversion. """
+                if self.path_icocur not in self.results:
+                        self.results[self.path_icocur] = EncodeJobResult(path = self.path_icocur, sources = [source])
+                else:
+                        self.results[self.path_icocur].sources.append(source)
+
+        def check_output(self):
+                """ Verifies if output paths, names, formats are ok. """
+                ## Check other options.
+                if not isinstance(self.type_resize, (tuple, str)):
+                        raise ValueError("Input error: option `type_resize` not a tuple or a string.")
+                else:
+                        if isinstance(self.type_resize, tuple) and not (len(self.type_resize) == 2 \
+                                                                        and all(isinstance(tyr, int) for tyr in [self.type_resize[0], self.type_resize[1]]) \
+                                                                        and self.type_resize[0] <= 256 and self.type_resize[1] <= 256):
+                                raise ValueError("Input error: option `type_resize` tuple not proper defined.")
+                        elif isinstance(self.type_resize, str) and (self.type_resize not in ['up256_prop', 'up256_no_prop', 'square']):
+                                raise ValueError("Input error: option `type_resize` unknown '%s' method." %self.type_resize)
+                if self.resample not in resize_filters:
+                        raise ValueError("Input error: option `resample` unknown '%s' filter." %self.resample)
+                if self.reducing_gap is not None and (not isinstance(self.reducing_gap, (int, float)) or isinstance(self.reducing_gap, bool) \
+                                                      or self.reducing_gap < 1):
+                        raise ValueError("Input error: option `reducing_gap` not a number >= 1.")
+
+                force_to = parse_force_to(self.force_to, auto = True)
+                if force_to is None:
+                        raise ValueError("Input error: option `force_to` not proper defined.")
+                self.force_to = force_to
+                ## Check folder scanning options.
+                check_scan(self.recursive, self.include, self.exclude)
+                if self.archive is not None and not is_archive(self.archive):
+                        raise ValueError("Input error: option `archive` not a zip / tar path.")
+
+                ## Check paths.
+                msg = "icon / cursor"
+                if self.archive:
+                        Check(self.paths_images, self.paths_icocur).members(msg, self.archive)
+                else:
+                        Check(self.paths_images, self.paths_icocur).paths(msg)
+                ## Check names.
+                Check(self.paths_images, self.names_icocur).names(msg)
+                ## Check formats.
+                # 1 - check length list.
+                frmtchk = Check(self.paths_images, self.formats_icocur)
+                frmtchk.formats(msg, ".ico", check = False)
+                # 2 - check hotspots (for `.cur`).
+                self.hotspots = []
+                for i, frmt in enumerate(self.formats_icocur):
+                        if isinstance(frmt, tuple):
+                                if frmt[0] == '.ico':
+                                        raise ValueError("Input error: hotspot specification invalid for `.ico` conversion.")
+                                if all(not isinstance(hot, int) for hot in frmt[1::]) or (len(frmt[1::]) != 2):
+                                        raise ValueError("Input error: hotspot specification not proper defined.")
+
+                                self.formats_icocur[i] = frmt[0]
+                                self.hotspots.append(frmt[1::])
+                        else:
+                                if frmt == '.ico':
+                                        self.hotspots.append("")
+                                elif frmt == '.cur':
+                                        self.hotspots.append((0, 0))
+                # 3 - check extensions.
+                frmtchk.formats_checker(msg)
+
+        def build(self):
+                """ Verifies if input paths are ok and starts conversion job. """
+                self.print_std = partial(print_std, view = self.is_cli)
+                self.print_err = partial(print_err, view = self.is_cli)
+
+                ## Check paths images.
+                if self.paths_images and isinstance(self.paths_images, list):
+                        self.check_output()
+                        self.remind = {}
+                        # records (see `results`) and their view in the original dict shape.
+                        self.results = {}
+                        self.all_icocur_written = ResultsView(self.results)
+                        self.all_icocur_bytes = {}
+                        self.skipped, self.orphans = [], []
+
+                        self.writer, self.archives = open_writer(self.archive), []
+                        try:
+                                self.convert()
+                        finally:
+                                for archive in self.archives:
+                                        archive.close()
+                                if self.writer:
+                                        self.writer.close()
+
+                        if self.manifest:
+                                self.orphans = self.manifest.orphans()
+                                for orphan in self.orphans:
+                                        self.print_std('orphan = %s (sources disappeared)' %orphan)
+                                self.manifest.save()
+                else:
+                        raise ValueError("Input error: image file/directory path/s not a list of lists.")
+
+        def to_icocur(self, path_image, hotspot, data = None):
+                """ Creates result of conversion. """
+                if data is None:
+                        with self.timings.stage('read'), open(path_image, 'rb') as file:
+                                data = file.read()
+
+                ## Duplicate sources are converted once.
+                key = self.hash_index.key(data, self.type_resize, self.force_to, self.custom_palettes, self.resample, self.reducing_gap)
+                cached = self.hash_index.get(key)
+                if cached:
+                        entry, icobytes, source = cached
+                        self.add_source(source.copy(file = path_image))
+                else:
+                        with self.timings.stage('pack'):
+                                entry, icobytes, source = encode_image(data, path_image, self.type_resize, self.force_to, self.custom_palettes,
+                                                                       self.resample, self.reducing_gap, self.timings)
+                        self.add_source(source)
+                        self.hash_index.put(key, (entry, icobytes, source.copy()))
+
+                if hotspot != "":
+                        current = self.current()
+                        current.hotspot_x, current.hotspot_y = hotspot
+                        entry = dict(entry, wPlanes = hotspot[0], wBitCount = hotspot[1])
+
+                return entry, icobytes
 
         def printsave(self, how, header, data, hotspot):
                 """ Saves conversion file and print results. """
 
                 def printresult(indx):
-                        result = self.all_icocur_written[self.path_icocur][indx]
-                        self.print_std('\nfile = %s' %result['file'])
-                        self.print_std('{:<30} {:>10} {:>10}'.format('mode = %s' %result['mode'],
-                                                                     'depth = %s' %result['depth'],
-                                                                     'size = %s' %result['size']))
-
-                        if 'new_mode' in result:
-                                if 'resize' in result:
-                                        self.print_std('{:<30} {:>10} {:>10}'.format('new mode = %s' %result['new_mode'],
-                                                                                     'new depth = %s' %result['new_depth'],
-                                                                                     'resize = %s' %result['resize']))
+                        result = self.results[self.path_icocur].sources[indx]
+                        self.print_std('\nfile = %s' %result.file)
+                        self.print_std('{:<30} {:>10} {:>10}'.format('mode = %s' %result.mode,
+                                                                     'depth = %s' %result.depth,
+                                                                     'size = %s' %result.size))
+
+                        if result.new_mode is not None:
+                                if result.resize is not None:
+                                        self.print_std('{:<30} {:>10} {:>10}'.format('new mode = %s' %result.new_mode,
+                                                                                     'new depth = %s' %result.new_depth,
+                                                                                     'resize = %s' %result.resize))
                                 else:
-                                        self.print_std('{:<30} {:>10}'.format('new mode = %s' %result['new_mode'],
-                                                                              'new depth = %s' %result['new_depth']))
+                                        self.print_std('{:<30} {:>10}'.format('new mode = %s' %result.new_mode,
+                                                                              'new depth = %s' %result.new_depth))
                         else:
-                                if 'resize' in result:
-                                        self.print_std('{:<30} {:>10} {:>10}'.format("", "", 'resize = %s' %result['resize']))
+                                if result.resize is not None:
+                                        self.print_std('{:<30} {:>10} {:>10}'.format("", "", 'resize = %s' %result.resize))
 
                         if hotspot != "":
                                 self.print_std('{:<30} {:>10} {:>10}'.format("", "", 'hotspot = %s' %str(hotspot)))
+                        if result.duplicate is not None:
+                                self.print_std('duplicate of = %s (dropped)' %result.duplicate)
 
                 # printing process.
                 if how == 'single':
                         printresult(0)
                         self.print_std('saved = %s' %self.path_icocur)
                 elif how == 'multi':
-                        for indx in range(self.parameters['idCount']):
+                        for indx in range(len(self.results[self.path_icocur].sources)):
                                 printresult(indx)
                         self.print_std('\nsaved = %s' %self.path_icocur)
                 # save.
-                with open(self.path_icocur, 'wb') as f_ico:
-                        f_ico.write(header)
-                        f_ico.write(data)
+                with self.timings.stage('save'):
+                        if self.in_memory:
+                                self.all_icocur_bytes[self.path_icocur] = header + data
+                        elif self.writer:
+                                self.writer.put(self.path_icocur, header + data)
+                        else:
+                                with open(self.path_icocur, 'wb') as f_ico:
+                                        f_ico.write(header)
+                                        f_ico.write(data)
+
+        def convert(self):
+                """ Converts every group of images (files, folders, archives and bytes inputs). """
+                groups = zip(self.paths_images, self.paths_icocur, self.names_icocur, self.formats_icocur, self.hotspots)
+                for indx, (path_image, self.path_icocur, name, frmt, hotspot) in enumerate(groups):
+                        self.print_std('#' * 80)
+                        no_err, paths = True, []
+
+                        if isinstance(path_image, list):
+                                if not path_image:
+                                        no_err = False
+                                        message = "Input error: image file/directory path/s missing."
+                                else:
+                                        for imapath in path_image:
+                                                if isinstance(imapath, bytes):
+                                                        paths.append(imapath)
+                                                elif not isinstance(imapath, str):
+                                                        no_err = False
+                                                        message = "Input error: image file/directory path '%s' not a string." %imapath
+                                                else:
+                                                        if is_archive(imapath) and isfile(imapath):
+                                                                # members are read when converted.
+                                                                archive = Archive(imapath)
+                                                                self.archives.append(archive)
+                                                                members = list(archive.members(self.recursive, self.include, self.exclude,
+                                                                                               extensions = image_extensions()))
+                                                                if not members:
+                                                                        no_err = False
+                                                                        message = archive.missing(self.recursive)
+                                                                paths.extend(members)
+                                                        elif isfile(imapath):
+                                                                paths.append(imapath)
+                                                        else:
+                                                                if isdir(imapath):
+                                                                        paths.extend(scan(imapath, self.recursive, self.include, self.exclude,
+                                                                                          extensions = image_extensions()))
+                                                                else:
+                                                                        no_err = False
+                                                                        message = "Input error: file/directory '%s' not found." %imapath
+
+                                        if len(paths) > 1:
+                                                if frmt == '.cur':
+                                                        if name != "":
+                                                                no_err = False
+                                                                message = "Input error: can't create multi-size '.cur'."
+                                                        else:
+                                                                # eventually remove duplicate jobs (keeping order).
+                                                                paths = list(OrderedDict.fromkeys(paths))
+                                                elif frmt == '.ico':
+                                                        if name == "":
+                                                                name = 'multi'
+                        else:
+                                no_err = False
+                                message = "Input error: image file/directory path/s not a list of lists."
+
+                        ## Do job.
+                        if name != "":
+                                self.add_name2path(name, frmt, indx)
+                        if not no_err:
+                                if name == "":
+                                        self.add_name2path('noname', frmt, indx)
+                                self.add_errors(message)
+                        else:
+                                self.work(paths, name, frmt, hotspot)
+
+        def up_to_date(self, sources, options):
+                """ Checks (incremental mode) whether current job can be skipped. """
+                if self.manifest and all(isinstance(source, str) for source in sources) \
+                   and self.manifest.is_current(self.path_icocur, sources, options):
+                        self.skipped.append(self.path_icocur)
+                        self.print_std('skipped = %s (up to date)' %self.path_icocur)
+                        return True
+                return False
+
+        def remember(self, sources, options):
+                """ Records (incremental mode) current job as done. """
+                if self.manifest and not (self.in_memory or self.writer) and all(isinstance(source, str) for source in sources):
+                        self.manifest.record(self.path_icocur, sources, options, [self.path_icocur])
 
         def work(self, paths, name, frmt, hotspot):
                 """ Executes conversion job."""
-                self.parameters = {}
-
-                if frmt == '.ico':
-                        self.parameters['idType'] = 1
-                elif frmt == '.cur':
-                        self.parameters['idType'] = 2
+                identf = (1 if frmt == '.ico' else 2)
 
+                options = (frmt, hotspot, self.type_resize, self.force_to, self.custom_palettes, self.resample, self.reducing_gap)
                 if name == "":
                         how = 'single'
                         path_temp = self.path_icocur
                 else:
                         how = 'multi'
-                        ## Define header of `.ico` file.
-                        self.parameters['idCount'] = len(paths)
-                        icocur_header, icocur_data = self.header_icondir(), b""
-                        ## Size of all the headers (image headers + file header)
-                        ## (1byte)bWidth - (1byte)bHeight - (1byte)bColorCount - (1byte)bReserved -
-                        ## -(2bytes)wPlanes - (2bytes)wBitCount - (4bytes)dwBytesInRes - (4bytes)dwImageOffset.
-                        self.parameters['dwImageOffset'] = calcsize('4B2H2I') * self.parameters['idCount'] + calcsize('HHH')
+                        entries, seen = [], {}
+                        if self.up_to_date(paths, options):
+                                return
 
                 ## Create `.ico` / `.cur`.
                 for self.index, path_image in enumerate(paths):
+                        data = None
+                        self.timings.begin()
+                        if isinstance(path_image, bytes):
+                                data, path_image = path_image, "stream_%s" %self.index
+                        elif isinstance(path_image, tuple):
+                                # archive member.
+                                path_image, _, read = path_image
+                                with self.timings.stage('read'):
+                                        data = read()
                         try:
                                 if how == 'single':
                                         self.index = 0
-                                        self.parameters['idCount'] = 1
-                                        icocur_header, icocur_data = self.header_icondir(), b""
-                                        self.parameters['dwImageOffset'] = calcsize('4B2H2I') * self.parameters['idCount'] + calcsize('HHH')
+                                        entries, seen = [], {}
                                         self.path_icocur = join(path_temp, splitext(basename(path_image))[0] + frmt)
+                                        if data is None and self.up_to_date([path_image], options):
+                                                continue
 
-                                icondirentry, icobytes = self.to_icocur(path_image, hotspot)
-                                icocur_header += icondirentry
-                                icocur_data += icobytes
+                                entry, icobytes = self.to_icocur(path_image, hotspot, data)
+                                ## Drop entries identical to a previous one.
+                                digest = sha1(icobytes).hexdigest()
+                                if digest in seen:
+                                        self.current().duplicate = seen[digest]
+                                else:
+                                        seen[digest] = path_image
+                                        entries.append((entry, icobytes))
 
                                 if how == 'single':
                                         ## Save `.ico` / `.cur` (single).
-                                        self.printsave(how, icocur_header, icocur_data, hotspot)
+                                        self.printsave(how, *pack_icocur(entries, identf), hotspot)
+                                        if data is None:
+                                                self.remember([path_image], options)
                                 elif how == 'multi':
                                         ## Save `.ico` / `.cur` (multi).
-                                        if self.index == self.parameters['idCount'] - 1:
-                                                self.printsave(how, icocur_header, icocur_data, hotspot)
+                                        if self.index == len(paths) - 1:
+                                                self.printsave(how, *pack_icocur(entries, identf), hotspot)
+                                                self.remember(paths, options)
+
+                                if self.timings.enabled:
+                                        self.current().timings = self.timings.end(path_image)
 
                         except EncodeErr as e:
-                                self.all_icocur_written.update({self.path_icocur : e.msg})
-                                self.print_err(e.msg, toexit = (False if how == 'single' else True))
+                                self.results[self.path_icocur] = EncodeJobResult(path = self.path_icocur, error = e.msg)
+                                self.print_err(e.msg)
                                 if how == 'single':
                                         continue
                                 elif how == 'multi':
                                         return
 
-if __name__ == "__main__":
-        is_cli = True
-        opts = iconolatry_parser()
-        if opts['mode'] == 'decode':
-                Decode(opts['paths_icocurs'],
-                       paths_image = opts['paths_image'],
-                       names_image = opts['names_image'],
-                       formats_image = opts['formats_image'],
-                       rebuild = opts['rebuild'])
+## _________________
+##| Favicon Bundle  |-----------------------------------------------------------------------------------------------------------------------------------------
+##|_________________|
+##
+
+class Favicon(object):
+
+        def __init__(self, path_master, path_bundle = "", name_icon = 'favicon', sizes_icon = [16, 32, 48],
+                     sizes_png = {'apple-touch-icon.png' : 180, 'android-chrome-192x192.png' : 192, 'android-chrome-512x512.png' : 512},
+                     name_site = "", workers = 4, is_cli = False):
+
+                """
+                    `path_master`   : a string : path of the master image (decoded once, every target is resized from it).
+                    `path_bundle`   : a string : output path of the bundle. If isn't defined, working directory is used.
+                    `name_icon`     : a string : name of the `.ico` (multi-size).
+                    `sizes_icon`    : a list   : sizes of the `.ico` images.
+                    `sizes_png`     : a dict   : the key is a `.png` file name, the value its size.
+                    `name_site`     : a string : site name written into `site.webmanifest`.
+                    `workers`       : an int   : number of threads saving `.png`s.
+                    `is_cli`        : a bool   : if 'True', messages are printed on console (command line).
+                """
+
+                self.path_master = path_master
+                self.path_bundle = path_bundle or abspath('.')
+                self.name_icon = name_icon
+                self.sizes_icon = sizes_icon
+                self.sizes_png = sizes_png
+                self.name_site = name_site
+                self.workers = workers
+                self.is_cli = is_cli
+                self.build()
+
+        def pyramid(self, master):
+                """ Resizes master to every size needed, each level from the nearest larger one. """
+                levels, level = {}, master
+                for size in sorted(set(self.sizes_icon) | set(self.sizes_png.values()), reverse = True):
+                        source = (level if level.size[0] >= size else master)
+                        level = levels[size] = source.resize((size, size), Image.LANCZOS)
+                return levels
+
+        def load(self):
+                """ Decodes master image as a square RGBA. """
+                image = Image.open(self.path_master)
+                if image.info.get('icc_profile'):
+                        image = icc_cache.apply(image)
+                image = image.convert('RGBA')
+                side = max(image.size)
+                if image.size != (side, side):
+                        square = Image.new('RGBA', (side, side), (0, 0, 0, 0))
+                        square.paste(image, ((side - image.size[0]) // 2, (side - image.size[1]) // 2))
+                        image = square
+                return image
+
+        def snippet(self):
+                """ Gets HTML snippet linking the bundle. """
+                lines = ['<link rel="icon" href="/%s.ico" sizes="%s">' %(self.name_icon, ' '.join('%sx%s' %(s, s) for s in self.sizes_icon))]
+                for file, size in self.sizes_png.items():
+                        if size == 180:
+                                lines.append('<link rel="apple-touch-icon" href="/%s">' %file)
+                        elif file.startswith('favicon'):
+                                lines.append('<link rel="icon" type="image/png" sizes="%sx%s" href="/%s">' %(size, size, file))
+                lines.append('<link rel="manifest" href="/site.webmanifest">')
+                return '\n'.join(lines)
+
+        def build(self):
+                """ Creates every target of the bundle from one decoded master. """
+                self.print_std = partial(print_std, view = self.is_cli)
+                self.all_favicon_written = {}
+
+                if not isfile(self.path_master):
+                        raise ValueError("Input error: master image '%s' not found." %self.path_master)
+                if not isdir(self.path_bundle):
+                        raise ValueError("Input error: bundle directory path '%s' not found." %self.path_bundle)
+                if not all(isinstance(size, int) and 1 <= size <= 256 for size in self.sizes_icon):
+                        raise ValueError("Input error: option `sizes_icon` not sizes from 1 to 256.")
+
+                levels = self.pyramid(self.load())
+
+                ## Save `.png`s (in parallel) while `.ico` is encoded.
+                def save_png(file, size):
+                        path = join(self.path_bundle, file)
+                        levels[size].save(path, format = 'PNG')
+                        return path, size
+
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers = self.workers) as pool:
+                        pngs = [pool.submit(save_png, file, size) for file, size in self.sizes_png.items()]
+
+                        ## Levels are encoded as they are (not resized again), an entry each.
+                        path = join(self.path_bundle, self.name_icon + '.ico')
+                        with open(path, 'wb') as fd:
+                                fd.write(encode_entries([levels[size] for size in self.sizes_icon]))
+                        self.all_favicon_written[path] = [{'size' : '%s x %s' %(size, size)} for size in self.sizes_icon]
+                        self.print_std('saved = %s' %path)
+
+                        for future in pngs:
+                                path, size = future.result()
+                                self.all_favicon_written[path] = {'size' : '%s x %s' %(size, size)}
+                                self.print_std('saved = %s' %path)
+
+                ## Write web manifest.
+                webmanifest = {'name'       : self.name_site,
+                               'short_name' : self.name_site,
+                               'icons'      : [{'src' : '/' + file, 'sizes' : '%sx%s' %(size, size), 'type' : 'image/png'} \
+                                               for file, size in self.sizes_png.items() if size != 180],
+                               'display'    : 'standalone'}
+                path = join(self.path_bundle, 'site.webmanifest')
+                with open(path, 'w') as fd:
+                        json.dump(webmanifest, fd, indent = 2)
+                self.all_favicon_written[path] = webmanifest
+                self.print_std('saved = %s' %path)
+
+                self.html = self.snippet()
+                self.print_std('\n' + self.html)
+
+## _____________
+##| Batch Jobs  |---------------------------------------------------------------------------------------------------------------------------------------------
+##|_____________|
+##
+
+def jsonable(result):
+        """ Gets a JSON serializable copy of conversion results. """
+        if isinstance(result, Record):
+                result = result.as_dict()
+        if isinstance(result, Mapping):
+                return {key : ('%s %s x %s' %(value.mode, *value.size) if key == 'im_obj' else
+                               'RGBA %s x %s' %tuple(value.shape[1::-1]) if key == 'pixels' else jsonable(value)) for key, value in result.items()}
+        elif isinstance(result, (list, tuple)):
+                return [jsonable(value) for value in result]
+        return result
+
+def run_profiled(convert, profile, *args, **kwargs):
+        """ Executes a conversion with stage timings and prints their breakdown.
+            If `profile` is a file path, cProfile stats are also dumped there (see `pstats`).
+        """
+        if not profile:
+                return convert(*args, **kwargs)
+
+        # totals are collected by the hook, so are reported also when conversion raises on option errors.
+        totals = {}
+        def collect(path, timings):
+                for stage, seconds in timings.items():
+                        totals[stage] = totals.get(stage, 0.) + seconds
+
+        profiler = None
+        if isinstance(profile, str):
+                from cProfile import Profile
+                profiler = Profile()
+        try:
+                if profiler:
+                        return profiler.runcall(convert, *args, profile = collect, **kwargs)
+                return convert(*args, profile = collect, **kwargs)
+        finally:
+                print_std('#' * 80 + '\n' + stages_report(totals), view = True)
+                if profiler:
+                        profiler.dump_stats(profile)
+                        print_std('cProfile stats = %s' %profile, view = True)
+
+def run_job(mode, job):
+        """ Executes one job (in a worker process) and gets its JSON result. """
+        from contextlib import redirect_stderr
+
+        def as_tuple(value):
+                return (tuple(value) if isinstance(value, list) else value)
+
+        start, stderr, timings = time(), StringIO(), None
+        try:
+                with redirect_stderr(stderr):
+                        inputs = job['inputs']
+                        if mode == 'encode':
+                                conv = Encode([inputs],
+                                              paths_icocur = [job.get('output', "")],
+                                              names_icocur = [job.get('name', "")],
+                                              formats_icocur = [as_tuple(job.get('format', '.ico'))],
+                                              type_resize = as_tuple(job.get('resize', 'up256_prop')),
+                                              resample = job.get('resample', 'lanczos'),
+                                              reducing_gap = job.get('reducing_gap', 2.),
+                                              force_to = as_tuple(job.get('force', 'original')),
+                                              profile = job.get('profile', False),
+                                              recursive = job.get('recursive', False),
+                                              include = job.get('include', []),
+                                              exclude = job.get('exclude', []),
+                                              archive = job.get('archive'))
+                                result = conv.results
+                        elif mode == 'decode':
+                                conv = Decode(inputs,
+                                              paths_image = [job.get('output', "")] * len(inputs),
+                                              names_image = [job.get('name', "")] * len(inputs),
+                                              formats_image = [job.get('format', '.png')] * len(inputs),
+                                              rebuild = job.get('rebuild', False),
+                                              force_to = as_tuple(job.get('force', 'original')),
+                                              profile = job.get('profile', False),
+                                              max_bytes = job.get('max_bytes', 16 << 20),
+                                              max_pixels = job.get('max_pixels', 1 << 24),
+                                              recursive = job.get('recursive', False),
+                                              include = job.get('include', []),
+                                              exclude = job.get('exclude', []),
+                                              archive = job.get('archive'),
+                                              atlas = job.get('atlas'),
+                                              atlas_size = as_tuple(job.get('atlas_size', (1024, 1024))),
+                                              atlas_only = as_tuple(job.get('atlas_only')),
+                                              phash_index = job.get('phash_index'),
+                                              phash_distance = job.get('phash_distance', 6),
+                                              phash_insert = job.get('phash_insert', True))
+                                result = conv.results
+                        # errors are kept as strings by the codecs.
+                        ok, result = all(value.error is None for value in result.values()), jsonable(result)
+                        if conv.timings.enabled:
+                                timings = {stage : round(seconds, 6) for stage, seconds in conv.timings.run.items()}
+        except Exception as e:
+                ok, result = False, (stderr.getvalue().strip() or str(e) or repr(e))
+
+        done = {'id' : job['id'], 'ok' : ok, 'result' : result, 'time' : round(time() - start, 4)}
+        if timings:
+                done['timings'] = timings
+        return done
+
+def run_jobs(mode, jobs_file, workers = None, done_file = None):
+        """ Executes jobs of a JSON lines file by a worker pool, streaming results to stdout.
+            Done job ids are appended to `done_file` (default `jobs_file` + '.done'), so a restarted batch resumes.
+        """
+        from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+        done_file = done_file or jobs_file + '.done'
+        done = set()
+        if isfile(done_file):
+                with open(done_file, 'r') as fd:
+                        done = set(line.strip() for line in fd if line.strip())
+
+        def jobs():
+                """ Yields (job, None) of jobs not done, (None, error result) of lines not a JSON object. """
+                with open(jobs_file, 'r') as fd:
+                        for lineno, line in enumerate(fd):
+                                if not line.strip():
+                                        continue
+                                try:
+                                        job = json.loads(line)
+                                        if not isinstance(job, dict):
+                                                raise ValueError("not a JSON object")
+                                except ValueError as e:
+                                        yield None, {'id' : str(lineno), 'ok' : False,
+                                                     'result' : "Input error: job line %s malformed (%s)." %(lineno, e)}
+                                        continue
+                                job['id'] = str(job.get('id', lineno))
+                                if job['id'] not in done:
+                                        yield job, None
+
+        def emit(result, fd_done):
+                sys.stdout.write(json.dumps(result) + '\n')
+                sys.stdout.flush()
+                # malformed lines aren't done, a fixed line runs on restart.
+                if fd_done:
+                        fd_done.write(result['id'] + '\n')
+                        fd_done.flush()
+
+        workers = workers or cpu_count() or 1
+        with ProcessPoolExecutor(max_workers = workers) as pool, open(done_file, 'a') as fd_done:
+                # keep a bounded number of jobs in flight.
+                window, pending = 4 * workers, set()
+                for job, error in jobs():
+                        if error:
+                                emit(error, None)
+                                continue
+                        pending.add(pool.submit(run_job, mode, job))
+                        if len(pending) >= window:
+                                finished, pending = wait(pending, return_when = FIRST_COMPLETED)
+                                for future in finished:
+                                        emit(future.result(), fd_done)
+                for future in as_completed(pending):
+                        emit(future.result(), fd_done)
+
+## _________
+##| Server  |-------------------------------------------------------------------------------------------------------------------------------------------------
+##|_________|
+##
+
+def serve_decode(data, params):
+        """ Decodes an `.ico` / `.cur` request: an entry as image bytes, or all entries info as JSON. """
+        try:
+                result = decode_bytes(data, 'stream_0', rebuild = (params.get('rebuild', '0') in ['1', 'true']),
+                                      force_to = tupledict(params.get('force', 'original')))
+        except ValueError as e:
+                return 400, {'error' : str(e)}
+        if result.error is not None:
+                return 400, {'error' : result.error}
+
+        frmt = params.get('format', 'png').lstrip('.').lower()
+        if frmt == 'json':
+                return 200, jsonable(result)
+
+        index = int(params.get('index', 0))
+        if not 0 <= index < len(result.entries):
+                return 400, {'error' : "Input error: entry index not found."}
+        entry = result.entries[index]
+        if entry.error is not None:
+                return 400, {'error' : entry.error}
+        stream = BytesIO()
+        entry.im_obj.save(stream, format = frmt.upper())
+        return 200, stream.getvalue(), 'image/%s' %frmt
+
+def serve_encode(data, params):
+        """ Encodes an image request to `.ico` / `.cur` bytes. """
+        frmt = '.' + params.get('format', 'ico').lstrip('.').lower()
+        hotspot = (tupledict(params['hotspot']) if 'hotspot' in params else None)
+        try:
+                icobytes = encode_entries([data], frmt, hotspot,
+                                          type_resize = tupledict(params.get('resize', 'up256_prop')),
+                                          force_to = tupledict(params.get('force', 'original')))
+        except EncodeErr as e:
+                return 400, {'error' : e.msg}
+        except ValueError as e:
+                return 400, {'error' : str(e)}
+        return 200, icobytes, 'image/x-icon'
+
+@lru_cache(maxsize = None)
+def serve_classes():
+        """ Defines (once) handler and servers of `serve` mode. """
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn, UnixStreamServer
+        from urllib.parse import urlsplit, parse_qsl
+
+        class ServeHandler(BaseHTTPRequestHandler):
+                """ Handles requests of `serve` mode:
+                    POST /decode?format=png|json&index=0&rebuild=0&force=original   (body: `.ico` / `.cur` bytes)
+                    POST /encode?format=ico|cur&hotspot=x,y&resize=up256_prop&force=original   (body: image bytes)
+                    GET  /health
+                """
+                protocol_version = 'HTTP/1.1'
+                routes = {'/decode' : serve_decode,
+                          '/encode' : serve_encode}
+
+                def setup(self):
+                        # headers and body are written apart, avoid Nagle delays (TCP only).
+                        self.disable_nagle_algorithm = not isinstance(self.server, UnixStreamServer)
+                        BaseHTTPRequestHandler.setup(self)
+
+                def log_message(self, format, *args):
+                        pass
+
+                def reply(self, code, body, ctype = 'application/json'):
+                        if not isinstance(body, bytes):
+                                body = json.dumps(body).encode()
+                        self.send_response(code)
+                        self.send_header('Content-Type', ctype)
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+
+                def do_GET(self):
+                        if urlsplit(self.path).path == '/health':
+                                self.reply(200, {'status'    : 'ok',
+                                                 'icc_cache' : icc_cache.info(),
+                                                 'quantizer' : quantizer.info()})
+                        else:
+                                self.reply(404, {'error' : "Not found."})
+
+                def do_POST(self):
+                        url = urlsplit(self.path)
+                        params = dict(parse_qsl(url.query))
+                        length = int(self.headers.get('Content-Length', 0))
+                        if url.path not in self.routes:
+                                self.close_connection = True
+                                return self.reply(404, {'error' : "Not found."})
+                        if length > self.server.max_bytes:
+                                self.close_connection = True
+                                return self.reply(413, {'error' : "Request too large."})
+                        data = self.rfile.read(length)
+
+                        ## Limit concurrent conversions.
+                        if not self.server.slots.acquire(timeout = self.server.queue_timeout):
+                                return self.reply(503, {'error' : "Server busy."})
+                        try:
+                                answer = self.routes[url.path](data, params)
+                        except Exception as e:
+                                answer = (400, {'error' : "Request error: %s" %(str(e) or e.__class__.__name__)})
+                        finally:
+                                self.server.slots.release()
+                        self.reply(*answer)
+
+        class ServeHTTP(ThreadingMixIn, HTTPServer):
+                daemon_threads = False
+
+        class ServeUnix(ThreadingMixIn, UnixStreamServer):
+                daemon_threads = False
+
+        return ServeHandler, ServeHTTP, ServeUnix
+
+def remove_socket(path, strict = True):
+        """ Removes the Unix domain socket at a path (if any). Anything else there is kept:
+            it raises `ValueError` if `strict`, else it is ignored.
+        """
+        from os import lstat
+        from stat import S_ISSOCK
+        try:
+                mode = lstat(path).st_mode
+        except FileNotFoundError:
+                return
+        if S_ISSOCK(mode):
+                remove(path)
+        elif strict:
+                raise ValueError("Input error: socket path '%s' exists and is not a socket." %path)
+
+def serve(path_socket = None, host = '127.0.0.1', port = 8765, concurrency = 4, max_bytes = 16 << 20, queue_timeout = 10,
+          is_cli = False):
+        """ Runs a warm conversion server over a Unix domain socket (if `path_socket`) or localhost HTTP.
+            Stops gracefully (in-flight requests are completed) on SIGINT / SIGTERM.
+        """
+        from PIL import ImageCms
+        from threading import BoundedSemaphore, Thread, current_thread, main_thread
+        from signal import signal, SIGINT, SIGTERM
+        view = is_cli
+
+        ServeHandler, ServeHTTP, ServeUnix = serve_classes()
+        ## Warm up: palettes, sRGB profile, PIL plugins.
+        for file in listdir(palettes_path):
+                if file.endswith('.gpl'):
+                        palette_gpl(join(palettes_path, file))
+        if icc_cache.srgb is None:
+                icc_cache.srgb = ImageCms.createProfile('sRGB')
+        Image.init()
+
+        if path_socket:
+                remove_socket(path_socket)
+                server = ServeUnix(path_socket, ServeHandler)
+        else:
+                server = ServeHTTP((host, port), ServeHandler)
+        server.slots = BoundedSemaphore(concurrency)
+        server.max_bytes, server.queue_timeout = max_bytes, queue_timeout
+
+        def stop(signum, frame):
+                Thread(target = server.shutdown).start()
+        if current_thread() is main_thread():
+                signal(SIGINT, stop)
+                signal(SIGTERM, stop)
+
+        print_std('serving on %s' %(path_socket or 'http://%s:%s' %(host, port)), view = view)
+        try:
+                server.serve_forever()
+        finally:
+                # waits in-flight requests.
+                server.server_close()
+                if path_socket:
+                        remove_socket(path_socket, strict = False)
+                print_std('server stopped', view = view)
+
+def run_cli(opts):
+        """ Executes the command line mode: option errors raise `ValueError`, conversion is returned. """
+        if opts['mode'] in ['decode', 'encode'] and opts['jobs_file']:
+                return run_jobs(opts['mode'], opts['jobs_file'], workers = opts['workers'])
+        elif opts['mode'] == 'decode':
+                return run_profiled(Decode, opts['profile'], opts['paths_icocurs'],
+                                    paths_image = opts['paths_image'],
+                                    names_image = opts['names_image'],
+                                    formats_image = opts['formats_image'],
+                                    rebuild = opts['rebuild'],
+                                    force_to = opts['force_to'],
+                                    manifest = opts['manifest'],
+                                    max_bytes = opts['max_bytes'],
+                                    max_pixels = opts['max_pixels'],
+                                    recursive = opts['recursive'],
+                                    include = opts['include'],
+                                    exclude = opts['exclude'],
+                                    archive = opts['archive'],
+                                    atlas = opts['atlas'],
+                                    atlas_size = opts['atlas_size'],
+                                    atlas_only = opts['atlas_only'],
+                                    phash_index = opts['phash_index'],
+                                    phash_distance = opts['phash_distance'],
+                                    phash_insert = opts['phash_insert'],
+                                    is_cli = True)
         elif opts['mode'] == 'encode':
-                Encode(opts['paths_images'],
-                       paths_icocur = opts['paths_icocur'],
-                       names_icocur = opts['names_icocur'],
-                       formats_icocur = opts['formats_icocur'],
-                       type_resize = opts['type_resize'],
-                       force_to = opts['force_to'],
-                       custom_palettes = opts['custom_palettes'])
-        elif opts['mode'] is None:
-                is_cli = False
+                return run_profiled(Encode, opts['profile'], opts['paths_images'],
+                                    paths_icocur = opts['paths_icocur'],
+                                    names_icocur = opts['names_icocur'],
+                                    formats_icocur = opts['formats_icocur'],
+                                    type_resize = opts['type_resize'],
+                                    force_to = opts['force_to'],
+                                    custom_palettes = opts['custom_palettes'],
+                                    manifest = opts['manifest'],
+                                    recursive = opts['recursive'],
+                                    include = opts['include'],
+                                    exclude = opts['exclude'],
+                                    archive = opts['archive'],
+                                    resample = opts['resample'],
+                                    reducing_gap = opts['reducing_gap'],
+                                    is_cli = True)
+        elif opts['mode'] == 'serve':
+                return serve(path_socket = opts['path_socket'],
+                             host = opts['host'],
+                             port = opts['port'],
+                             concurrency = opts['concurrency'],
+                             max_bytes = opts['max_bytes'],
+                             is_cli = True)
+        elif opts['mode'] == 'extract':
+                return extract_pe(opts['paths_pe'],
+                                  path_out = opts['path_out'],
+                                  include = opts['include'],
+                                  exclude = opts['exclude'],
+                                  is_cli = True)
+        elif opts['mode'] == 'favicon':
+                return Favicon(opts['path_master'],
+                               path_bundle = opts['path_bundle'],
+                               name_icon = opts['name_icon'],
+                               name_site = opts['name_site'],
+                               is_cli = True)
+
+if __name__ == "__main__":
+        try:
+                conv = run_cli(iconolatry_parser())
+        except ValueError as e:
+                print_err(str(e))
+                sys.exit(1)
+        ## Encoding jobs that failed and decoding inputs not found (or empty archives) are reported (and skipped), exit status tells them.
+        if isinstance(conv, Encode) and any(result.error is not None for result in conv.results.values()):
+                sys.exit(1)
+        if isinstance(conv, Decode) and any((result.error or "").startswith("Input error") for result in conv.results.values()):
+                sys.exit(1)
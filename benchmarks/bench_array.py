@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Array output benchmark of decoding the `test_decode` corpus: PIL images then NumPy arrays
+    against arrays unpacked straight from `bmp` data (`output = 'array'`), plus the batched
+    variant filling one (N, S, S, 4) array. Checks pixels are the same.
+
+    python3 benchmarks/bench_array.py -r 5 -s 32
+"""
+
+import argparse
+import json
+import sys
+from glob import glob
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+import numpy
+
+def corpus():
+        """ Gets bytes of the `.ico` / `.cur` corpus. """
+        datas = []
+        for path in sorted(glob(join(root, 'test_decode', '*.ico')) + glob(join(root, 'test_decode', '*.cur'))):
+                with open(path, 'rb') as fd:
+                        datas.append(fd.read())
+        return datas
+
+def via_images(datas):
+        """ Gets arrays of all entries converting decoded PIL images. """
+        return [numpy.asarray(entry.im_obj.convert('RGBA')) for data in datas
+                for entry in (Iconolatry.decode_bytes(data).entries or []) if entry.error is None]
+
+def via_arrays(datas):
+        """ Gets arrays of all entries unpacked straight from `bmp` data. """
+        return [entry.pixels for data in datas
+                for entry in (Iconolatry.decode_bytes(data, output = 'array').entries or []) if entry.error is None]
+
+def timed(repeat, function, *args):
+        """ Gets the best time (ms) of calls and the result. """
+        best = None
+        for _ in range(repeat):
+                start = perf_counter()
+                result = function(*args)
+                took = perf_counter() - start
+                best = (took if best is None else min(best, took))
+        return round(best * 1000, 2), result
+
+def main():
+        parser = argparse.ArgumentParser(description = "Array output benchmark of Iconolatry.")
+        parser.add_argument('-r', '--repeat', default = 5, type = int, help = "Decodings of the corpus (best is kept).")
+        parser.add_argument('-s', '--size', default = 32, type = int, help = "Side of batched arrays.")
+        opts = parser.parse_args()
+
+        datas = corpus()
+        images_ms, expected = timed(opts.repeat, via_images, datas)
+        arrays_ms, arrays = timed(opts.repeat, via_arrays, datas)
+        out = numpy.zeros((len(datas), opts.size, opts.size, 4), numpy.uint8)
+        batch_ms, (_, picked) = timed(opts.repeat, Iconolatry.decode_batch, datas, opts.size, out)
+
+        print(json.dumps({'files'      : len(datas),
+                          'entries'    : len(arrays),
+                          'images_ms'  : images_ms,
+                          'arrays_ms'  : arrays_ms,
+                          'speedup'    : round(images_ms / arrays_ms, 2),
+                          'batch_ms'   : batch_ms,
+                          'batched'    : sum(cnt is not None for cnt in picked),
+                          'same'       : all(numpy.array_equal(one, two) for one, two in zip(expected, arrays))}, indent = 2))
+
+if __name__ == "__main__":
+        main()
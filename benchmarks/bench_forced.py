@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Benchmark of forced bit depths (`force_to`) on images with transparency of the `test_encode` corpus:
+    time and size of every depth against 'auto', checking transparent pixels (AND mask) of forced
+    outputs are the ones of 'auto' (black, fully transparent). Exits with 1 when they differ.
+
+    python3 benchmarks/bench_forced.py -d 24 8 4 1
+"""
+
+import argparse
+import json
+import sys
+from glob import glob
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+from PIL import Image, ImageChops
+
+def corpus():
+        """ Gets (path, bytes) of images with transparency. """
+        items = []
+        for path in sorted(glob(join(root, 'test_encode', '**', '*.png'), recursive = True)):
+                try:
+                        with Image.open(path) as image:
+                                if image.mode not in ['RGBA', 'LA', 'PA'] and 'transparency' not in image.info:
+                                        continue
+                except Exception:
+                        continue
+                with open(path, 'rb') as fd:
+                        items.append((path, fd.read()))
+        return items
+
+def transparent(icobytes):
+        """ Gets the decoded image and the mask of its fully transparent pixels. """
+        image = Iconolatry.decode_bytes(icobytes).entries[0].im_obj.convert('RGBA')
+        return image, image.getchannel('A').point(lambda level : (255 if level == 0 else 0))
+
+def main():
+        parser = argparse.ArgumentParser(description = "Forced bit depths benchmark of Iconolatry.")
+        parser.add_argument('-d', '--depths', nargs = "+", default = [24, 8, 4, 1], type = int, help = "Forced bit depths.")
+        opts = parser.parse_args()
+
+        stats = {str(bits) : {'files' : 0, 'ms' : 0., 'bytes' : 0} for bits in ['auto'] + opts.depths}
+        mismatches = []
+        for path, data in corpus():
+                try:
+                        start = perf_counter()
+                        auto = Iconolatry.encode_entries([data], force_to = 'auto')
+                        took = perf_counter() - start
+                except Iconolatry.EncodeErr:
+                        continue
+                stats['auto']['files'] += 1
+                stats['auto']['ms'] += took * 1000
+                stats['auto']['bytes'] += len(auto)
+                auto_image, auto_mask = transparent(auto)
+
+                for bits in opts.depths:
+                        start = perf_counter()
+                        forced = Iconolatry.encode_entries([data], force_to = bits)
+                        took = perf_counter() - start
+                        stat = stats[str(bits)]
+                        stat['files'] += 1
+                        stat['ms'] += took * 1000
+                        stat['bytes'] += len(forced)
+
+                        image, mask = transparent(forced)
+                        # same transparent pixels, all black.
+                        black = ImageChops.multiply(image.convert('RGB'), mask.convert('RGB')).getbbox()
+                        if ImageChops.difference(mask, auto_mask).getbbox() or black:
+                                mismatches.append({'file' : path[len(root) + 1 :], 'depth' : bits})
+
+        for stat in stats.values():
+                stat['ms'] = round(stat['ms'], 2)
+        print(json.dumps({'depths' : stats, 'mismatches' : mismatches}, indent = 2))
+        if mismatches:
+                sys.exit(1)
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Micro-benchmark of header parsing on `test_decode/multi_size_*` files:
+    precompiled `Struct` layouts against per-entry format strings on sliced data.
+
+    python3 benchmarks/bench_headers.py -n 20000
+"""
+
+import argparse
+import json
+import sys
+from glob import glob
+from os.path import abspath, dirname, join
+from struct import unpack_from
+from timeit import timeit
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+
+def parse_format(data):
+        """ Parses ICONDIR, ICONDIRENTRY table and BITMAPINFOHEADERs with format strings. """
+        _, _, count = unpack_from('<3H', data[0 : 6])
+        entries = [unpack_from('<4B2H2L', data[6 + 16 * i : 22 + 16 * i]) for i in range(count)]
+        return [unpack_from('<3L2H2L2l2L', data[entry[7] : entry[7] + 40]) for entry in entries]
+
+def parse_struct(data):
+        """ Parses ICONDIR, ICONDIRENTRY table and BITMAPINFOHEADERs with precompiled structs. """
+        _, _, count = Iconolatry.ICONDIR.unpack_from(data)
+        table = memoryview(data)[Iconolatry.ICONDIR.size : Iconolatry.ICONDIR.size + Iconolatry.ICONDIRENTRY.size * count]
+        return [Iconolatry.BITMAPINFOHEADER.unpack_from(data, entry[7]) for entry in Iconolatry.ICONDIRENTRY.iter_unpack(table)]
+
+def main():
+        parser = argparse.ArgumentParser(description = "Header parsing micro-benchmark of Iconolatry.")
+        parser.add_argument('-n', '--number', default = 20000, type = int, help = "Parses of every file.")
+        opts = parser.parse_args()
+
+        results = {}
+        for path in sorted(glob(join(root, 'test_decode', 'multi_size_*'))):
+                with open(path, 'rb') as fd:
+                        data = fd.read()
+                assert parse_format(data) == parse_struct(data)
+                before = timeit(lambda : parse_format(data), number = opts.number)
+                after = timeit(lambda : parse_struct(data), number = opts.number)
+                results[path[len(root) + 1 :]] = {'format_us' : round(before / opts.number * 1e6, 3),
+                                                  'struct_us' : round(after / opts.number * 1e6, 3),
+                                                  'speedup'   : round(before / after, 2)}
+        print(json.dumps(results, indent = 2))
+
+if __name__ == "__main__":
+        main()
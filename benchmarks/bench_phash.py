@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Benchmark of `PerceptualIndex`: insertion, loading from file and near-duplicate queries
+    (p50 / p99 latency) over an index of random hashes, checked against a linear scan.
+
+    python3 benchmarks/bench_phash.py -n 1000000 -q 1000 -d 6
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from os import remove
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+
+def percentile(values, pct):
+        """ Gets the nearest-rank percentile of sorted values. """
+        return values[min(len(values) - 1, int(round(pct / 100. * len(values) + 0.5)) - 1)]
+
+def near(phash, distance, rng):
+        """ Gets a hash with `distance` random bits of `phash` flipped. """
+        for bit in rng.sample(range(64), distance):
+                phash ^= 1 << bit
+        return phash
+
+def main():
+        parser = argparse.ArgumentParser(description = "Perceptual index benchmark of Iconolatry.")
+        parser.add_argument('-n', '--size', default = 1000000, type = int, help = "Number of indexed hashes.")
+        parser.add_argument('-q', '--queries', default = 1000, type = int, help = "Number of queries.")
+        parser.add_argument('-d', '--distance', default = 6, type = int, help = "Maximum Hamming distance.")
+        parser.add_argument('-s', '--seed', default = 0, type = int, help = "Random seed.")
+        opts = parser.parse_args()
+
+        rng = random.Random(opts.seed)
+        hashes = [rng.getrandbits(64) for _ in range(opts.size)]
+        path = join(tempfile.mkdtemp(), 'bench.phash')
+
+        start = perf_counter()
+        with Iconolatry.PerceptualIndex(path) as index:
+                for rid, phash in enumerate(hashes):
+                        index.add(phash, 'file_%d.ico' %rid, 0)
+        inserted = perf_counter() - start
+
+        start = perf_counter()
+        index = Iconolatry.PerceptualIndex(path)
+        loaded = perf_counter() - start
+        remove(path)
+
+        # half of queries have a planted near-duplicate.
+        queries = [(near(rng.choice(hashes), rng.randint(0, opts.distance), rng) if indx % 2 else rng.getrandbits(64))
+                   for indx in range(opts.queries)]
+        latencies, found = [], 0
+        for phash in queries:
+                start = perf_counter()
+                matches = index.query(phash, opts.distance)
+                latencies.append(perf_counter() - start)
+                found += len(matches)
+        latencies.sort()
+
+        # exactness against a linear scan of some queries.
+        exact = all(len(index.query(phash, opts.distance)) == sum(1 for other in hashes if bin(other ^ phash).count('1') <= opts.distance)
+                    for phash in queries[:10])
+
+        print(json.dumps({'size'          : opts.size,
+                          'queries'       : opts.queries,
+                          'distance'      : opts.distance,
+                          'insert_per_s'  : round(opts.size / inserted, 1),
+                          'load_s'        : round(loaded, 3),
+                          'matches'       : found,
+                          'p50_ms'        : round(percentile(latencies, 50) * 1000, 3),
+                          'p99_ms'        : round(percentile(latencies, 99) * 1000, 3),
+                          'exact'         : exact}, indent = 2))
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Resize benchmark of encoding large masters to icons: every pixel filtered (`reducing_gap = None`)
+    against shrinking first (JPEG DCT scaling, integer reduction), with the largest pixel difference of results.
+    Masters are generated (JPEG and PNG) unless given.
+
+    python3 benchmarks/bench_resize.py -s 6000 4000 -r 3
+    python3 benchmarks/bench_resize.py -i master.jpg -z "(48, 48)" -f bicubic
+"""
+
+import argparse
+import json
+import sys
+from io import BytesIO
+from os.path import abspath, basename, dirname
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+from PIL import Image, ImageChops
+
+def masters(size):
+        """ Gets (name, bytes) of generated JPEG and PNG masters of a size. """
+        gradient = Image.linear_gradient('L').resize(size)
+        radial = Image.radial_gradient('L').resize(size)
+        image = Image.merge('RGB', (radial, gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+        items = []
+        for frmt in ['JPEG', 'PNG']:
+                buffer = BytesIO()
+                image.save(buffer, format = frmt)
+                items.append(('%s %s x %s' %(frmt.lower(), *size), buffer.getvalue()))
+        return items
+
+def encode(data, resize, resample, reducing_gap):
+        """ Encodes image bytes to `.ico`, returns the decoded icon. """
+        conv = Iconolatry.Encode([[data]], names_icocur = ['bench'], formats_icocur = ['.ico'], in_memory = True,
+                                 type_resize = resize, resample = resample, reducing_gap = reducing_gap)
+        icobytes = next(iter(conv.all_icocur_bytes.values()))
+        return Iconolatry.Decode([icobytes]).results['stream_0'].entries[0].im_obj.convert('RGB')
+
+def timed(repeat, *args):
+        """ Gets the best time (ms) of encodings and the result. """
+        best = None
+        for _ in range(repeat):
+                start = perf_counter()
+                result = encode(*args)
+                took = perf_counter() - start
+                best = (took if best is None else min(best, took))
+        return round(best * 1000, 1), result
+
+def main():
+        parser = argparse.ArgumentParser(description = "Resize benchmark of Iconolatry.")
+        parser.add_argument('-i', '--inputs', nargs = "+", default = [], help = "Master images (generated if missing).")
+        parser.add_argument('-s', '--size', nargs = 2, default = [6000, 4000], type = int, help = "Size of generated masters.")
+        parser.add_argument('-z', '--resize', default = 'up256_prop', type = Iconolatry.tupledict, help = "Option `type_resize`.")
+        parser.add_argument('-f', '--resample', default = 'lanczos', choices = sorted(Iconolatry.resize_filters), help = "Resize filter.")
+        parser.add_argument('-g', '--reducing-gap', default = 2., type = float, dest = "reducing_gap", help = "Reducing gap.")
+        parser.add_argument('-r', '--repeat', default = 3, type = int, help = "Encodings of every master (best is kept).")
+        opts = parser.parse_args()
+
+        items = []
+        for path in opts.inputs:
+                with open(path, 'rb') as fd:
+                        items.append((basename(path), fd.read()))
+        if not items:
+                items = masters(tuple(opts.size))
+
+        results = {}
+        for name, data in items:
+                full_ms, full = timed(opts.repeat, data, opts.resize, opts.resample, None)
+                fast_ms, fast = timed(opts.repeat, data, opts.resize, opts.resample, opts.reducing_gap)
+                extrema = ImageChops.difference(full, fast).getextrema()
+                results[name] = {'full_ms'      : full_ms,
+                                 'prescaled_ms' : fast_ms,
+                                 'speedup'      : round(full_ms / fast_ms, 2),
+                                 'max_diff'     : max(high for _, high in extrema)}
+        print(json.dumps(results, indent = 2))
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Startup benchmark of `import Iconolatry`: measures import time over a bare `import PIL.Image`
+    and checks heavy modules stay unloaded. Exits with 1 when over budget.
+
+    python3 benchmarks/bench_startup.py -n 10 -b 15
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from os import environ
+from os.path import abspath, dirname
+
+root = dirname(dirname(abspath(__file__)))
+
+# Modules only some commands need: they must be imported lazily.
+heavy = ['argparse', 'PIL.ImageCms', 'http.server', 'socketserver', 'concurrent.futures',
+         'multiprocessing', 'signal', 'PIL.JpegImagePlugin', 'PIL.TiffImagePlugin', 'numpy']
+
+# Bytecode is cached like in a normal install, so compile time is not measured.
+env = dict(environ)
+env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+probe = "import sys; sys.path.insert(0, %r); import %s; print(' '.join(sorted(sys.modules)))"
+
+def import_time(module):
+        """ Imports a module in a fresh interpreter, returns cumulative time (ms) and loaded modules. """
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe %(root, module)],
+                              stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, check = True, env = env)
+        total = 0
+        for line in proc.stderr.splitlines():
+                fields = line.split('|')
+                if len(fields) == 3 and fields[2].strip() == module:
+                        total = int(fields[1]) / 1000.
+        return total, set(proc.stdout.split())
+
+def median(values):
+        """ Gets the median of values. """
+        values = sorted(values)
+        return values[len(values) // 2]
+
+def main():
+        parser = argparse.ArgumentParser(description = "Startup benchmark of Iconolatry.")
+        parser.add_argument('-n', '--runs', default = 10, type = int, help = "Number of fresh interpreters.")
+        parser.add_argument('-b', '--budget-ms', default = 15., type = float, dest = "budget",
+                            help = "Maximum median import time (ms) over `import PIL.Image`.")
+        opts = parser.parse_args()
+
+        import_time('Iconolatry')
+        times, bases, modules = [], [], set()
+        for _ in range(opts.runs):
+                took, loaded = import_time('Iconolatry')
+                times.append(took)
+                modules |= loaded
+                bases.append(import_time('PIL.Image')[0])
+        overhead = median(times) - median(bases)
+        eager = [name for name in heavy if name in modules]
+
+        print(json.dumps({'runs'         : opts.runs,
+                          'median_ms'    : round(median(times), 3),
+                          'pil_median_ms': round(median(bases), 3),
+                          'overhead_ms'  : round(overhead, 3),
+                          'budget_ms'    : opts.budget,
+                          'eager'        : eager}, indent = 2))
+        if overhead > opts.budget or eager:
+                sys.exit(1)
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Throughput benchmark of decoding (`test_decode`) and encoding (`test_encode`) corpora:
+    files/s, MB/s and pixels/s per bit depth, size and format / mode groups, plus peak memory.
+    Conversions run in memory, so disk speed is not measured.
+
+    python3 benchmarks/bench_throughput.py -r 5 -o before.json
+    python3 benchmarks/bench_throughput.py -r 5 -o after.json -C before.json -t 10
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+from glob import glob
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+
+buckets = [16, 32, 64, 128, 256]
+
+def bucket(side):
+        """ Gets the size group of an image side. """
+        for limit in buckets:
+                if side <= limit:
+                        return 'size:<=%d' %limit
+        return 'size:>%d' %buckets[-1]
+
+def one_or(values, label):
+        """ Gets the only element of a set, `label` if there are more. """
+        return (next(iter(values)) if len(values) == 1 else label)
+
+def decode(data):
+        """ Decodes `.ico` / `.cur` bytes, returns groups and decoded pixels (None if invalid). """
+        result = Iconolatry.Decode([data]).all_icocur_readed.get('stream_0')
+        if not isinstance(result, dict):
+                return
+        entries = [entry for entry in result.values() if isinstance(entry, dict)]
+        if not entries:
+                return
+        sizes = [entry['im_obj'].size for entry in entries]
+        formats = {('png' if 'png' in entry.get('info', {}).get('format', "") else 'bmp') for entry in entries}
+        groups = ['all',
+                  'depth:%s' %one_or({'%dbpp' %entry['depth'] for entry in entries}, 'multi'),
+                  bucket(max(max(size) for size in sizes)),
+                  'format:%s' %one_or(formats, 'mixed')]
+        return groups, sum(w * h for w, h in sizes)
+
+def encode(data):
+        """ Encodes image bytes to `.ico` bytes, returns groups and encoded pixels (None if not converted). """
+        conv = Iconolatry.Encode([[data]], names_icocur = ['bench'], formats_icocur = ['.ico'], in_memory = True)
+        if not conv.all_icocur_bytes:
+                return
+        entries = [entry for result in conv.all_icocur_written.values() if isinstance(result, list) for entry in result]
+        sizes = [tuple(int(side) for side in entry['size'].split(' x ')) for entry in entries]
+        groups = ['all',
+                  'depth:%s' %one_or({'%dbpp' %entry['depth'] for entry in entries}, 'multi'),
+                  bucket(max(max(size) for size in sizes)),
+                  'mode:%s' %one_or({entry['mode'] for entry in entries}, 'mixed')]
+        return groups, sum(w * h for w, h in sizes)
+
+def clear_caches():
+        """ Empties process-wide caches, so every pass starts cold. """
+        Iconolatry.icc_cache.clear()
+        Iconolatry.quantizer.clear()
+
+def corpus(mode):
+        """ Gets (path, bytes) of the corpus of a mode. """
+        if mode == 'decode':
+                paths = glob(join(root, 'test_decode', '*.ico')) + glob(join(root, 'test_decode', '*.cur'))
+        else:
+                paths = glob(join(root, 'test_encode', '**', '*.png'), recursive = True)
+        items = []
+        for path in sorted(paths):
+                with open(path, 'rb') as fd:
+                        items.append((path, fd.read()))
+        return items
+
+def bench(mode, repeat):
+        """ Measures a mode: throughput per group and peak memory of one pass. """
+        convert = (decode if mode == 'decode' else encode)
+        stats, skipped = {}, 0
+        for path, data in corpus(mode):
+                clear_caches()
+                outcome = convert(data)
+                if outcome is None:
+                        skipped += 1
+                        continue
+                groups, pixels = outcome
+                start = perf_counter()
+                for _ in range(repeat):
+                        convert(data)
+                took = perf_counter() - start
+                for group in groups:
+                        stat = stats.setdefault(group, {'files' : 0, 'bytes' : 0, 'pixels' : 0, 'seconds' : 0.})
+                        stat['files'] += repeat
+                        stat['bytes'] += repeat * len(data)
+                        stat['pixels'] += repeat * pixels
+                        stat['seconds'] += took
+
+        groups = {}
+        for group, stat in sorted(stats.items()):
+                seconds = stat['seconds'] or 1e-9
+                groups[group] = {'files'       : stat['files'] // repeat,
+                                 'files_per_s' : round(stat['files'] / seconds, 2),
+                                 'mb_per_s'    : round(stat['bytes'] / seconds / 1e6, 3),
+                                 'mpix_per_s'  : round(stat['pixels'] / seconds / 1e6, 3)}
+
+        clear_caches()
+        tracemalloc.start()
+        for path, data in corpus(mode):
+                convert(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'groups' : groups, 'skipped' : skipped, 'peak_traced_mb' : round(peak / 1e6, 3)}
+
+def peak_rss():
+        """ Gets peak resident set size (MB) of the process, None where unsupported. """
+        try:
+                import resource
+        except ImportError:
+                return
+        scale = (1e6 if sys.platform == 'darwin' else 1e3)
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 3)
+
+def compare(baseline, current, threshold):
+        """ Gets groups whose throughput dropped more than `threshold` percent. """
+        regressions = []
+        for mode, result in current.items():
+                if not isinstance(result, dict) or mode not in baseline:
+                        continue
+                for group, stat in result['groups'].items():
+                        old = baseline[mode]['groups'].get(group)
+                        if not old or not old['files_per_s']:
+                                continue
+                        change = 100. * (stat['files_per_s'] - old['files_per_s']) / old['files_per_s']
+                        if change < -threshold:
+                                regressions.append({'mode'   : mode,
+                                                    'group'  : group,
+                                                    'before' : old['files_per_s'],
+                                                    'after'  : stat['files_per_s'],
+                                                    'change' : round(change, 1)})
+        return regressions
+
+def main():
+        parser = argparse.ArgumentParser(description = "Throughput benchmark of Iconolatry.")
+        parser.add_argument('-m', '--mode', default = ['decode', 'encode'], nargs = '+', choices = ['decode', 'encode'],
+                            help = "Benchmarked conversions.")
+        parser.add_argument('-r', '--repeat', default = 5, type = int, help = "Conversions of every file.")
+        parser.add_argument('-o', '--output', default = None, help = "JSON file of results.")
+        parser.add_argument('-C', '--compare', default = None, help = "JSON file of baseline results.")
+        parser.add_argument('-t', '--threshold', default = 10., type = float, help = "Regression threshold (percent).")
+        opts = parser.parse_args()
+
+        results = {mode : bench(mode, opts.repeat) for mode in opts.mode}
+        results['repeat'] = opts.repeat
+        results['peak_rss_mb'] = peak_rss()
+        if opts.output:
+                with open(opts.output, 'w') as fd:
+                        json.dump(results, fd, indent = 2)
+        print(json.dumps(results, indent = 2))
+
+        if opts.compare:
+                with open(opts.compare, 'r') as fd:
+                        regressions = compare(json.load(fd), results, opts.threshold)
+                print(json.dumps({'threshold' : opts.threshold, 'regressions' : regressions}, indent = 2))
+                if regressions:
+                        sys.exit(1)
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Micro-benchmark of pixel loading of `bmp` entries (`IconReader.load`): one raw unpack per depth
+    (true-color straight to RGBA, AND mask put as alpha) against the former chain of intermediate
+    images (RGB image, `convert('RGBA')`, alpha rebuilt from a strided copy). Checks pixels are the same.
+
+    python3 benchmarks/bench_unpack.py -n 2000
+    python3 benchmarks/bench_unpack.py -i test_decode/8bpp_size_256x256.ico
+"""
+
+import argparse
+import json
+import sys
+from os.path import abspath, dirname, join
+from timeit import timeit
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+import Iconolatry
+from PIL import Image
+
+def load_chain(parameters):
+        """ Loads a true-color `bmp` entry as before: RGB(A) image, strided alpha / AND mask image, conversion, `putalpha`. """
+        size = (parameters.width, parameters.height)
+        pad = Iconolatry.calc_rowsize(parameters.bpp, parameters.width)
+        if parameters.bpp == 32:
+                image = Image.frombytes('RGBA', size, parameters.xor, 'raw', 'BGRA', pad, -1)
+                mask = Image.frombuffer('L', size, parameters.xor[3::4], 'raw', 'L', 0, -1)
+        else:
+                image = Image.frombytes('RGB', size, parameters.xor, 'raw', 'BGR', pad, -1)
+                mask = Image.frombuffer('1', size, parameters.and_, 'raw', '1;I', Iconolatry.calc_masksize(parameters.width), -1)
+        image = image.convert('RGBA')
+        image.putalpha(mask)
+        return image
+
+def reader(data):
+        """ Gets a reader with parameters (header, palette, masks) of the first entry. """
+        reader = Iconolatry.IconReader(data)
+        _, _, _, _, _, _, size, offset = Iconolatry.ICONDIRENTRY.unpack_from(data, Iconolatry.ICONDIR.size)
+        reader.extract(data[offset : offset + size], size)
+        return reader
+
+def main():
+        parser = argparse.ArgumentParser(description = "Pixel loading micro-benchmark of Iconolatry.")
+        parser.add_argument('-i', '--inputs', nargs = "+", help = "`.ico` / `.cur` files (first entry is loaded).",
+                            default = [join('test_decode', '32bpp_size_256x256.ico'), join('test_decode', '24bpp_size_256x256.ico')])
+        parser.add_argument('-n', '--number', default = 2000, type = int, help = "Loads of every file.")
+        opts = parser.parse_args()
+
+        results = {}
+        for path in opts.inputs:
+                with open(join(root, path), 'rb') as fd:
+                        current = reader(fd.read())
+                result = {'same' : None}
+                if current.parameters.bpp in [24, 32]:
+                        result['same'] = (load_chain(current.parameters).tobytes() == current.load().tobytes())
+                        before = timeit(lambda : load_chain(current.parameters), number = opts.number)
+                        result['chain_us'] = round(before / opts.number * 1e6, 2)
+                after = timeit(current.load, number = opts.number)
+                result['unpack_us'] = round(after / opts.number * 1e6, 2)
+                if 'chain_us' in result:
+                        result['speedup'] = round(before / after, 2)
+                results[path] = result
+        print(json.dumps(results, indent = 2))
+
+if __name__ == "__main__":
+        main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" Load test of `Iconolatry.py serve`: measures p50 / p99 latency and throughput.
+
+    python3 Iconolatry.py serve -s /tmp/iconolatry.sock &
+    python3 benchmarks/loadtest_serve.py -s /tmp/iconolatry.sock -m decode -f test_decode/32bpp_size_32x32.ico -n 2000 -c 8
+"""
+
+import argparse
+import json
+import socket
+from http.client import HTTPConnection
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from threading import local
+
+class UnixHTTPConnection(HTTPConnection):
+        """ HTTP connection over a Unix domain socket. """
+        def __init__(self, path_socket):
+                HTTPConnection.__init__(self, 'localhost')
+                self.path_socket = path_socket
+
+        def connect(self):
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path_socket)
+
+def percentile(values, pct):
+        """ Gets the nearest-rank percentile of sorted values. """
+        return values[min(len(values) - 1, int(round(pct / 100. * len(values) + 0.5)) - 1)]
+
+def main():
+        parser = argparse.ArgumentParser(description = "Load test of Iconolatry server.")
+        parser.add_argument('-s', '--socket', default = None, dest = "path_socket", help = "Unix domain socket path.")
+        parser.add_argument('-a', '--host', default = '127.0.0.1', help = "HTTP host.")
+        parser.add_argument('-p', '--port', default = 8765, type = int, help = "HTTP port.")
+        parser.add_argument('-m', '--mode', default = 'decode', choices = ['decode', 'encode'], help = "Request type.")
+        parser.add_argument('-q', '--query', default = "", help = "Query string of requests (e.g. 'format=json').")
+        parser.add_argument('-f', '--file', required = True, help = "File sent as body of every request.")
+        parser.add_argument('-n', '--requests', default = 1000, type = int, help = "Number of requests.")
+        parser.add_argument('-c', '--concurrency', default = 4, type = int, help = "Number of concurrent clients.")
+        opts = parser.parse_args()
+
+        with open(opts.file, 'rb') as fd:
+                body = fd.read()
+        url = '/%s%s' %(opts.mode, ('?' + opts.query if opts.query else ""))
+        clients = local()
+
+        def request(_):
+                if not hasattr(clients, 'conn'):
+                        clients.conn = (UnixHTTPConnection(opts.path_socket) if opts.path_socket else HTTPConnection(opts.host, opts.port))
+                start = perf_counter()
+                clients.conn.request('POST', url, body = body, headers = {'Content-Length' : str(len(body))})
+                response = clients.conn.getresponse()
+                response.read()
+                if response.will_close:
+                        clients.conn.close()
+                        del clients.conn
+                return perf_counter() - start, response.status
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers = opts.concurrency) as pool:
+                results = list(pool.map(request, range(opts.requests)))
+        elapsed = perf_counter() - start
+
+        latencies = sorted(lat for lat, _ in results)
+        errors = sum(1 for _, status in results if status != 200)
+        print(json.dumps({'requests'    : opts.requests,
+                          'concurrency' : opts.concurrency,
+                          'errors'      : errors,
+                          'req_per_s'   : round(opts.requests / elapsed, 1),
+                          'p50_ms'      : round(percentile(latencies, 50) * 1000, 3),
+                          'p99_ms'      : round(percentile(latencies, 99) * 1000, 3),
+                          'max_ms'      : round(latencies[-1] * 1000, 3)}, indent = 2))
+
+if __name__ == "__main__":
+        main()
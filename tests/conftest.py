@@ -0,0 +1,8 @@
+import sys
+from os.path import abspath, dirname, join
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+
+test_decode = join(root, 'test_decode')
+test_encode = join(root, 'test_encode')
@@ -0,0 +1,75 @@
+""" Builds small PE32 binaries carrying icon / cursor resources, to test `PEResources`. """
+
+from struct import pack
+
+import Iconolatry
+
+RT_CURSOR, RT_ICON, RT_GROUP_CURSOR, RT_GROUP_ICON = 1, 3, 12, 14
+LANG = 1033
+FILE_ALIGN, SECTION_RVA = 0x200, 0x1000
+
+def group_icon(images):
+        """ Gets a RT_GROUP_ICON resource of (nID, image bytes, width, height, bitcount). """
+        data = Iconolatry.ICONDIR.pack(0, 1, len(images))
+        for nid, image, width, height, bits in images:
+                data += Iconolatry.GRPICONDIRENTRY.pack(width % 256, height % 256, 0, 0, 1, bits, len(image), nid)
+        return data
+
+def group_cursor(images):
+        """ Gets a RT_GROUP_CURSOR resource of (nID, image bytes, width, height, bitcount). """
+        data = Iconolatry.ICONDIR.pack(0, 2, len(images))
+        for nid, image, width, height, bits in images:
+                data += Iconolatry.GRPCURSORDIRENTRY.pack(width, 2 * height, 1, bits, len(image), nid)
+        return data
+
+def cursor(hotspot, image):
+        """ Gets a RT_CURSOR resource (hotspot before image data). """
+        return pack('<2H', *hotspot) + image
+
+def build_pe(resources, out_of_section = ()):
+        """ Gets a PE32 with a `.rsrc` section of resources {type : {id : bytes}} (one language).
+            Data entries of (type, id) in `out_of_section` point beyond the section.
+        """
+        ## Resource tree: root -> types -> ids -> language -> data entry.
+        types = sorted(resources)
+        datas, blobs = [], b""
+        size_dir = lambda count : Iconolatry.RESOURCE_DIRECTORY.size + Iconolatry.RESOURCE_DIRECTORY_ENTRY.size * count
+        tree_size = size_dir(len(types)) + sum(size_dir(len(resources[typ])) + size_dir(1) * len(resources[typ]) for typ in types)
+        data_entries = tree_size
+        raw = tree_size + Iconolatry.RESOURCE_DATA_ENTRY.size * sum(len(resources[typ]) for typ in types)
+
+        root = Iconolatry.RESOURCE_DIRECTORY.pack(0, 0, 0, 0, 0, len(types))
+        offset = size_dir(len(types))
+        subdirs = b""
+        for typ in types:
+                root += Iconolatry.RESOURCE_DIRECTORY_ENTRY.pack(typ, 0x80000000 | (offset + len(subdirs)))
+                ids = sorted(resources[typ])
+                names = Iconolatry.RESOURCE_DIRECTORY.pack(0, 0, 0, 0, 0, len(ids))
+                langs = b""
+                start_langs = offset + len(subdirs) + size_dir(len(ids))
+                for nid in ids:
+                        names += Iconolatry.RESOURCE_DIRECTORY_ENTRY.pack(nid, 0x80000000 | (start_langs + len(langs)))
+                        data_offset = data_entries + Iconolatry.RESOURCE_DATA_ENTRY.size * len(datas)
+                        langs += Iconolatry.RESOURCE_DIRECTORY.pack(0, 0, 0, 0, 0, 1) + \
+                                 Iconolatry.RESOURCE_DIRECTORY_ENTRY.pack(LANG, data_offset)
+                        blob = resources[typ][nid]
+                        rva = SECTION_RVA + raw + len(blobs)
+                        if (typ, nid) in out_of_section:
+                                rva += 0x100000
+                        datas.append(Iconolatry.RESOURCE_DATA_ENTRY.pack(rva, len(blob), 0, 0))
+                        blobs += blob + b"\0" * (-len(blob) % 4)
+                subdirs += names + langs
+        section = root + subdirs + b"".join(datas) + blobs
+        section += b"\0" * (-len(section) % FILE_ALIGN)
+
+        ## Headers: DOS stub, PE signature, COFF, PE32 optional header (16 data directories), one section.
+        pe = 0x40
+        size_optional = 96 + 8 * 16
+        coff = Iconolatry.COFF_HEADER.pack(0x14c, 1, 0, 0, 0, size_optional, 0x102)
+        optional = bytearray(size_optional)
+        optional[0 : 2] = pack('<H', 0x10b)
+        optional[92 : 96] = pack('<L', 16)
+        optional[96 + 8 * 2 : 96 + 8 * 3] = pack('<2L', SECTION_RVA, len(section))
+        header = b'MZ' + b"\0" * (0x3C - 2) + pack('<L', pe) + b'PE\0\0' + coff + bytes(optional) + \
+                 pack('<8s4L16x', b'.rsrc', len(section), SECTION_RVA, len(section), FILE_ALIGN)
+        return header + b"\0" * (FILE_ALIGN - len(header)) + section
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+from os.path import join
+from zipfile import ZipFile
+
+import Iconolatry
+from conftest import root, test_decode
+
+
+def folder_zip(tmp_path, member):
+        path = str(tmp_path / 'icons.zip')
+        with open(join(test_decode, '32bpp_size_16x16.ico'), 'rb') as fd:
+                data = fd.read()
+        with ZipFile(path, 'w') as handle:
+                handle.writestr(member, data)
+        return path
+
+def test_decode_folder_members_need_recursive(tmp_path):
+        path = folder_zip(tmp_path, 'site/favicon.ico')
+        conv = Iconolatry.Decode([path], paths_image = [str(tmp_path)])
+        assert 'recursive' in conv.results[path].error
+
+        conv = Iconolatry.Decode([path], paths_image = [str(tmp_path)], recursive = True)
+        assert conv.results[join(path, 'site/favicon.ico')].error is None
+        assert path not in conv.results
+
+def test_encode_empty_archive(tmp_path):
+        path = folder_zip(tmp_path, 'site/favicon.ico')
+        conv = Iconolatry.Encode([[path]], paths_icocur = [str(tmp_path)], formats_icocur = ['.ico'])
+        assert [result.error for result in conv.results.values()] == [Iconolatry.Archive(path).missing()]
+
+def test_cli_exit_status(tmp_path):
+        path = folder_zip(tmp_path, 'site/favicon.ico')
+        command = [sys.executable, join(root, 'Iconolatry.py'), 'decode', '-i', path, '-o', str(tmp_path)]
+        proc = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        assert proc.returncode == 1 and '-R' in proc.stderr
+        proc = subprocess.run(command + ['-R'], stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        assert proc.returncode == 0
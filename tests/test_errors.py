@@ -0,0 +1,34 @@
+from os.path import join
+
+import pytest
+
+import Iconolatry
+from conftest import test_decode, test_encode
+
+icon = join(test_decode, '32bpp_size_16x16.ico')
+image = join(test_encode, 'Added', 'Other_gray+alpha_16-16_c4.png')
+
+@pytest.mark.parametrize('convert', [
+        lambda : Iconolatry.Decode([icon], paths_image = ['/nonexistent']),
+        lambda : Iconolatry.Decode([icon], formats_image = ['.nope']),
+        lambda : Iconolatry.Decode([icon], force_to = 7),
+        lambda : Iconolatry.Encode([[image]], paths_icocur = ['/nonexistent']),
+        lambda : Iconolatry.Encode([[image]], type_resize = 'huge'),
+        lambda : Iconolatry.extract_pe([], '/nonexistent'),
+        lambda : Iconolatry.Favicon('/nope.png')])
+def test_option_errors_raise(convert, capsys):
+        with pytest.raises(ValueError, match = "^Input error: "):
+                convert()
+        assert capsys.readouterr().err == ""
+
+def test_default_paths_follow_working_directory(tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        conv = Iconolatry.Encode([[image]])
+        assert (tmp_path / 'Other_gray+alpha_16-16_c4.ico').is_file()
+        assert conv.results[str(tmp_path / 'Other_gray+alpha_16-16_c4.ico')].error is None
+
+def test_encode_errors_are_kept(tmp_path):
+        bad = tmp_path / 'bad.png'
+        bad.write_bytes(b'not an image')
+        conv = Iconolatry.Encode([[str(bad), image]], paths_icocur = [str(tmp_path)], names_icocur = ['multi'])
+        assert conv.results[str(tmp_path / 'multi.ico')].error.startswith("Image error: ")
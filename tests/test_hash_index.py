@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+import Iconolatry
+
+
+def png(color):
+        stream = BytesIO()
+        Image.new('RGB', (16, 16), color).save(stream, format = 'PNG')
+        return stream.getvalue()
+
+def test_bounded_lru():
+        index = Iconolatry.HashIndex(maxsize = 2)
+        keys = [index.key(bytes([indx])) for indx in range(3)]
+        index.put(keys[0], 'a')
+        index.put(keys[1], 'b')
+        assert index.get(keys[0]) == 'a'
+        # least recently used is dropped.
+        index.put(keys[2], 'c')
+        assert index.get(keys[1]) is None
+        assert index.get(keys[0]) == 'a' and index.get(keys[2]) == 'c'
+        assert index.info() == {'hits' : 3, 'misses' : 1, 'evictions' : 1, 'size' : 2, 'maxsize' : 2}
+
+def test_counts_under_threads():
+        index = Iconolatry.HashIndex(maxsize = 8)
+        keys = [index.key(bytes([indx])) for indx in range(16)]
+
+        def work(indx):
+                key = keys[indx % 16]
+                if index.get(key) is None:
+                        index.put(key, indx)
+        with ThreadPoolExecutor(8) as pool:
+                list(pool.map(work, range(4000)))
+        info = index.info()
+        assert info['hits'] + info['misses'] == 4000
+        assert info['size'] <= 8
+
+def test_duplicates_converted_once():
+        index = Iconolatry.HashIndex(maxsize = 1)
+        red, blue = png((255, 0, 0)), png((0, 0, 255))
+        conv = Iconolatry.Encode([[red], [red], [blue], [red]], names_icocur = ['a', 'b', 'c', 'd'],
+                                 hash_index = index, in_memory = True)
+        assert index.info()['hits'] == 1 and index.info()['misses'] == 3
+        assert len(set(conv.all_icocur_bytes.values())) == 2
@@ -0,0 +1,29 @@
+import json
+from os.path import join
+
+import Iconolatry
+from conftest import test_decode
+
+
+def test_malformed_lines_are_reported(tmp_path, capsys):
+        icon = join(test_decode, '32bpp_size_16x16.ico')
+        jobs = tmp_path / 'jobs.jsonl'
+        jobs.write_text('\n'.join([json.dumps({'id' : 'a', 'inputs' : [icon], 'output' : str(tmp_path)}),
+                                   '{"id" : "b", "inputs" : [',
+                                   '[1, 2]',
+                                   "",
+                                   json.dumps({'id' : 'c', 'inputs' : [icon], 'output' : str(tmp_path), 'name' : 'c'})]) + '\n')
+        Iconolatry.run_jobs('decode', str(jobs), workers = 1)
+
+        results = {result['id'] : result for result in map(json.loads, capsys.readouterr().out.splitlines())}
+        assert sorted(results) == ['1', '2', 'a', 'c']
+        assert results['a']['ok'] and results['c']['ok']
+        assert not results['1']['ok'] and results['1']['result'].startswith("Input error: job line 1 malformed")
+        assert not results['2']['ok'] and "not a JSON object" in results['2']['result']
+        ## Only jobs are done, malformed lines run again once fixed.
+        assert (tmp_path / 'jobs.jsonl.done').read_text().split() in [['a', 'c'], ['c', 'a']]
+
+def test_option_error_is_a_result():
+        result = Iconolatry.run_job('decode', {'id' : '0', 'inputs' : [join(test_decode, '32bpp_size_16x16.ico')], 'force' : 7})
+        assert result == {'id' : '0', 'ok' : False, 'result' : "Input error: option `force_to` not proper defined.",
+                          'time' : result['time']}
@@ -0,0 +1,42 @@
+import random
+from glob import glob
+from os.path import join
+
+import pytest
+
+import Iconolatry
+from conftest import test_decode
+
+np = pytest.importorskip('numpy')
+
+
+def bgra(width, height, alphas):
+        return bytes(value for alpha in alphas for value in (10, 20, 30, alpha))
+
+def and_mask(width, height, bits):
+        rowsize = Iconolatry.calc_rowsize(1, width)
+        data = bytearray(rowsize * height)
+        for indx, bit in enumerate(bits):
+                y, x = divmod(indx, width)
+                data[y * rowsize + x // 8] |= bit << (7 - x % 8)
+        return bytes(data)
+
+@pytest.mark.parametrize('width, height', [(1, 1), (7, 3), (16, 16), (33, 5)])
+def test_array_check_matches_loop(width, height):
+        rng, mask = random.Random(width * height), Iconolatry.Mask()
+        for _ in range(20):
+                alphas = [rng.choice([0, 0, 128, 255]) for _ in range(width * height)]
+                bits = [int(alpha == 0) for alpha in alphas]
+                if rng.random() < 0.5:
+                        flip = rng.randrange(width * height)
+                        bits[flip] ^= 1
+                xordata, anddata = bgra(width, height, alphas), and_mask(width, height, bits)
+                assert mask.check_AND_mask(width, height, xordata, anddata, np) == mask.check_AND_mask(width, height, xordata, anddata)
+
+def test_decode_warnings_match():
+        for path in sorted(glob(join(test_decode, '*.ico'))):
+                with open(path, 'rb') as fd:
+                        data = fd.read()
+                images = Iconolatry.decode_bytes(data)
+                arrays = Iconolatry.decode_bytes(data, output = 'array')
+                assert [entry.warning for entry in images.entries or []] == [entry.warning for entry in arrays.entries or []], path
@@ -0,0 +1,57 @@
+import random
+from itertools import chain
+from os.path import join
+
+import pytest
+from PIL import Image
+
+import Iconolatry
+from conftest import test_encode, root
+
+parrot = join(test_encode, 'Added', 'Parrot_gray_8bit_c0.png')
+
+def gpl(name):
+        return join(root, 'palettes', name)
+
+def nearest(values, level):
+        """ Gets the first palette entry nearest to a gray level (brute force). """
+        entries = [values[i : i + 3] for i in range(0, len(values) - 2, 3)]
+        return min(range(len(entries)), key = lambda indx : sum((value - level) ** 2 for value in entries[indx]))
+
+def test_identity_palette_is_exact():
+        image = Image.open(parrot).convert('L')
+        mapped = Iconolatry.quantizer.map(image, Iconolatry.palette_gpl(gpl('L8.gpl')))
+        assert mapped.convert('L').tobytes() == image.tobytes()
+
+@pytest.mark.parametrize('name', ['L4.gpl', 'P4.gpl', '6bit_RGB.gpl', 'Dichrome_RG.gpl'])
+def test_nearest_entry(name):
+        values = Iconolatry.palette_gpl(gpl(name))
+        image = Image.frombytes('L', (256, 1), bytes(range(256)))
+        mapped = Iconolatry.quantizer.map(image, values)
+        assert list(mapped.tobytes()) == [nearest(values, level) for level in range(256)]
+
+def test_random_palette_is_exact():
+        rng = random.Random(0)
+        values = [rng.randrange(256) for _ in range(3 * 200)]
+        levels = bytes(rng.randrange(256) for _ in range(64 * 64))
+        mapped = Iconolatry.quantizer.map(Image.frombytes('L', (64, 64), levels), values)
+        assert list(mapped.tobytes()) == [nearest(values, level) for level in levels]
+
+def test_large_palette_keeps_used_entries():
+        values = Iconolatry.palette_gpl(gpl('9bit_RGB.gpl'))
+        assert len(values) > 3 * 256
+        image = Image.open(parrot).convert('L')
+        mapped = Iconolatry.quantizer.map(image, values)
+        assert len(mapped.getpalette()) <= 3 * 256
+        expected = [values[3 * nearest(values, level) : 3 * nearest(values, level) + 3] for level in range(256)]
+        assert mapped.convert('RGB').tobytes() == bytes(chain(*[expected[level] for level in image.tobytes()]))
+
+def test_encode_with_large_palette():
+        icobytes = Iconolatry.encode_entries([Image.open(parrot)], custom_palettes = {('L', 8) : gpl('9bit_RGB.gpl')})
+        entry = Iconolatry.decode_bytes(icobytes).entries[0]
+        assert entry.depth == 8
+
+def test_encode_with_identity_palette_is_lossless():
+        icobytes = Iconolatry.encode_entries([Image.open(parrot)], custom_palettes = {('L', 8) : gpl('L8.gpl')})
+        decoded = Iconolatry.decode_bytes(icobytes).entries[0].im_obj.convert('L')
+        assert decoded.tobytes() == Image.open(parrot).convert('L').tobytes()
@@ -0,0 +1,90 @@
+from os.path import join
+
+import pytest
+
+import Iconolatry
+from conftest import test_decode
+from pe_builder import (RT_CURSOR, RT_ICON, RT_GROUP_CURSOR, RT_GROUP_ICON,
+                        build_pe, cursor, group_cursor, group_icon)
+
+
+def entry_of(name):
+        """ Gets (image bytes, width, height, bitcount) of the first entry of a test icon. """
+        with open(join(test_decode, name), 'rb') as fd:
+                data = fd.read()
+        width, height, _, _, _, bits, size, offset = Iconolatry.ICONDIRENTRY.unpack_from(data, Iconolatry.ICONDIR.size)
+        return data[offset : offset + size], width or 256, height or 256, bits
+
+@pytest.fixture
+def images():
+        return [entry_of('32bpp_size_16x16.ico'), entry_of('8bpp_size_32x32.ico')]
+
+def write(tmp_path, resources, **kwargs):
+        path = tmp_path / 'crafted.exe'
+        path.write_bytes(build_pe(resources, **kwargs))
+        return str(path)
+
+def test_icon_group(tmp_path, images):
+        resources = {RT_ICON       : {1 : images[0][0], 2 : images[1][0]},
+                     RT_GROUP_ICON : {101 : group_icon([(1, *images[0]), (2, *images[1])])}}
+        path = write(tmp_path, resources)
+        with Iconolatry.PEResources(path) as binary:
+                members = list(binary.members())
+        assert [member for member, _, _ in members] == [join(path, '101.ico')]
+
+        result = Iconolatry.decode_bytes(members[0][2]())
+        assert result.error is None
+        assert [entry.im_obj.size for entry in result.entries] == [(16, 16), (32, 32)]
+        assert [entry.depth for entry in result.entries] == [32, 8]
+
+def test_cursor_group(tmp_path, images):
+        image, width, height, bits = images[0]
+        resources = {RT_CURSOR       : {1 : cursor((3, 5), image)},
+                     RT_GROUP_CURSOR : {7 : group_cursor([(1, image, width, height, bits)])}}
+        with Iconolatry.PEResources(write(tmp_path, resources)) as binary:
+                (member, _, read), = binary.members()
+        assert member.endswith('7.cur')
+
+        entry = Iconolatry.decode_bytes(read()).entries[0]
+        assert (entry.hotspot_x, entry.hotspot_y) == (3, 5)
+        assert entry.im_obj.size == (16, 16)
+
+@pytest.mark.parametrize('size', [1, 3, 4, 4 + Iconolatry.BITMAPINFOHEADER.size - 1])
+def test_truncated_cursor_is_skipped(tmp_path, images, size):
+        image, width, height, bits = images[0]
+        resources = {RT_CURSOR       : {1 : cursor((3, 5), image)[: size], 2 : cursor((0, 0), image)},
+                     RT_GROUP_CURSOR : {7 : group_cursor([(1, image, width, height, bits)]),
+                                        8 : group_cursor([(2, image, width, height, bits)])}}
+        path = write(tmp_path, resources)
+        with Iconolatry.PEResources(path) as binary:
+                assert [member for member, _, _ in binary.members()] == [join(path, '8.cur')]
+        assert Iconolatry.extract_pe([path], str(tmp_path)) == {path : [str(tmp_path / '8.cur')]}
+
+def test_out_of_section_entry_is_skipped(tmp_path, images):
+        resources = {RT_ICON       : {1 : images[0][0], 2 : images[1][0]},
+                     RT_GROUP_ICON : {101 : group_icon([(1, *images[0]), (2, *images[1])])}}
+        with Iconolatry.PEResources(write(tmp_path, resources, out_of_section = [(RT_ICON, 2)])) as binary:
+                (_, _, read), = binary.members()
+        assert [entry.im_obj.size for entry in Iconolatry.decode_bytes(read()).entries] == [(16, 16)]
+
+def test_truncated_group_is_skipped(tmp_path, images):
+        resources = {RT_ICON       : {1 : images[0][0]},
+                     RT_GROUP_ICON : {101 : group_icon([(1, *images[0])])[: 4]}}
+        with Iconolatry.PEResources(write(tmp_path, resources)) as binary:
+                assert list(binary.members()) == []
+
+def test_decode_binary(tmp_path, images):
+        resources = {RT_ICON       : {1 : images[0][0]},
+                     RT_GROUP_ICON : {101 : group_icon([(1, *images[0])])},
+                     RT_CURSOR     : {2 : b"\0\0"},
+                     RT_GROUP_CURSOR : {7 : group_cursor([(2, *images[0])])}}
+        path = write(tmp_path, resources)
+        conv = Iconolatry.Decode([path])
+        assert [key for key in conv.results] == [join(path, '101.ico')]
+        assert conv.results[join(path, '101.ico')].error is None
+
+def test_not_a_binary(tmp_path):
+        path = tmp_path / 'plain.exe'
+        path.write_bytes(b'MZ' + b"\0" * 100)
+        with pytest.raises(ValueError):
+                Iconolatry.PEResources(str(path))
@@ -0,0 +1,29 @@
+import socket
+
+import pytest
+
+import Iconolatry
+
+
+def test_regular_file_is_kept(tmp_path):
+        path = tmp_path / 'some_file.txt'
+        path.write_text('keep me')
+        with pytest.raises(ValueError, match = "not a socket"):
+                Iconolatry.serve(path_socket = str(path))
+        assert path.read_text() == 'keep me'
+
+def test_stale_socket_is_removed(tmp_path):
+        path = tmp_path / 'stale.sock'
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.bind(str(path))
+        assert path.exists()
+        Iconolatry.remove_socket(str(path))
+        assert not path.exists()
+        # nothing there.
+        Iconolatry.remove_socket(str(path))
+
+def test_cleanup_keeps_other_files(tmp_path):
+        path = tmp_path / 'replaced.sock'
+        path.write_text('not mine')
+        Iconolatry.remove_socket(str(path), strict = False)
+        assert path.read_text() == 'not mine'
@@ -0,0 +1,24 @@
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import join
+
+from conftest import root
+
+spec = spec_from_file_location('bench_startup', join(root, 'benchmarks', 'bench_startup.py'))
+bench_startup = module_from_spec(spec)
+spec.loader.exec_module(bench_startup)
+
+# Same budget as `bench_startup.py -b 15`, held with 20% margin on the best of several runs.
+budget_ms, margin, runs = 15., 0.8, 5
+
+
+def test_heavy_modules_unloaded():
+        _, loaded = bench_startup.import_time('Iconolatry')
+        assert [name for name in bench_startup.heavy if name in loaded] == []
+
+def test_import_time_budget():
+        bench_startup.import_time('Iconolatry')
+        overheads = []
+        for _ in range(runs):
+                took = bench_startup.import_time('Iconolatry')[0]
+                overheads.append(took - bench_startup.import_time('PIL.Image')[0])
+        assert min(overheads) < budget_ms * margin, overheads
@@ -0,0 +1,49 @@
+from os.path import join
+
+import pytest
+
+import Iconolatry
+from conftest import test_decode
+
+
+def read(name):
+        with open(join(test_decode, name), 'rb') as fd:
+                return fd.read()
+
+def truncate(data, size):
+        """ Rewrites first entry of an icon claiming (and keeping) only `size` bytes of image data. """
+        data = bytearray(data)
+        entry = Iconolatry.ICONDIRENTRY.unpack_from(data, Iconolatry.ICONDIR.size)
+        Iconolatry.ICONDIRENTRY.pack_into(data, Iconolatry.ICONDIR.size, *entry[: 6], size, entry[7])
+        return bytes(data[: entry[7] + size])
+
+@pytest.mark.parametrize('name, width, bits', [('32bpp_size_16x16.ico', 16, 32),
+                                               ('24bpp_size_17x17.ico', 17, 24),
+                                               ('8bpp_size_16x16.ico', 16, 8)])
+def test_mask_missing_is_rejected(name, width, bits):
+        data = read(name)
+        assert Iconolatry.decode_bytes(data).error is None
+        ## Entry stops right after XOR data (palette included), without AND mask.
+        palette = (4 * 2 ** bits if bits <= 8 else 0)
+        xor = Iconolatry.BITMAPINFOHEADER.size + palette + Iconolatry.calc_rowsize(bits, width) * width
+        result = Iconolatry.decode_bytes(truncate(data, xor))
+        assert result.error == "Icon/Cursor error: invalid ICO, image_0 truncated."
+
+def test_palette_missing_is_rejected():
+        data = read('8bpp_size_16x16.ico')
+        entry = Iconolatry.ICONDIRENTRY.unpack_from(data, Iconolatry.ICONDIR.size)
+        result = Iconolatry.decode_bytes(truncate(data, entry[6] - 4 * 256))
+        assert result.error == "Icon/Cursor error: invalid ICO, image_0 truncated."
+
+def test_corpus_still_valid():
+        for name in ['1bpp_size_15x15.ico', '4bpp_size_33x33.ico', '32bpp_size_256x256.ico']:
+                assert Iconolatry.decode_bytes(read(name)).error is None
+
+def test_batch_goes_on_after_truncated(tmp_path):
+        data = read('32bpp_size_16x16.ico')
+        bad, good = tmp_path / 'bad.ico', tmp_path / 'good.ico'
+        bad.write_bytes(truncate(data, Iconolatry.BITMAPINFOHEADER.size + 16 * 16 * 4))
+        good.write_bytes(data)
+        conv = Iconolatry.Decode([str(bad), str(good)])
+        assert conv.results[str(bad)].error == "Icon/Cursor error: invalid ICO, image_0 truncated."
+        assert conv.results[str(good)].error is None